@@ -20,6 +20,7 @@ from app.utils.auth import auth_utils
 from app.utils.alerts.logger import logging
 from app.models.metadata import UserCallMetadataInterface
 from app.middleware.entrypoint import plugin_metadata_producer
+from app.scrapers.trading.aggregates.session import close_client_session
 from app.models.singletons.mongodbclients import user_call_metadata_collection
 
 limiter = Limiter(key_func=get_remote_address)
@@ -104,6 +105,11 @@ app.add_middleware(
 )
 
 
+@app.on_event("shutdown")
+async def close_provider_connections():
+    await close_client_session()
+
+
 @app.get("/", include_in_schema=False)
 def home_page():
     response = RedirectResponse(url="/docs")
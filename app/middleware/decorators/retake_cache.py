@@ -1,3 +1,134 @@
+import pandas as pd
+from datetime import datetime
+from typing import List, Tuple
 
+from app.utils.alerts.logger import logging
+from app.utils.storage.cloud_utils import CloudUtility
+from app.utils.storage.ohlcv_cache import Interval, OHLCVCacheKey, merge_intervals, subtract_intervals
+from app.utils.cleaning.ohlcv_clean import normalize_resolution, resolution_seconds, to_ohlcv_frame
+from app.utils.cleaning.datetime_clean import date_to_utc_unixtime, utc_unixtime_to_date
+from app.models.singletons.mongodbclients import historical_trading_metadata_collection
 
-# def compare_historical_metadata():
+DAY_SECONDS = 24 * 60 * 60
+
+
+def _case_variants(value: str) -> List[str]:
+    return list({value, value.upper(), value.lower(), value.capitalize()})
+
+
+def compare_historical_metadata(
+        ticker: str,
+        resolution: str,
+        instrument: str,
+        from_date: str,
+        to_date: str) -> List[dict]:
+    """ Find the historical datasets previously written to cloud storage that overlap a request, from the
+    metadata recorded by historical_trading_metadata_middleware.
+
+    Parameters
+    =============
+    ticker, resolution, instrument  : The series, matched regardless of case and resolution spelling (1D and D)
+    from_date, to_date -> [str]     : %Y-%m-%d, inclusive
+
+    Outputs
+    =============
+    datasets -> List[dict]          : Metadata records, oldest write first
+    """
+    # Dates are stored as %Y-%m-%d strings, which compare in date order
+    records = historical_trading_metadata_collection.find({
+        "ticker": {"$in": _case_variants(ticker)},
+        "instrument": {"$in": _case_variants(instrument)},
+        "from_date": {"$lte": to_date},
+        "to_date": {"$gte": from_date},
+    })
+
+    resolution = normalize_resolution(resolution)
+    datasets = []
+    for record in records:
+        try:
+            if normalize_resolution(record["resolution"]) == resolution:
+                datasets.append(record)
+        except ValueError:
+            continue
+    return sorted(datasets, key=lambda record: record.get("written_at") or datetime.min)
+
+
+def dataset_coverage(record: dict) -> Interval:
+    """ Range a stored dataset is authoritative for. Bars still forming when it was written are excluded, and records
+    from before written_at was recorded drop their last day, which may have been written mid session.
+    """
+    start = date_to_utc_unixtime(record["from_date"], "%Y-%m-%d")
+    end = date_to_utc_unixtime(record["to_date"], "%Y-%m-%d") + DAY_SECONDS
+
+    written_at = record.get("written_at")
+    if written_at is None:
+        end -= DAY_SECONDS
+    else:
+        settled_until = int((written_at - datetime(1970, 1, 1)).total_seconds()) - resolution_seconds(record["resolution"])
+        end = min(end, settled_until)
+    return start, max(start, end)
+
+
+class HistoricalReadThrough:
+    ''' Serves cache gaps from historical datasets we already wrote to cloud storage, before going to the provider.
+
+    Only datasets stored at the cache key's own (base) resolution can fill it, resampled datasets can not be
+    turned back into finer bars.
+
+    Example Usage
+    =============
+    >>> trading_client = TradingDataClient(read_through=HistoricalReadThrough())
+    '''
+
+    def __init__(self):
+        self._cloud_utility = None
+
+    @property
+    def cloud_utility(self) -> CloudUtility:
+        if self._cloud_utility is None:
+            self._cloud_utility = CloudUtility()
+        return self._cloud_utility
+
+    def load(self, key: OHLCVCacheKey, gaps: List[Interval]) -> List[Tuple[pd.DataFrame, Interval]]:
+        """ Read the stored bars covering parts of gaps. Blocking, run it in an executor.
+
+        Outputs
+        =============
+        loaded -> List[Tuple[pd.DataFrame, Interval]]  : Bars and the part of a gap they are authoritative for
+        """
+        start, end = min(gap[0] for gap in gaps), max(gap[1] for gap in gaps)
+        try:
+            datasets = compare_historical_metadata(
+                ticker=key.ticker, resolution=key.resolution, instrument=key.instrument,
+                from_date=utc_unixtime_to_date(start, "%Y-%m-%d"), to_date=utc_unixtime_to_date(end - 1, "%Y-%m-%d"))
+        except Exception as e:
+            logging.error(f"Historical read through: metadata lookup failed for {key.ticker}, {e}")
+            return []
+
+        loaded = []
+        remaining = merge_intervals(gaps)
+        for record in datasets:
+            coverage = dataset_coverage(record)
+            # Parts of the remaining gaps this dataset can fill
+            usable = [(max(gap_start, coverage[0]), min(gap_end, coverage[1]))
+                      for gap_start, gap_end in remaining
+                      if gap_start < coverage[1] and coverage[0] < gap_end]
+            if not usable:
+                continue
+
+            try:
+                frame = to_ohlcv_frame(self.cloud_utility.read_files_from_gcs(record["write_path"]))
+            except Exception as e:
+                logging.error(f"Historical read through: failed to read {record['write_path']}, {e}")
+                continue
+
+            logging.info(
+                f"Historical read through: serving {len(usable)} range(s) of {key.ticker} {key.resolution} from {record['write_path']}.")
+            for usable_start, usable_end in usable:
+                loaded.append((frame[(frame.date >= usable_start) & (frame.date < usable_end)], (usable_start, usable_end)))
+                remaining = [piece for gap in remaining
+                             for piece in subtract_intervals(gap, [(usable_start, usable_end)])]
+
+            if not remaining:
+                break
+        return loaded
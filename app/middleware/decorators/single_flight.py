@@ -0,0 +1,71 @@
+import asyncio
+import functools
+from typing import Awaitable, Callable, Dict, Hashable
+
+from app.utils.alerts.logger import logging
+
+
+class SingleFlight:
+    ''' Coalesces concurrent calls that share a key into one upstream call.
+
+    The first caller starts the call, every caller arriving while it is in flight awaits the same result (or exception).
+    Nothing is cached, the key is released as soon as the call settles. The call runs as its own task, so a caller
+    that disconnects and is cancelled does not cancel it for the others.
+
+    Results are shared between callers as is, treat them as read only.
+
+    Example Usage
+    =============
+    >>> historical_flights = SingleFlight()
+    >>> frame = await historical_flights.do(("AAPL", "D", start, end), fetch_frame, "AAPL", "D", start, end)
+    '''
+
+    def __init__(self, name: str = "single flight"):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable], *args, **kwargs):
+        call = self._calls.get(key)
+
+        if call is None or call.get_loop() is not asyncio.get_running_loop():
+            call = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = call
+
+            def release(settled):
+                if self._calls.get(key) is settled:
+                    del self._calls[key]
+            call.add_done_callback(release)
+        else:
+            logging.info(
+                f"{self.name}: joining in flight call for {key}.")
+
+        return await asyncio.shield(call)
+
+
+def single_flight(key: Callable[..., Hashable], flights: SingleFlight = None):
+    """ Decorator form of SingleFlight, coalescing concurrent calls of an async function whose arguments map to the same key
+
+    Parameters
+    =============
+    key -> [Callable]           : Maps the call's arguments to a hashable key, calls with equal keys are coalesced
+    flights -> [SingleFlight]   : Share the in flight calls with other functions, a new SingleFlight by default
+
+    Example Usage
+    =============
+    >>> @single_flight(key=lambda ticker, resolution: (ticker.upper(), resolution.upper()))
+        async def fetch(ticker, resolution):
+            ...
+    """
+    def decorator(fn):
+        flight_group = flights or SingleFlight(fn.__qualname__)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await flight_group.do(key(*args, **kwargs), fn, *args, **kwargs)
+
+        wrapper.flights = flight_group
+        return wrapper
+    return decorator
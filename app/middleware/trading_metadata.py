@@ -1,4 +1,5 @@
 import uuid
+from datetime import datetime
 from app.models.metadata import HistoricalTradingMetadataInterface
 from app.models.singletons.mongodbclients import historical_trading_metadata_collection
 from app.models.endpoints.trading import DefaultTradingParamsBaseModel
@@ -16,7 +17,8 @@ def historical_trading_metadata_middleware(
             "to_date": job_params['to_date'],
             "resolution": job_params['resolution'],
             "instrument": job_params['instrument'],
-            "write_path": trading_metadata_storage_url(job_params)
+            "write_path": trading_metadata_storage_url(job_params),
+            "written_at": datetime.utcnow(),
         }
         historical_trading_metadata_collection.insert_one(
             historical_trading_metadata)
@@ -13,7 +13,8 @@ class DefaultTwitterParamsBaseModel(BaseModel):
         None, description="List of user id strings or integers in format: [...] or [..., ..., ...]")
     screen_names: List[str] = Field(
         None, description="List of user id strings or integers in format: [...] or [..., ..., ...]")
-    return_data: Optional[bool] = True
+    job_id: Optional[str] = Field(
+        None, description="Job id of an earlier request to resume from its last checkpoint, its own users are extracted")
 
     class Config:
         schema_extra = {
@@ -45,11 +46,17 @@ class DefaultTwitterResponseBaseModel(DefaultBaseModel):
         }
 
 
-class FollowersResponse(DefaultTwitterResponseBaseModel):
+class TwitterJobResponse(DefaultTwitterResponseBaseModel):
+    status: str = Field(..., description="queued, running, done, partial or failed")
+    write_paths: List[str] = Field(
+        [], description="Chunk files uploaded so far, in write order")
+
+
+class FollowersResponse(TwitterJobResponse):
     pass
 
 
-class FollowingsResponse(DefaultTwitterResponseBaseModel):
+class FollowingsResponse(TwitterJobResponse):
     pass
 
 
@@ -1,7 +1,7 @@
 from datetime import datetime
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict, Union
 from typing_extensions import Literal
 
 from app.models.endpoints.base import DefaultBaseModel
@@ -34,7 +34,7 @@ class DefaultTradingParamsBaseModel(BaseModel):
     resolution: str = Field(
         "1M", description="The resolution/interval of our data. ")
     instrument: str = Field(
-        default="Stock", description="The financial instrument. Stock, Cryptocurrency, Futures, Options."
+        default="Stock", description="The financial instrument. Stock, Forex or Crypto."
     )
     return_data: Optional[bool] = True
 
@@ -63,9 +63,96 @@ class HistoricalDataListResponse(BaseModel):
     write_path: str
 
 
+class OHLCVColumns(BaseModel):
+    # One list per column, all of equal length, date in epoch seconds
+    date: List[int]
+    open: List[float]
+    high: List[float]
+    low: List[float]
+    close: List[float]
+    volume: List[float]
+    symbol: List[str]
+
+
+class HistoricalDataColumnarResponse(BaseModel):
+    response: OHLCVColumns
+    write_path: Optional[str]
+
+
 class HistoricalDataParams(DefaultTradingParamsBaseModel):
-    pass
+    response_format: Literal["columnar", "records"] = Field(
+        "columnar", description="Columnar {column: [values]} response, or the row wise records kept for compatibility.")
+    stream_format: Optional[Literal["ndjson", "arrow"]] = Field(
+        None, description="Stream the response as newline delimited json or arrow IPC record batches.")
+
+
+SupportedIndicators = Literal["sma", "ema", "rsi", "macd", "vwap", "bollinger"]
+
+
+class IndicatorSpec(BaseModel):
+    name: SupportedIndicators = Field(..., description="The indicator to compute.")
+    params: Dict[str, Union[float, str]] = Field(
+        {}, description="Indicator parameters e.g. {\"window\": 50}, defaults are used for any left out.")
+
+
+class IndicatorParams(DefaultTradingParamsBaseModel):
+    indicators: List[IndicatorSpec] = Field(
+        ..., min_items=1, max_items=20, description="The indicators to compute over the series.")
+
+
+class IndicatorResponse(BaseModel):
+    response: Dict[str, list]
 
 
 class HistoricalDataWriteResponse(DefaultTradingResponseBaseModel):
     pass
+
+
+class HistoricalDataBatchParams(BaseModel):
+    requests: List[HistoricalDataParams] = Field(
+        ..., min_items=1, max_items=1000, description="One set of historical data parameters per series.")
+
+
+class HistoricalDataBatchStatus(BaseModel):
+    ticker: str
+    from_date: str
+    to_date: str
+    resolution: str
+    instrument: str
+    status: Literal["success", "failed"]
+    rows: int
+    detail: Optional[str]
+
+
+class HistoricalDataBatchResponse(BaseModel):
+    response: Dict[str, list]
+    status: List[HistoricalDataBatchStatus]
+    write_path: Optional[str]
+
+
+class CorrelationParams(BaseModel):
+    tickers: List[str] = Field(
+        ..., min_items=2, max_items=1000, description="The ticker symbols to correlate.")
+    from_date: str = Field(
+        "2021-01-01", description="Date we want to get our ticker data from. In format %Y-%m-%d")
+    to_date: str = Field(
+        datetime.today().strftime("%Y-%m-%d"), description="Date we want to get our ticker data to. In format %Y-%m-%d")
+    resolution: str = Field(
+        "D", description="The resolution/interval of our data. ")
+    instrument: str = Field(
+        default="Stock", description="The financial instrument. Stock, Forex or Crypto.")
+    returns: Literal["log", "simple"] = Field(
+        "log", description="Log or simple bar to bar returns.")
+    window: Optional[int] = Field(
+        None, ge=2, description="Rolling window in bars, rolling matrices are only computed when given.")
+    step: int = Field(
+        1, ge=1, description="Bars between consecutive rolling windows.")
+    include_covariance: bool = Field(
+        True, description="Include the covariance matrices.")
+    include_returns: bool = Field(
+        False, description="Include the aligned (dates x tickers) returns matrix.")
+
+
+class CorrelationResponse(BaseModel):
+    response: Dict[str, Union[list, dict, str]]
+    status: List[HistoricalDataBatchStatus]
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Optional
 
 
 class UserCallMetadataInterface(BaseModel):
@@ -19,3 +20,4 @@ class HistoricalTradingMetadataInterface(BaseModel):
     resolution: str
     instrument: str
     write_path: str
+    written_at: Optional[datetime] = None
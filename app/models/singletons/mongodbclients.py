@@ -24,3 +24,4 @@ user_collection = visser_database['users']
 historical_trading_metadata_collection = visser_cache_database['historical_trading_metadata']
 user_call_metadata_collection = visser_cache_database['user_call_metadata']
 twitter_metadata_collection = visser_cache_database['twitter_metadata']
+backfill_checkpoint_collection = visser_cache_database['backfill_checkpoints']
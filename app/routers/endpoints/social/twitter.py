@@ -1,25 +1,53 @@
-import pandas as pd
 from dotenv import load_dotenv
 
 from app.models.endpoints import social
-from app.utils.cleaning.platform.twitter_clean import clean_twitter_follows
-from app.scrapers.social.twitter import TwitterScraperClient
+from app.utils.auth.auth_utils import token_user
+from app.scrapers.social.twitter_pool import TwitterClientPool
+from app.scrapers.social.twitter_jobs import TwitterScrapeJob, TwitterJobRunner
 
 from fastapi import APIRouter, HTTPException, Header
 
-from app.utils.storage.cloud_utils import CloudUtility
-from app.utils.storage.storage_urls import twitter_followers_storage_url, twitter_followings_storage_url
-
 load_dotenv()
 
 router = APIRouter(
     prefix="/twitter",
 )
 twitter_api_keys = 11  # Number of API Keys to deploy for twitter
+twitter_client_pool = None  # Shared by every request, created on startup
+twitter_job_runner = None  # Runs the extraction jobs in the background, created on startup
 def check_user_length(s): return 0 if s is None else len(s)
 
 
-@router.post("/followings", response_model=social.FollowingsResponse)
+@router.on_event("startup")
+def create_twitter_client_pool():
+    global twitter_client_pool, twitter_job_runner
+    twitter_client_pool = TwitterClientPool(api_keys=twitter_api_keys)
+    twitter_job_runner = TwitterJobRunner()
+
+
+@router.on_event("shutdown")
+def stop_twitter_job_runner():
+    if twitter_job_runner is not None:
+        twitter_job_runner.shutdown()
+
+
+def submit_job(relationship_type: str, params: social.DefaultTwitterParamsBaseModel, token: str) -> dict:
+    if params.job_id is not None:
+        job = twitter_job_runner.resume(params.job_id, relationship_type, pool=twitter_client_pool)
+        if job is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Error 404: no Twitter {relationship_type} job with id {params.job_id}"
+            )
+        return job.summary()
+
+    job = twitter_job_runner.submit(TwitterScrapeJob(
+        relationship_type, user=token_user(token), screen_names=params.screen_names, user_ids=params.user_ids,
+        pool=twitter_client_pool))
+    return job.summary()
+
+
+@router.post("/followings", response_model=social.FollowingsResponse, status_code=202)
 def scrape_and_write_twitter_followings_task(
         params: social.FollowingsParams,
         token: str = Header(...),
@@ -29,7 +57,12 @@ def scrape_and_write_twitter_followings_task(
     -------------
     **user_ids**        : List of user id strings or integers in format: [...] or [..., ..., ...]
     **screen_names**    : List of user id strings or integers in format: [...] or [..., ..., ...]
-    **return_data**     : Optional[bool], Defaults as True
+    **job_id**          : Optional[str], job id of an earlier request to resume from its last checkpoint
+
+    # Outputs
+    -------------
+    Returns straight away with the job id of the extraction, which runs in the background and uploads its chunks
+    to **write_path** as they are extracted. Poll /twitter/jobs/{job_id} for progress.
 
     # Example Python Request
     -------------
@@ -38,32 +71,22 @@ def scrape_and_write_twitter_followings_task(
             data = json.dumps({
                 "user_ids": [],
                 "screen_names": ["donaldtrump", "koolaid"]
-                "return_data": "true"
             }),
             headers = {
                 "token": api_token
             }).json()
     ```
     """
-    if (params.user_ids or params.screen_names) is None:
+    if (params.user_ids or params.screen_names or params.job_id) is None:
         raise HTTPException(
             status_code=404,
             detail="Error 404: screen id or screen name needs to be defined",
         )
 
-    twitter_api_client = TwitterScraperClient(api_keys=twitter_api_keys)
-
-    df = clean_twitter_follows(pd.concat(twitter_api_client.iter_processed_followings(
-        screen_names=params.screen_names, user_ids=params.user_ids)))
-
-    cloud_singleton = CloudUtility()
-    cloud_singleton.write_to_cloud_storage(
-        dataframe=df, storage_url=twitter_followings_storage_url(params))
+    return submit_job("followings", params, token)
 
-    return df
 
-
-@router.post("/followers", response_model=social.FollowersResponse)
+@router.post("/followers", response_model=social.FollowersResponse, status_code=202)
 def scrape_and_write_twitter_followers_task(
         params: social.FollowersParams,
         token: str = Header(...),):
@@ -72,7 +95,12 @@ def scrape_and_write_twitter_followers_task(
     -------------
     **user_ids**        : List of user id strings or integers in format: [...] or [..., ..., ...]
     **screen_names**    : List of user id strings or integers in format: [...] or [..., ..., ...]
-    **return_data**     : Optional[bool], Defaults as True
+    **job_id**          : Optional[str], job id of an earlier request to resume from its last checkpoint
+
+    # Outputs
+    -------------
+    Returns straight away with the job id of the extraction, which runs in the background and uploads its chunks
+    to **write_path** as they are extracted. Poll /twitter/jobs/{job_id} for progress.
 
     # Example Python Request
     -------------
@@ -81,7 +109,6 @@ def scrape_and_write_twitter_followers_task(
             data = json.dumps({
                 "user_ids": [],
                 "screen_names": ["donaldtrump", "koolaid"]
-                "return_data": "true"
             }),
             headers = {
                 "token": api_token
@@ -89,19 +116,31 @@ def scrape_and_write_twitter_followers_task(
     ```
     """
 
-    if (params.user_ids or params.screen_names) is None:
+    if (params.user_ids or params.screen_names or params.job_id) is None:
         raise HTTPException(
             status_code=404,
             detail="Error 404: screen id or screen name needs to be defined"
         )
 
-    twitter_api_client = TwitterScraperClient(api_keys=twitter_api_keys)
+    return submit_job("followers", params, token)
 
-    df = clean_twitter_follows(pd.concat(twitter_api_client.iter_processed_followers(
-        screen_names=params.screen_names, user_ids=params.user_ids)))
 
-    cloud_singleton = CloudUtility()
-    cloud_singleton.write_to_cloud_storage(
-        dataframe=df, storage_url=twitter_followers_storage_url(len(params.user_ids)))
+@router.get("/jobs/{job_id}", response_model=social.TwitterJobResponse)
+def get_twitter_job_status(job_id: str):
+    """
+    # Parameters
+    -------------
+    **job_id**          : Job id returned by /twitter/followers or /twitter/followings
 
-    return df
+    # Outputs
+    -------------
+    **status** of the job (queued, running, done, partial or failed), rows and users extracted so far in **job_description**,
+    **time_elapsed_seconds**, and the chunk files uploaded so far in **write_paths**
+    """
+    job = twitter_job_runner.status(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Error 404: no Twitter job with id {job_id}"
+        )
+    return job
@@ -1,10 +1,28 @@
+import asyncio
+import itertools
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from typing import Optional, Union
 from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Query, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, JSONResponse
 
 from app.utils.storage.cloud_utils import CloudUtility
 from app.scrapers.trading.main import TradingDataClient
-from app.utils.storage.storage_urls import trading_metadata_storage_url
-from app.models.endpoints.trading import HistoricalDataParams
+from app.scrapers.trading.symbols import SymbolUniverse
+from app.scrapers.trading.quotes.hub import QuoteHub
+from app.middleware.decorators.single_flight import SingleFlight
+from app.middleware.decorators.retake_cache import HistoricalReadThrough
+from app.middleware.trading_metadata import historical_trading_metadata_middleware
+from app.utils.alerts.logger import logging
+from app.utils.cleaning.ohlcv_clean import format_ohlcv_frame, frame_to_records, OHLCV_ARROW_SCHEMA
+from app.utils.responses.columnar import to_columnar
+from app.utils.analytics.correlation import pack_upper
+from app.utils.responses.streaming import negotiate_stream_format, iter_ndjson, iter_arrow_ipc, log_stream_errors, iter_server_sent_events, STREAM_MEDIA_TYPES, SSE_MEDIA_TYPE
+from app.utils.storage.storage_urls import trading_metadata_storage_url, trading_batch_storage_url
+from app.models.endpoints.trading import HistoricalDataParams, HistoricalDataColumnarResponse, HistoricalDataListResponse, HistoricalDataBatchParams, HistoricalDataBatchResponse, IndicatorParams, IndicatorResponse, CorrelationParams, CorrelationResponse
 
 
 load_dotenv()
@@ -13,12 +31,32 @@ router = APIRouter(
     prefix="/trading",
 )
 
-trading_client = TradingDataClient()
+trading_client = TradingDataClient(read_through=HistoricalReadThrough())
+symbol_universe = SymbolUniverse()
+historical_flights = SingleFlight("Historical endpoint")
+BATCH_ARROW_SCHEMA = OHLCV_ARROW_SCHEMA.append(pa.field("resolution", pa.string()))\
+    .append(pa.field("instrument", pa.string()))
+quote_hub = QuoteHub(cache=trading_client.cache)
 
 
-@router.post("/historical")
-def get_historical_data(params: HistoricalDataParams,
-                        token: str = Header(...),):
+@router.on_event("startup")
+async def start_symbol_universe_refresh():
+    router.symbol_refresh_task = asyncio.create_task(
+        symbol_universe.run_refresh_loop())
+
+
+@router.on_event("shutdown")
+async def stop_symbol_universe_refresh():
+    task = getattr(router, "symbol_refresh_task", None)
+    if task is not None:
+        task.cancel()
+    await quote_hub.close()
+
+
+@router.post("/historical", response_model=Union[HistoricalDataColumnarResponse, HistoricalDataListResponse])
+async def get_historical_data(params: HistoricalDataParams,
+                              token: str = Header(...),
+                              accept: Optional[str] = Header(None),):
     """
     ### Parameters 
     -------------
@@ -26,11 +64,20 @@ def get_historical_data(params: HistoricalDataParams,
     **from_date**  : Start date we want to get our data from, in format %Y-%m-%d <br/>
     **to_date**    : End date we want to get our data from, in format %Y-%m-%d <br/>
     **resolution** : Supported resolutions are - <br/>
-            &emsp;&emsp; MINUTE: 1MIN, 5MIN, 15MIN, 30MIN, <br/>
+            &emsp;&emsp; MINUTE: 1MIN, 5MIN, 15MIN, 30MIN, or lowercase 1m, 5m, 15m, 30m <br/>
             &emsp;&emsp; HOUR: 1H <br/>
             &emsp;&emsp; DAY: 1D, 5D, 15D, 30D, 60D <br/>
             &emsp;&emsp; WEEK: 1W, 5W, 15W, 30W, 60W <br/>
-            &emsp;&emsp; MONTH: 1M, 5M, 15M, 30M, 60M <br/>
+            &emsp;&emsp; MONTH: 1M, 5M, 15M, 30M, 60M, uppercase M only <br/>
+            &emsp;&emsp; Intraday resolutions are resampled from 1MIN bars, the rest from daily bars. Bars are aligned to
+            UTC, weeks start on monday and months on the 1st. <br/>
+    **instrument** : Stock, Forex or Crypto. Crypto tickers are the base asset of an OKEX USDT spot pair e.g. BTC,
+            or a full CoinAPI symbol id e.g. BINANCE_SPOT_ETH_USDT <br/>
+    **response_format** : "columnar" (default) returns {column: [values]} with date as epoch seconds,
+            "records" returns the previous list of row objects with %Y-%m-%d %H:%M:%S dates <br/>
+    **stream_format** : Optional, "ndjson" or "arrow". Can also be picked with an Accept header of
+            application/x-ndjson or application/vnd.apache.arrow.stream. Streams rows to the client in batches as they are
+            read, so memory stays flat for large ranges. Streamed responses are not written to cloud storage. <br/>
 
     ### Example Python Request
     -------------
@@ -48,30 +95,373 @@ def get_historical_data(params: HistoricalDataParams,
                 "token": api_token
             }).json()
     ```
+
+    ### Example Streaming Request
+    -------------
+    ```python
+    >>> response = requests.post(f"http://localhost:8080/api/trading/historical",
+            json = {"ticker": "AAPL", "from_date": "2020-01-01", "to_date": "2022-01-01", "resolution": "1MIN"},
+            headers = {"token": api_token, "Accept": "application/vnd.apache.arrow.stream"}, stream=True)
+    >>> table = pyarrow.ipc.open_stream(response.raw).read_all()
+    ```
     """
 
-    def get_formatted_historical_data(x):
-        return trading_client.get_historical_data(
-            ticker=params.ticker, from_date=params.from_date, to_date=params.to_date, resolution=params.resolution, data_format=x)
+    stream_format = negotiate_stream_format(accept, params.stream_format)
+    if stream_format is not None:
+        try:
+            batches = await trading_client.iter_historical_batches(
+                ticker=params.ticker, from_date=params.from_date, to_date=params.to_date, resolution=params.resolution, instrument=params.instrument)
+            # Read the first batch before answering, errors up to here can still be an error response
+            first_batch = await run_in_threadpool(next, batches, None)
+        except Exception as e:
+            logging.error(f"Historical stream of {params.ticker} failed, {e}")
+            raise HTTPException(400, detail=str(e))
+
+        batches = itertools.chain([] if first_batch is None else [first_batch], batches)
+        content = iter_ndjson(batches) if stream_format == "ndjson" else iter_arrow_ipc(
+            batches, empty_schema=OHLCV_ARROW_SCHEMA)
+        return StreamingResponse(log_stream_errors(content, f"historical {params.ticker} {params.resolution}"),
+                                 media_type=STREAM_MEDIA_TYPES[stream_format])
+
+    async def get_and_store_historical_data():
+        df = await trading_client.get_historical_data(
+            ticker=params.ticker, from_date=params.from_date, to_date=params.to_date, resolution=params.resolution, instrument=params.instrument, data_format="frame")
+        job_params = {
+            "ticker": params.ticker,
+            "from_date": params.from_date,
+            "to_date": params.to_date,
+            "resolution": params.resolution,
+            "instrument": params.instrument,
+        }
+        # The GCS and Mongo clients are blocking, keep them off the event loop
+        cloud_singleton = await run_in_threadpool(CloudUtility)
+        write_path = await run_in_threadpool(
+            cloud_singleton.write_to_cloud_storage,
+            dataframe=format_ohlcv_frame(df, "csv"), storage_url=trading_metadata_storage_url(job_params))
+        # Recorded so later requests can read the dataset back instead of calling the provider
+        if not await run_in_threadpool(historical_trading_metadata_middleware, job_params):
+            logging.error(f"Failed to record historical metadata for {write_path}")
+        return df, write_path
 
     try:
-        df = get_formatted_historical_data("csv")
-        print(df)
-        cloud_singleton = CloudUtility()
-        write_path = cloud_singleton.write_to_cloud_storage(
-            dataframe=df, storage_url=trading_metadata_storage_url({
-                "ticker": params.ticker,
-                "from_date": params.from_date,
-                "to_date": params.to_date,
-                "resolution": params.resolution,
-                "instrument": params.instrument,
-            }))
-        response = list(df.T.to_dict().values())
-        return {
+        # Identical requests in flight at the same time share one provider fetch and one GCS write
+        df, write_path = await historical_flights.do(
+            trading_client.request_key(
+                ticker=params.ticker, from_date=params.from_date, to_date=params.to_date, resolution=params.resolution, instrument=params.instrument),
+            get_and_store_historical_data)
+
+        if params.response_format == "records":
+            response = frame_to_records(format_ohlcv_frame(df, "csv"))
+        else:
+            response = await run_in_threadpool(to_columnar, df, OHLCV_ARROW_SCHEMA)
+
+        # Already validated per column, returned as is rather than through the response model
+        return JSONResponse({
             "response": response,
             "write_path": write_path
-        }
+        })
 
     except Exception as e:
-        print(e)
-        return HTTPException(400, detail=e)
+        logging.error(f"Historical data of {params.ticker} failed, {e}")
+        raise HTTPException(400, detail=str(e))
+
+
+@router.post("/historical/batch", response_model=HistoricalDataBatchResponse)
+async def get_historical_data_batch(params: HistoricalDataBatchParams,
+                                    token: str = Header(...),):
+    """
+    ### Parameters
+    -------------
+    **requests**   : List of historical data parameters, refer to /historical for the fields of each item <br/>
+
+    Series are fetched concurrently within each provider's rate limits, and returned as one columnar result
+    ({column: [values]}, with date as epoch seconds) alongside a status per requested series.
+    All retrieved series are written to cloud storage as one combined object.
+
+    ### Example Python Request
+    -------------
+    ```python
+    >>> requests.post(f"http://localhost:8080/api/trading/historical/batch",
+            json = {
+                "requests": [
+                    {"ticker": "AAPL", "from_date": "2022-01-01", "to_date": "2022-02-02", "resolution": "D", "instrument": "Stock"},
+                    {"ticker": "MSFT", "from_date": "2022-01-01", "to_date": "2022-02-02", "resolution": "D", "instrument": "Stock"}
+                ]
+            },
+            headers = {
+                "token": api_token
+            }).json()
+    ```
+    """
+    requests = [{
+        "ticker": request.ticker,
+        "from_date": request.from_date,
+        "to_date": request.to_date,
+        "resolution": request.resolution,
+        "instrument": request.instrument,
+    } for request in params.requests]
+
+    df, statuses = await trading_client.get_historical_batch(requests)
+
+    write_path = None
+    if df.shape[0] > 0:
+        try:
+            # The GCS client is blocking, keep it off the event loop
+            cloud_singleton = await run_in_threadpool(CloudUtility)
+            write_path = await run_in_threadpool(
+                cloud_singleton.write_to_cloud_storage,
+                dataframe=format_ohlcv_frame(df, "csv"), storage_url=trading_batch_storage_url(len(requests)))
+        except Exception as e:
+            logging.error(f"Historical batch: failed to write to cloud storage, {e}")
+
+    response = await run_in_threadpool(to_columnar, df, BATCH_ARROW_SCHEMA)
+    return JSONResponse({
+        "response": response,
+        "status": statuses,
+        "write_path": write_path
+    })
+
+
+@router.post("/indicators", response_model=IndicatorResponse)
+async def get_indicators(params: IndicatorParams,
+                         token: str = Header(...),):
+    """
+    ### Parameters
+    -------------
+    **ticker**, **from_date**, **to_date**, **resolution**, **instrument** : Same as /historical <br/>
+    **indicators** : List of {"name": ..., "params": {...}}, parameters left out take their defaults - <br/>
+            &emsp;&emsp; sma: window=20 <br/>
+            &emsp;&emsp; ema: span=20 <br/>
+            &emsp;&emsp; rsi: period=14 <br/>
+            &emsp;&emsp; macd: fast=12, slow=26, signal=9 <br/>
+            &emsp;&emsp; vwap: anchor="D" (restart every UTC day) or "none", case insensitive <br/>
+            &emsp;&emsp; bollinger: window=20, num_std=2 <br/>
+
+    Indicators are computed server side over the cached bars, only the date column (epoch seconds) and the indicator
+    columns are returned, with null where the indicator's window is not yet full.
+
+    ### Example Python Request
+    -------------
+    ```python
+    >>> requests.post(f"http://localhost:8080/api/trading/indicators",
+            json = {
+                "ticker": "AAPL",
+                "from_date": "2021-01-01",
+                "to_date": "2022-01-01",
+                "resolution": "D",
+                "indicators": [{"name": "sma", "params": {"window": 50}}, {"name": "macd"}]
+            },
+            headers = {
+                "token": api_token
+            }).json()
+    >>> {"response": {"date": [...], "sma_50": [...], "macd_12_26_9": [...], "macd_signal_12_26_9": [...], "macd_hist_12_26_9": [...]}}
+    ```
+    """
+    try:
+        columns = await trading_client.get_indicators(
+            ticker=params.ticker, from_date=params.from_date, to_date=params.to_date, resolution=params.resolution,
+            instrument=params.instrument, indicators=[indicator.dict() for indicator in params.indicators])
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+    # NaN is not valid json, windows that are not yet full go out as null
+    return {
+        "response": {name: pd.Series(values).astype(object).where(pd.notna(values), None).tolist()
+                     for name, values in columns.items()}
+    }
+
+
+# Upper bound on rolling matrix entries per response, N x (N + 1) / 2 entries per window
+MAX_ROLLING_CELLS = 5_000_000
+
+
+def json_floats(values: np.ndarray, decimals: int = 8) -> list:
+    """ NaN is not valid json, missing values go out as null """
+    values = np.round(values, decimals)
+    return pd.Series(values.ravel()).astype(object).where(pd.notna(values.ravel()), None).tolist()
+
+
+@router.post("/correlation", response_model=CorrelationResponse)
+async def get_correlation(params: CorrelationParams,
+                          token: str = Header(...),):
+    """
+    ### Parameters
+    -------------
+    **tickers**    : 2 to 1000 ticker symbols <br/>
+    **from_date**, **to_date**, **resolution**, **instrument** : Same as /historical, for every ticker <br/>
+    **returns**    : "log" (default) or "simple" returns <br/>
+    **window**     : Optional rolling window in bars, **step** bars apart (1 by default) <br/>
+    **include_covariance** : Include the covariance matrices, true by default <br/>
+    **include_returns**    : Include the aligned returns matrix, one row per date, false by default <br/>
+
+    Series are read through the cache and aligned on the union of their dates, closes carried forward over dates a
+    ticker did not trade. Pairs are computed over the returns both tickers have.
+
+    Matrices are symmetric, so only their upper triangle (diagonal included) is returned, row by row:
+    entry k is pair numpy.triu_indices(len(tickers))[k]. Tickers that failed to load are left out of tickers,
+    see status.
+
+    ### Example Python Request
+    -------------
+    ```python
+    >>> requests.post(f"http://localhost:8080/api/trading/correlation",
+            json = {
+                "tickers": ["AAPL", "MSFT", "NVDA"],
+                "from_date": "2021-01-01",
+                "to_date": "2022-01-01",
+                "window": 60,
+                "step": 20
+            },
+            headers = {
+                "token": api_token
+            }).json()
+    >>> {"response": {"tickers": ["AAPL", "MSFT", "NVDA"], "layout": "upper", "dates": [...], "correlation": [1.0, 0.71, 0.64, 1.0, 0.69, 1.0], "covariance": [...],
+            "rolling": {"dates": [...], "correlation": [[...], ...], "covariance": [[...], ...]}}, "status": [...]}
+    ```
+    """
+    try:
+        result = await trading_client.get_correlation(
+            tickers=params.tickers, from_date=params.from_date, to_date=params.to_date, resolution=params.resolution,
+            instrument=params.instrument, returns=params.returns, window=params.window, step=params.step)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+    n, periods = len(result["tickers"]), len(result["dates"])
+    if params.window is not None:
+        windows = max(0, -(-(periods - params.window + 1) // params.step))
+        if windows * n * (n + 1) // 2 * (2 if params.include_covariance else 1) > MAX_ROLLING_CELLS:
+            raise HTTPException(
+                400, detail=f"{windows} rolling windows of {n} tickers is too large, use a larger step or fewer tickers.")
+
+    def build() -> dict:
+        response = {
+            "tickers": result["tickers"],
+            "layout": "upper",
+            "dates": result["dates"].tolist(),
+            "correlation": json_floats(pack_upper(result["correlation"])),
+        }
+        if params.include_covariance:
+            response["covariance"] = json_floats(pack_upper(result["covariance"]), decimals=12)
+        if params.include_returns:
+            response["returns"] = [json_floats(row) for row in result["returns"]]
+        if params.window is not None:
+            rolling = {"dates": [], "correlation": [], "covariance": []}
+            for date, correlation, covariance in result["rolling"]:
+                rolling["dates"].append(int(date))
+                rolling["correlation"].append(json_floats(pack_upper(correlation)))
+                if params.include_covariance:
+                    rolling["covariance"].append(json_floats(pack_upper(covariance), decimals=12))
+            if not params.include_covariance:
+                del rolling["covariance"]
+            response["rolling"] = rolling
+        return response
+
+    # Already validated, returned as is rather than through the response model
+    return JSONResponse({
+        "response": await run_in_threadpool(build),
+        "status": result["status"],
+    })
+
+
+@router.get("/symbols/search")
+async def search_symbols(q: str = Query(..., min_length=1, max_length=64),
+                         limit: int = Query(10, ge=1, le=100),
+                         token: str = Header(...),):
+    """
+    ### Parameters
+    -------------
+    **q**          : Search text, matched against symbols and their descriptions <br/>
+    **limit**      : Maximum number of matches to return, 10 by default <br/>
+
+    Symbols and descriptions starting with q come first (match = "prefix"), then the closest fuzzy matches
+    (match = "fuzzy"), which tolerate typos. Covers US stocks and OANDA forex from Finnhub, and OKEX spot pairs from CoinAPI.
+    The symbol lists are held in memory and refreshed every few hours, so searches never call the providers.
+
+    ### Example Python Request
+    -------------
+    ```python
+    >>> requests.get(f"http://localhost:8080/api/trading/symbols/search",
+            params = {"q": "appl", "limit": 5},
+            headers = {
+                "token": api_token
+            }).json()
+    >>> {"response": [{"symbol": "AAPL", "description": "APPLE INC", "type": "Common Stock", "source": "finnhub", "match": "prefix"}, ...]}
+    ```
+    """
+    return {
+        "response": await symbol_universe.search(q, limit=limit)
+    }
+
+
+def parse_symbols(symbols: str):
+    symbols = [symbol.strip().upper() for symbol in symbols.split(",") if symbol.strip()]
+    if not symbols or len(symbols) > 50:
+        raise HTTPException(400, detail="Provide between 1 and 50 comma separated symbols.")
+    return symbols
+
+
+@router.get("/quotes/stream")
+async def stream_quotes(symbols: str = Query(..., description="Comma separated symbols e.g. AAPL,MSFT,BINANCE:BTCUSDT"),
+                        token: str = Header(...),):
+    """
+    ### Parameters
+    -------------
+    **symbols**    : Comma separated Finnhub symbols, at most 50 e.g. AAPL,MSFT,BINANCE:BTCUSDT <br/>
+
+    Server sent events of live trades (event: trade) and of live 1 minute bars as they close (event: bar).
+    All clients share one upstream connection per provider. A client that falls too far behind receives an event: dropped
+    with the number of events it missed. Live bars are also merged into the historical 1MIN cache.
+
+    ### Example Python Request
+    -------------
+    ```python
+    >>> with requests.get(f"http://localhost:8080/api/trading/quotes/stream", params = {"symbols": "AAPL,MSFT"},
+            headers = {"token": api_token}, stream=True) as response:
+            for line in response.iter_lines():
+                print(line)
+    >>> event: trade
+        data: {"type": "trade", "symbol": "AAPL", "price": 170.1, "volume": 10, "timestamp": 1643720401.5}
+    ```
+    """
+    subscription = await quote_hub.subscribe(parse_symbols(symbols))
+
+    async def events():
+        async with subscription:
+            async for chunk in iter_server_sent_events(subscription.next_events):
+                yield chunk
+
+    return StreamingResponse(events(), media_type=SSE_MEDIA_TYPE, headers={"Cache-Control": "no-cache"})
+
+
+@router.websocket("/quotes/ws")
+async def stream_quotes_websocket(websocket: WebSocket,
+                                  symbols: str = Query(...),
+                                  token: str = Header(...),):
+    """ Same events as /quotes/stream over a websocket, one json list of events per message
+    """
+    try:
+        symbols = parse_symbols(symbols)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    async with await quote_hub.subscribe(symbols) as subscription:
+        # Watch for the client closing, otherwise a quiet symbol would keep the subscription alive
+        received = asyncio.ensure_future(websocket.receive())
+        try:
+            while True:
+                events = asyncio.ensure_future(subscription.next_events())
+                done, _ = await asyncio.wait({events, received}, return_when=asyncio.FIRST_COMPLETED)
+
+                if events in done:
+                    await websocket.send_json(events.result())
+                else:
+                    events.cancel()
+
+                if received in done:
+                    if received.result()["type"] == "websocket.disconnect":
+                        break
+                    received = asyncio.ensure_future(websocket.receive())
+        finally:
+            received.cancel()
@@ -1,12 +1,12 @@
 import re
 import os
-import ast
 import requests
 import datetime
 import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from app.utils.alerts.logger import logging
+from app.utils.cleaning.decoders import decode_json
 load_dotenv()
 
 
@@ -30,7 +30,7 @@ class ESR:
         commodities_response = requests.get(
             url=self.url + "/api/esr/commodities", headers=self.PARAMS)
         commodities_for_query = pd.DataFrame.from_dict(
-            ast.literal_eval(commodities_response.text))
+            decode_json(commodities_response.text))
 
         logging.info("Available Commodities for Query: \n\n" +
                      " | ".join(list(commodities_for_query.commodityName.unique())))
@@ -78,7 +78,7 @@ class ESR:
         countries_response = requests.get(
             url=self.url + countries_endpoint, headers=self.PARAMS).text
 
-        return pd.DataFrame.from_dict(ast.literal_eval(countries_response.replace("null", '"null"')))
+        return pd.DataFrame.from_dict(decode_json(countries_response.replace("null", '"null"')))
 
     def countries_export_to_usa(self,
                                 commodity_code: int,
@@ -123,7 +123,7 @@ class ESR:
         export_response = requests.get(
             url=self.url + countriesExport_endpoint, headers=self.PARAMS).text
 
-        exportsdf = pd.DataFrame(ast.literal_eval(export_response))
+        exportsdf = pd.DataFrame(decode_json(export_response))
 
         exportsdf['commodity'] = exportsdf.commodityCode.apply(
             lambda x: self.commodity_id_to_name[x])
@@ -166,7 +166,7 @@ class ESR:
         export_response = requests.get(
             url=self.url + countryExport_endpoint, headers=self.PARAMS).text
 
-        exportsdf = pd.DataFrame(ast.literal_eval(export_response))
+        exportsdf = pd.DataFrame(decode_json(export_response))
         exportsdf['commodity'] = exportsdf.commodityCode.apply(
             lambda x: self.commodity_id_to_name[x])
         exportsdf['country'] = mapCountries[country_code]
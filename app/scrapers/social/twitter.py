@@ -1,18 +1,25 @@
-import os
 import time
 import math
 import queue
+import collections
 import tweepy
 import pandas as pd
+import threading
 import concurrent.futures
-from collections import deque
+from contextlib import closing
 from dotenv import load_dotenv
 from more_itertools import chunked
-from typing import List, Optional, Iterable
+from typing import Callable, Dict, List, Optional, Iterable, Tuple
 
 from app.utils.alerts.logger import logger
+from app.scrapers.social.twitter_pool import TwitterClientPool
+from app.scrapers.social.twitter_edges import EdgeBuffer, PAGE_IDS
+from app.utils.alerts.exceptions.api_exception import KeysExhaustedException
 load_dotenv()
 
+# Errors of accounts that cannot be read, suspended, protected or deleted. Every key gets the same answer
+TERMINAL_ERRORS = (tweepy.Unauthorized, tweepy.Forbidden, tweepy.NotFound)
+
 
 class TwitterScraperClient:
     ''' 
@@ -22,91 +29,38 @@ class TwitterScraperClient:
     Used methods are those starting with: iter_....
     '''
 
-    def __init__(self, api_keys: int):
-        self.client_count = 0  # Logs the number of clients created
-        self.n = api_keys  # Number of twitter keys to use
-
-        self.auth_keys = self._get_auth_keys(self.n)
-        self.clients = self.create_thread_clients(self.auth_keys)
-        self._client_rotator = deque(
-            enumerate(self.clients, start=1))  # Create a queue
-
-    def create_thread_clients(self, auth_keys) -> list:
-        """ Creates the Twitter Client Instances using concurrency (speeds up client creation)
-        ...
+    def __init__(self, api_keys: int = None, pool: TwitterClientPool = None):
         """
-        clients = []
-        # Create the number of clients = number of twitter keys + 1
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.n + 1) as executor:
-            futures = []
-            # For the twitter keys within
-            for consumer_key, consumer_secret, twitter_secret_token, twitter_access_token in zip(auth_keys['CONSUMER_KEY'], auth_keys['CONSUMER_SECRET'], auth_keys['SECRET_ACCESS_TOKEN'], auth_keys['ACCESS_TOKEN']):
-                job = executor.submit(  # Submit the job into each executor
-                    self._create_tweepy_client,  # Create a tweepy client in each pool worker
-                    consumer_key=consumer_key,
-                    consumer_secret=consumer_secret,
-                    twitter_secret_token=twitter_secret_token,
-                    twitter_access_token=twitter_access_token,
-                )
-                self.client_count += 1
-                futures.append(job)  # Append the job into futures
-
-            for client_num, future in enumerate(concurrent.futures.as_completed(futures), start=1):
-                client = future.result()
-                logger.info(f"Client number {client_num} initialized.")
-                # Append the worker into the clients list
-                clients.append(client)
-        return clients
-
-    ''' Client Creation Methods '''
-    @staticmethod
-    def _get_auth_keys(n):
-        """ Get the Authentication Keys for each token in the form of dict, with list values
-        ...
-        """
-        auth_keys = {'CONSUMER_KEY': [], 'CONSUMER_SECRET': [
-        ], 'SECRET_ACCESS_TOKEN': [], 'BEARER_TOKEN': [], 'ACCESS_TOKEN': []}
-        for i in range(1, n+1):
-            auth_keys['CONSUMER_KEY'].append(
-                os.environ.get("TWITTER_CONSUMER_KEY_" + str(i)))
-            auth_keys['CONSUMER_SECRET'].append(
-                os.environ.get("TWITTER_CONSUMER_SECRET_" + str(i)))
-            auth_keys['SECRET_ACCESS_TOKEN'].append(
-                os.environ.get("TWITTER_SECRET_ACCESS_TOKEN_" + str(i)))
-            auth_keys['BEARER_TOKEN'].append(
-                os.environ.get("TWITTER_BEARER_TOKEN_" + str(i)))
-            auth_keys['ACCESS_TOKEN'].append(
-                os.environ.get("TWITTER_ACCESS_TOKEN_" + str(i)))
-        return auth_keys
-
-    @staticmethod
-    def _create_tweepy_client(consumer_key: str, consumer_secret: str, twitter_secret_token: str, twitter_access_token: str):
-        """ Creates a tweepy client instance, provides access to API endpoints 
+        Parameters
+        =============
+        api_keys -> [int]               : Number of twitter keys to use, when no pool is given
+        pool -> [TwitterClientPool]     : Shared client pool, a private pool of api_keys clients is created when None
         """
-        try:
-            auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
-            auth.set_access_token(twitter_access_token, twitter_secret_token)
-            api = tweepy.API(auth, wait_on_rate_limit=False)
-            return api
-        except Exception as e:
-            raise logger.exception(e)
+        self.pool = pool or TwitterClientPool(api_keys=api_keys)
+        self.clients = self.pool.clients
+        self.n = len(self.clients)  # Number of twitter keys to use
+        self.client_count = self.n  # Logs the number of clients created
 
     ''' Exception handling '''
 
-    @staticmethod
-    def _get_rate_limits(client, relationship_type) -> dict:
-        """ Return the rate limit status of a particular endpoint 
-        Sample Return: {'limit': 15, 'remaining': 0, 'reset': 1635351540}
+    def _checkout_client(self, relationship_type: str, wait: bool = True, cursor=None, id_count: int = 0):
+        """ Lease a client with calls left on the endpoint from the pool. When every key is exhausted, sleep until the
+        ledger expects the first key back, or raise KeysExhaustedException when not waiting.
         """
-        if relationship_type == "followers":
-            limits = client.rate_limit_status(
-            )["resources"]["followers"]["/followers/ids"]
-        elif relationship_type == "followings":
-            limits = client.rate_limit_status(
-            )["resources"]["friends"]["/friends/ids"]
-        else:
-            raise NotImplementedError
-        return limits
+        while True:
+            client_index, client = self.pool.checkout(relationship_type)
+            if client is not None:
+                return client_index, client
+
+            _, available_at = self.pool.next_available(relationship_type)
+            if not wait:
+                raise KeysExhaustedException(available_at, cursor=cursor, id_count=id_count)
+
+            # 2 second waiting buffer
+            sleep_for = int(max(0, available_at - time.time()) + 2)
+            logger.info(
+                f"Twitter {relationship_type}: Rate limit reached for all clients, sleeping for {sleep_for}s while limits recover.")
+            time.sleep(sleep_for)
 
     ''' Endpoint Methods '''
 
@@ -152,47 +106,21 @@ class TwitterScraperClient:
         user_ids: List[int] = None,
         chunk_size: Optional[int] = 10_000,
         upper_limit: int = None,
+        on_user_completed: Callable = None,
     ):
         """ Given a list of names(as strings), it returns user data 
         screen_names : list of usernames in string
         user_ids : list of userids in integer
+        on_user_completed : called with each user once all of its followings are extracted, see iter_follows
         """
-        def process_followings(user_followers):
-            try:
-                followings_df = pd.DataFrame(
-                    user_followers, columns=[
-                        "twitter_follower_id", "twitter_followee_id"]
-                )
-                return followings_df
-            except Exception as e:
-                logger.error(
-                    f"Process Followings: Error occured while processing data, {e}")
-                return None
-
-        user_followings_iter = self.iter_follows(
-            relationship_type="followings",
-            user_ids=user_ids,
-            screen_names=screen_names,
-            upper_limit=upper_limit,
-        )
-
-        user_following_pairs = (
-            (user, following)
-            for user, followings_iter in user_followings_iter
-            for following in followings_iter
-        )
-
-        if chunk_size is None:
-            followings_df_batch = process_followings(user_following_pairs)
-            yield followings_df_batch
-        else:
-            for chunked_user_following_pairs in chunked(user_following_pairs, chunk_size):
-                try:
-                    followings_df_batch = process_followings(
-                        chunked_user_following_pairs)
-                except Exception as e:
-                    logger.error(
-                        f"Twitter followings: Error occured while extracting data, user account is private.")
+        for followings_df_batch, _ in self.iter_follow_batches(
+                relationship_type="followings",
+                screen_names=screen_names,
+                user_ids=user_ids,
+                chunk_size=chunk_size,
+                upper_limit=upper_limit,
+                on_user_completed=on_user_completed):
+            if chunk_size is None or len(followings_df_batch):
                 yield followings_df_batch
 
     def iter_processed_followers(
@@ -201,39 +129,17 @@ class TwitterScraperClient:
         user_ids: List[int] = None,
         chunk_size: Optional[int] = None,
         upper_limit: int = None,
+        on_user_completed: Callable = None,
     ):
-
-        def process_followers(user_followers):
-            try:
-                followers_df = pd.DataFrame(
-                    user_followers, columns=[
-                        "twitter_followee_id", "twitter_follower_id"]
-                )
-                return followers_df
-            except Exception as e:
-                logger.error(
-                    f"Process Followers: Error occured while processing data, {e}")
-                return None
-
-        user_followers_iter = self.iter_follows(
-            relationship_type="followers",
-            user_ids=user_ids,
-            screen_names=screen_names,
-            upper_limit=upper_limit,
-        )
         try:
-            user_follower_pairs = (
-                (user, follower)
-                for user, followers_iter in user_followers_iter
-                for follower in followers_iter
-            )
-            if chunk_size is None:
-                followers_df_batch = process_followers(user_follower_pairs)
-                yield followers_df_batch
-            else:
-                for chunked_user_follower_pairs in chunked(user_follower_pairs, chunk_size):
-                    followers_df_batch = process_followers(
-                        chunked_user_follower_pairs)
+            for followers_df_batch, _ in self.iter_follow_batches(
+                    relationship_type="followers",
+                    screen_names=screen_names,
+                    user_ids=user_ids,
+                    chunk_size=chunk_size,
+                    upper_limit=upper_limit,
+                    on_user_completed=on_user_completed):
+                if chunk_size is None or len(followers_df_batch):
                     yield followers_df_batch
         except Exception as e:
             logger.error(
@@ -242,12 +148,84 @@ class TwitterScraperClient:
 
     ''' Processing Pipelines '''
 
+    def iter_follow_batches(
+        self,
+        relationship_type: str,
+        screen_names: List[str] = None,
+        user_ids: List[int] = None,
+        chunk_size: Optional[int] = None,
+        upper_limit: int = None,
+        checkpoint_pages: int = None,
+        resume_from: Dict[object, Tuple[int, int]] = None,
+        on_user_completed: Callable = None,
+        on_user_unavailable: Callable = None,
+    ):
+        ''' Edges of iter_follows in DataFrame batches, each with the position every user's chain had reached once its
+        edges were all in the batch. A consumer that persists a batch and then records its positions can resume from
+        them without losing or repeating edges.
+
+        Pages are collected straight into the int64 arrays of an EdgeBuffer, so a batch costs 12 bytes per edge and
+        its columns are numpy backed, int64 ids, and a categorical of the screen names when users are given by name.
+
+        Parameters
+        =============
+        chunk_size -> [int]             : Edges per batch, a batch ends on a page boundary so it may exceed this by up to
+                                          a page. One batch of everything when None
+        checkpoint_pages -> [int]       : Also end a batch after this many pages, so positions are reported at least this often
+        resume_from -> [dict]           : {user: (cursor, id_count)} to continue from, see iter_follows
+        on_user_unavailable             : Called with users whose account cannot be read and the reason, see iter_follows
+
+        Outputs
+        =============
+        Iterable[(pd.DataFrame, positions, )]   : followers as (twitter_followee_id, twitter_follower_id), followings as
+                                                  (twitter_follower_id, twitter_followee_id). positions {user: (cursor, id_count)}
+                                                  of the users with pages in the batch, cursor 0 once a user is complete
+
+        Example Usage
+        =============
+        >>> for batch, positions in self.iter_follow_batches("followers", screen_names=["koolaid"], chunk_size=100_000, checkpoint_pages=20):
+        ...     write(batch)
+        ...     checkpoint(positions)
+        '''
+        columns = (["twitter_followee_id", "twitter_follower_id"] if relationship_type == "followers"
+                   else ["twitter_follower_id", "twitter_followee_id"])
+
+        # Room for a whole batch, which ends on the page reaching chunk_size
+        edges = EdgeBuffer(user_ids if user_ids is not None else screen_names, columns,
+                           capacity=None if chunk_size is None else chunk_size + PAGE_IDS)
+        positions, pages = {}, 0
+        for user, ids, cursor, id_count in self.iter_follows(
+                relationship_type=relationship_type,
+                user_ids=user_ids,
+                screen_names=screen_names,
+                upper_limit=upper_limit,
+                on_user_completed=on_user_completed,
+                resume_from=resume_from,
+                with_cursors=True,
+                on_user_unavailable=on_user_unavailable):
+            edges.extend(user, ids)
+            positions[user] = (cursor, id_count)
+            pages += 1
+
+            if (chunk_size is not None and len(edges) >= chunk_size) or \
+                    (checkpoint_pages is not None and pages >= checkpoint_pages):
+                yield edges.flush(), positions
+                positions, pages = {}, 0
+
+        if len(edges) or positions or chunk_size is None:
+            yield edges.flush(), positions
+
     def iter_follows(
         self,
         screen_names: List[str] = None,
         user_ids: List[int] = None,
         relationship_type: str = None,
         upper_limit: int = None,
+        max_workers: int = None,
+        on_user_completed: Callable = None,
+        resume_from: Dict[object, Tuple[int, int]] = None,
+        with_cursors: bool = False,
+        on_user_unavailable: Callable = None,
     ):
         ''' Middleman function that connects iter_processed_followers, the actual function we will call for the user followers, with iter_follower_followings
 
@@ -256,6 +234,14 @@ class TwitterScraperClient:
         screen_names -> List[str]       : List containing screen names, can be found beside the @
         user_ids -> List[str]           : List containing user ids
         relationship_type -> [str]      : String describing the relationship type of either "followers" or "followings"
+        upper_limit -> [int]            : Stop each user's extraction after this many ids
+        max_workers -> [int]            : Users extracted at the same time, one per client by default
+        on_user_completed -> [Callable] : Called with each user once all of its pages have been yielded, for progress reporting
+        resume_from -> [dict]           : {user: (cursor, id_count)} to continue users' chains from, e.g. a checkpoint
+        with_cursors -> [bool]          : Also yield the cursor after each page, 0 once the user is complete, and the
+                                          user's id count so far
+        on_user_unavailable -> [Callable] : Called with a user and the reason when its account cannot be read (401, 403
+                                          or 404). The user is then complete, with an empty last page at cursor 0
 
         Rate Limits
         =============
@@ -263,7 +249,9 @@ class TwitterScraperClient:
 
         Outputs
         =============
-        Iterable[(user, relation_ids, )]        : (defining user detail (user_id or screen_name), relation_ids the returned result from the twitter api)
+        Iterable[(user, relation_ids, )]        : (defining user detail (user_id or screen_name), relation_ids one page of the returned result from the twitter api)
+                                                  Users are extracted concurrently, so pages of different users are interleaved
+        Iterable[(user, relation_ids, cursor, id_count, )] : with_cursors
 
         Example Usage
         =============
@@ -276,17 +264,110 @@ class TwitterScraperClient:
         )
 
         TOTAL_USERS = len(users_of_interest)
+        # One cursor chain per client, each worker leases its own key from the pool
+        workers = max(1, min(max_workers or self.n, TOTAL_USERS))
 
         logger.info(
-            f"Twitter {relationship_type}: Start extraction for {TOTAL_USERS} users.")
+            f"Twitter {relationship_type}: Start extraction for {TOTAL_USERS} users, {workers} at a time.")
+
+        resume_from = resume_from or {}
+        users_queue = queue.SimpleQueue()
+        for user in users_of_interest:
+            users_queue.put_nowait(user)
+        # Bounded, so chains wait for the consumer instead of buffering whole accounts in memory
+        pages_queue = queue.Queue(maxsize=4 * workers)
+        stop = threading.Event()
+        # Chains that found the queue full, parked off the executor with the pages they still have to hand over.
+        # The consumer wakes one for every page it takes, so a job with a slow consumer holds no pool threads
+        parked = collections.deque()
+        parked_lock = threading.Lock()
+
+        def deliver(user, cursor, id_count, items: list) -> bool:
+            """ Queue items without blocking, or park the chain with the items left over and return False """
+            with parked_lock:
+                for index, item in enumerate(items):
+                    try:
+                        pages_queue.put_nowait(item)
+                    except queue.Full:
+                        parked.append((user, cursor, id_count, items[index:]))
+                        return False
+            return True
+
+        def start_next_user():
+            if stop.is_set():
+                return
+            try:
+                user = users_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.pool.executor.submit(extract, user, *resume_from.get(user, (None, 0)))
+
+        def resume(user, cursor, id_count, pending=()):
+            if not stop.is_set():
+                self.pool.executor.submit(extract, user, cursor, id_count, pending)
+
+        def extract(user, cursor=None, id_count=0, pending=()):
+            """ Runs one user's cursor chain on the pool's executor, then moves on to the next user """
+            if stop.is_set():
+                return
+            try:
+                if not deliver(user, cursor, id_count, list(pending)):
+                    return
+                if pending and pending[-1][1] is None:
+                    start_next_user()  # Parked on its completion, the user is done
+                    return
+
+                if cursor != 0:
+                    with closing(self.iter_follower_following_pages(
+                            relationship_type, upper_limit=upper_limit, cursor=cursor, id_count=id_count, wait=False,
+                            with_cursors=True, **{user_id_or_screen_name: user})) as pages:
+                        for ids, cursor, id_count in pages:
+                            # Parking closes the chain, handing its key back, and resumes it from the cursor
+                            if not deliver(user, cursor, id_count, [(user, ids, cursor, id_count)]):
+                                return
+                if not deliver(user, 0, id_count, [(user, None, None, None)]):  # User completed
+                    return
+
+            except TERMINAL_ERRORS as e:
+                if on_user_unavailable is not None:
+                    on_user_unavailable(user, str(e))
+                if not deliver(user, 0, id_count, [(user, [], 0, id_count), (user, None, None, None)]):
+                    return
+            except KeysExhaustedException as e:
+                # Park the chain where it stopped until the ledger expects a key back, freeing the thread meanwhile
+                logger.info(
+                    f"Twitter {relationship_type}: Rate limit reached for all clients, parking {user} for {max(0, e.available_at - time.time()):.0f}s.")
+                self.pool.scheduler.call_at(e.available_at + 2, resume, user, e.cursor, e.id_count)
+                return  # The chain keeps its worker slot, starting another user now would only park it too
+            except Exception as e:
+                logger.error(
+                    f"Twitter {relationship_type}: Skipping extraction for {user}, {e}")
+                if not deliver(user, cursor, id_count, [(user, None, None, None)]):
+                    return
 
-        for user_num, user in enumerate(users_of_interest, start=1):
-            relation_ids = self.iter_follower_following(
-                relationship_type, **{user_id_or_screen_name: user}
-            )
-            yield user, relation_ids
-            logger.info(
-                f"Twitter {relationship_type}: {user_num}/{TOTAL_USERS} users extracted.")
+            start_next_user()
+
+        for _ in range(workers):
+            start_next_user()
+
+        try:
+            user_num = 0
+            while user_num < TOTAL_USERS:
+                user, ids, cursor, id_count = pages_queue.get()
+                with parked_lock:
+                    if parked:
+                        resume(*parked.popleft())
+                if ids is None:
+                    user_num += 1
+                    logger.info(
+                        f"Twitter {relationship_type}: {user_num}/{TOTAL_USERS} users extracted.")
+                    if on_user_completed is not None:
+                        on_user_completed(user)
+                    continue
+                yield (user, ids, cursor, id_count) if with_cursors else (user, ids)
+        finally:
+            # Consumer done or gone, running chains hand back their keys and parked ones are dropped
+            stop.set()
 
         logger.info(
             f"Twitter {relationship_type}: Completed extraction for "
@@ -360,6 +441,29 @@ class TwitterScraperClient:
                                 cursor=None,):
         """ Returns an iterator with the userids, for followers of the given user - user_followers that the given user follows - user_followings
         """
+        for ids in self.iter_follower_following_pages(
+                relationship_type, user_id=user_id, screen_name=screen_name, upper_limit=upper_limit, cursor=cursor):
+            yield from ids
+
+    def iter_follower_following_pages(self,
+                                      relationship_type: str,
+                                      user_id=None,
+                                      screen_name=None,
+                                      upper_limit: int = None,
+                                      cursor=None,
+                                      id_count: int = 0,
+                                      wait: bool = True,
+                                      with_cursors: bool = False,):
+        """ Same as iter_follower_following, one list of userids per page of up to 5000
+
+        Parameters
+        =============
+        cursor, id_count    : Resume a chain from this cursor, with id_count ids already extracted
+        wait -> [bool]      : When every key is exhausted, sleep until one resets, or raise KeysExhaustedException
+                              carrying the cursor and id count to resume from
+        with_cursors        : Yield (ids, cursor, id_count), the cursor to resume after this page from, 0 when complete.
+                              Raises TERMINAL_ERRORS instead of skipping the user, so the caller can record why
+        """
         def target_user_function(client, relationship_type):
             """ Returns a function based on root level endpoint call
             """
@@ -380,77 +484,60 @@ class TwitterScraperClient:
             f"Twitter {relationship_type}: Starting extraction for {user_str}.")
 
         cursor = cursor or -1  # Start at first page if cursor is None
-        client_index, client = self._client_rotator[0]  # Get the latest client
+        client_index, client = self._checkout_client(relationship_type, wait=wait, cursor=cursor, id_count=id_count)
         target_f = target_user_function(client, relationship_type)
 
-        self.id_count, ids, page_count = 0, 0, 1  # log the number of ids scraped
+        page_count = 1  # log the number of ids scraped
 
-        while cursor:
-            try:
-                # Handle rate limit errors
-                for attempt_num in range(1, self.n + 2):
-                    try:
-                        logger.info(
-                            f"Twitter {relationship_type}: Client {client_index}. Extracting for {user_str}, page {page_count}. Cursor target id {cursor}")
-                        if not user_id:  # If user_id == None
-                            ids, (prev_cursor, cursor) = target_f(
-                                screen_name=screen_name, cursor=cursor,)
-                            # Log the number of users extracted
-                            self.id_count += len(ids)
-                        else:
-                            ids, (prev_cursor, cursor) = target_f(
-                                user_id=user_id, cursor=cursor,)
-                            # Log the number of users extracted
-                            self.id_count += len(ids)
-
-                        if upper_limit is not None:
-                            if self.id_count >= upper_limit:
-                                cursor = 0
-                                logger.info(
-                                    f"Stopping extraction at {upper_limit}th mark"
-                                )
-                        break
-                    except tweepy.TooManyRequests:  # If rate limit error hit
-                        # Switch to next client if rate limit reached
-                        if attempt_num <= self.n:
-                            prev_client_index = client_index
-                            # Rotate deque to switch first client.
-                            self._client_rotator.rotate(-1)
-                            client_index, client = self._client_rotator[0]
-                            logger.info(
-                                f"Twitter {relationship_type}: Rate limit reached for client {prev_client_index}, switching to client {client_index}. {self.id_count} user ids scraped with this client.")
-                            # Get new client's target function.
-                            target_f = target_user_function(
-                                client, relationship_type)
-                        # If subsequent client also rate limited, wait for
-                        # reset.
-                        elif attempt_num > self.n:
-                            limits = self._get_rate_limits(
-                                client, relationship_type)
-                            reset_time = limits["reset"]
-                            curr_time = int(time.time())
-                            # 2 second waiting buffer
-                            sleep_for = int(
-                                max(reset_time - curr_time + 2, 0))  # Allow rates to recover
-                            logger.info(
-                                f"Twitter {relationship_type}: Rate limit reached for all clients, sleeping for {sleep_for}s while limits recover.")
-                            time.sleep(sleep_for)
-                        else:  # Should not reach here, but handle just in case
-                            logger.error(
-                                f"Twitter {relationship_type}: Unexpected error")
-                            ids = []
-
-                yield from ids  # Create iterable
-
-            # Skip as long as tweep error occurs
-            except Exception:
-                # Unknown Errors
-                logger.error(
-                    f"Twitter {relationship_type}: Skipping extraction for {user_str}, unexpected error occurred.")
-                ids = []
-                break
+        try:
+            while cursor:
+                try:
+                    logger.info(
+                        f"Twitter {relationship_type}: Client {client_index + 1}. Extracting for {user_str}, page {page_count}. Cursor target id {cursor}")
+                    ids, (prev_cursor, next_cursor) = target_f(
+                        **{user_id_or_screen_name: identifier}, cursor=cursor,)
+                    self.pool.record(client_index, relationship_type, client.last_response)
+
+                except tweepy.TooManyRequests as e:  # If rate limit error hit
+                    # Hand the key back marked as spent, and continue from the same cursor on the key the pool picks
+                    self.pool.record(client_index, relationship_type, e.response, exhausted=True)
+                    self.pool.release(client_index, relationship_type)
+                    prev_client_index, client_index = client_index, None
+                    client_index, client = self._checkout_client(
+                        relationship_type, wait=wait, cursor=cursor, id_count=id_count)
+                    logger.info(
+                        f"Twitter {relationship_type}: Rate limit reached for client {prev_client_index + 1}, switching to client {client_index + 1}. {id_count} user ids scraped so far.")
+                    target_f = target_user_function(client, relationship_type)
+                    continue
+
+                except TERMINAL_ERRORS as e:
+                    # Suspended, protected or deleted account, asking again will not help
+                    logger.error(
+                        f"Twitter {relationship_type}: Skipping extraction for {user_str}, the account is unavailable, {e}")
+                    if with_cursors:
+                        raise
+                    break
+
+                # Skip as long as tweep error occurs
+                except Exception:
+                    # Unknown Errors
+                    logger.error(
+                        f"Twitter {relationship_type}: Skipping extraction for {user_str}, unexpected error occurred.")
+                    break
+
+                cursor = next_cursor
+                id_count += len(ids)  # Log the number of users extracted
+                if upper_limit is not None and id_count >= upper_limit:
+                    cursor = 0
+                    logger.info(
+                        f"Stopping extraction at {upper_limit}th mark")
+
+                yield (ids, cursor, id_count) if with_cursors else ids
+                page_count += 1
 
-            page_count += 1
+        finally:
+            if client_index is not None:
+                self.pool.release(client_index, relationship_type)
 
         logger.info(
-            f"Twitter {relationship_type}: Completed extraction for {user_str}. {self.id_count} users extracted")
+            f"Twitter {relationship_type}: Completed extraction for {user_str}. {id_count} users extracted")
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from typing import List, Sequence
+
+PAGE_IDS = 5000  # Most ids the v1.1 /followers/ids and /friends/ids endpoints return per page
+UNBOUNDED_CAPACITY = 16 * PAGE_IDS  # Starting capacity of a buffer without a chunk size, doubled as it fills
+
+
+class EdgeBuffer:
+    ''' Follower / following edges of one batch in preallocated int64 arrays, the relation ids and the index of the
+    user each belongs to, instead of a Python tuple per edge. flush() hands the arrays over as the columns of a
+    DataFrame without copying them, and starts the next batch on new arrays.
+
+    Users given as ids become an int64 column, screen names a categorical column over the requested names.
+
+    Example Usage
+    =============
+    >>> edges = EdgeBuffer(["koolaid"], columns=["twitter_followee_id", "twitter_follower_id"], capacity=100_000)
+    >>> edges.extend("koolaid", [1214213, 1341233, 9921312])
+    >>> edges.flush()
+      twitter_followee_id  twitter_follower_id
+    0             koolaid              1214213
+    ...
+    '''
+
+    def __init__(self, users: Sequence, columns: List[str], capacity: int = None):
+        """
+        Parameters
+        =============
+        users -> [Sequence]     : User ids or screen names the edges belong to
+        columns -> List[str]    : Names of the user column and the relation column
+        capacity -> [int]       : Edges per batch to allocate for, grown when exceeded
+        """
+        self.columns = columns
+        self.capacity = capacity or UNBOUNDED_CAPACITY
+
+        users = pd.unique(pd.Series(list(users), dtype=object))
+        self._indices = {user: index for index, user in enumerate(users)}
+        try:
+            self._user_ids = np.asarray(users, dtype=np.int64)
+        except (TypeError, ValueError, OverflowError):
+            self._user_ids = None
+        self._user_names = pd.Index(users)
+
+        self._allocate(self.capacity)
+
+    def __len__(self):
+        return self.size
+
+    def _allocate(self, capacity: int):
+        self.owners = np.empty(capacity, dtype=np.int32)
+        self.relations = np.empty(capacity, dtype=np.int64)
+        self.size = 0
+
+    def _grow(self, capacity: int):
+        owners, relations, size = self.owners, self.relations, self.size
+        self._allocate(capacity)
+        self.owners[:size], self.relations[:size], self.size = owners[:size], relations[:size], size
+
+    def extend(self, user, ids: Sequence[int]):
+        """ Append one page of relation ids of user
+        """
+        end = self.size + len(ids)
+        if end > len(self.relations):
+            self._grow(max(end, 2 * len(self.relations)))
+        self.owners[self.size:end] = self._indices[user]
+        self.relations[self.size:end] = ids
+        self.size = end
+
+    def flush(self) -> pd.DataFrame:
+        """ The buffered edges as a DataFrame over the buffer's arrays, the buffer is emptied onto new ones
+        """
+        owners, relations = self.owners[:self.size], self.relations[:self.size]
+        if self._user_ids is not None:
+            users = self._user_ids[owners]
+        else:
+            users = pd.Categorical.from_codes(owners, categories=self._user_names)
+
+        frame = pd.DataFrame({self.columns[0]: users, self.columns[1]: relations}, copy=False)
+        self._allocate(self.capacity)
+        return frame
@@ -0,0 +1,321 @@
+import os
+import time
+import uuid
+import threading
+import concurrent.futures
+from datetime import datetime
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.utils.alerts.logger import logger
+from app.scrapers.social.twitter import TwitterScraperClient
+from app.scrapers.social.twitter_pool import TwitterClientPool
+from app.models.singletons.mongodbclients import twitter_metadata_collection
+from app.utils.cleaning.platform.twitter_clean import clean_twitter_follows
+from app.utils.storage.storage_urls import twitter_followers_storage_url, twitter_followings_storage_url
+
+CHUNK_ROWS = 100_000  # Edges per uploaded chunk file
+CHECKPOINT_PAGES = 20  # Pages of ids between checkpoints, at most this many are fetched again after a crash
+MAX_FINISHED_JOBS = 256  # Finished jobs answered from memory, older ones from mongo
+# A running job not checkpointed for this long is taken to have died with its process. Longer than a rate limit
+# window, over which a job whose keys are all exhausted makes no progress
+STALE_SECONDS = 30 * 60
+
+
+class TwitterScrapeJob:
+    ''' One follower or following extraction, run in the background and uploaded to cloud storage chunk by chunk as
+    iter_processed_followers / iter_processed_followings produce them, so no request is held open for the crawl and
+    at most one chunk of edges is in memory.
+
+    Progress is kept on the job and checkpointed to twitter_metadata_collection under the job id after every chunk,
+    which ends at least every CHECKPOINT_PAGES pages: the write paths so far and the cursor and id count each user's
+    chain had reached once its edges were uploaded. A job rebuilt from its checkpoint with from_document carries on
+    from those cursors, so a crawl interrupted by a crash or an unexpected error only fetches the pages since its last
+    checkpoint again. Users whose account cannot be read (401, 403, 404) count as complete, with the reason kept in
+    skipped.
+
+    Example Usage
+    =============
+    >>> job = TwitterScrapeJob("followers", user="james201", screen_names=["koolaid"], pool=twitter_client_pool)
+    >>> job.run()
+    >>> job.summary()["write_paths"]
+    ['gs://some-bucket/twitter/followers/2022-03-12/1/12c6f2a1-.../chunk_00000.csv', ...]
+    >>> TwitterScrapeJob.from_document(twitter_metadata_collection.find_one({"_id": job.job_id})).run()
+    '''
+
+    def __init__(
+            self,
+            relationship_type: str,
+            user: str,
+            screen_names: List[str] = None,
+            user_ids: List[int] = None,
+            pool: TwitterClientPool = None,
+            chunk_size: int = CHUNK_ROWS,
+            checkpoint_pages: int = CHECKPOINT_PAGES,
+            cloud_utility=None,
+            jobs=twitter_metadata_collection,
+            job_id: str = None):
+        """
+        Parameters
+        =============
+        relationship_type -> [str]  : Either "followers" or "followings"
+        user -> [str]               : Username of the token the job was submitted with
+        screen_names, user_ids      : Users to extract, as in TwitterScraperClient.iter_follows
+        chunk_size -> [int]         : Edges per uploaded chunk file
+        checkpoint_pages -> [int]   : Upload and checkpoint at least every this many pages
+        job_id -> [str]             : Id of the job, a new one when None
+        """
+        if relationship_type not in ("followers", "followings"):
+            raise ValueError("Enter a valid relationship type, either 'followers' or 'followings'!")
+
+        self.job_id = job_id or str(uuid.uuid4())
+        self.relationship_type = relationship_type
+        self.user = user
+        self.screen_names = screen_names
+        self.user_ids = user_ids
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.checkpoint_pages = checkpoint_pages
+        self._cloud_utility = cloud_utility
+        self.jobs = jobs
+
+        self.users = user_ids if user_ids is not None else screen_names
+        self.users_requested = len(self.users)
+        storage_url = twitter_followers_storage_url if relationship_type == "followers" else twitter_followings_storage_url
+        self.storage_url = storage_url(self.users_requested) + f"{self.job_id}/"
+
+        self.status = "queued"
+        self.error = None
+        self.rows = 0
+        self.write_paths = []
+        # str(user) -> [cursor, id_count] reached by the uploaded edges, cursor 0 once the user is complete
+        self.positions = {}
+        self.skipped = {}  # str(user) -> why the account could not be read
+        self.date_extracted = datetime.now().strftime("%Y-%m-%d %H:%M")
+        self.elapsed_before = 0  # Seconds run before the job was last resumed
+        self.started_at = None
+        self.finished_at = None
+
+    @classmethod
+    def from_document(cls, document: dict, **kwargs) -> "TwitterScrapeJob":
+        """ Rebuild a job from its checkpoint in twitter_metadata_collection, running it resumes the extraction
+        """
+        job = cls(document["job_description"]["relationship_type"], user=document["user"],
+                  screen_names=document.get("screen_names"), user_ids=document.get("user_ids"),
+                  job_id=document["_id"], **kwargs)
+        checkpoint = document.get("checkpoint", {})
+
+        job.status = document["status"]
+        job.error = document["job_description"].get("error")
+        job.storage_url = document.get("storage_url", job.storage_url)
+        job.write_paths = list(document.get("write_paths", []))
+        job.rows = checkpoint.get("rows", 0)
+        job.positions = dict(checkpoint.get("positions", {}))
+        job.skipped = dict(checkpoint.get("skipped", {}))
+        job.date_extracted = document["date_extracted"]
+        job.elapsed_before = document["time_elapsed_seconds"]
+        return job
+
+    @property
+    def users_extracted(self) -> int:
+        return sum(1 for cursor, _ in self.positions.values() if cursor == 0)
+
+    @property
+    def cloud_utility(self):
+        if self._cloud_utility is None:
+            # Imported on first upload, the GCS clients are only set up in processes that run jobs
+            from app.utils.storage.cloud_utils import CloudUtility
+            self._cloud_utility = CloudUtility()
+        return self._cloud_utility
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "partial", "failed")
+
+    def elapsed_seconds(self) -> int:
+        if self.started_at is None:
+            return self.elapsed_before
+        return self.elapsed_before + int((self.finished_at or time.time()) - self.started_at)
+
+    def summary(self) -> dict:
+        """ The job as a TwitterJobResponse
+        """
+        job_description = {
+            "relationship_type": self.relationship_type,
+            "users_requested": str(self.users_requested),
+            "users_extracted": str(self.users_extracted),
+            "rows": str(self.rows),
+            "chunks_written": str(len(self.write_paths)),
+        }
+        if self.skipped:
+            job_description["users_skipped"] = str(len(self.skipped))
+        if self.error is not None:
+            job_description["error"] = self.error
+
+        return {
+            "user": self.user,
+            "job_id": self.job_id,
+            "end_point": f"twitter/{self.relationship_type}/",
+            "write_type": "cloudstorage",
+            "write_path": "gs://" + os.environ.get("GOOGLE_BUCKET_NAME", "") + "/" + self.storage_url,
+            "date_extracted": self.date_extracted,
+            "job_description": job_description,
+            "time_elapsed_seconds": self.elapsed_seconds(),
+            "status": self.status,
+            "write_paths": list(self.write_paths),
+        }
+
+    def persist(self):
+        """ Checkpoint the job to mongo. A failed write only costs other processes a stale status, and a resumed
+        job the pages since the previous checkpoint
+        """
+        try:
+            self.jobs.update_one(
+                {"_id": self.job_id},
+                {"$set": {**self.summary(),
+                          "screen_names": self.screen_names, "user_ids": self.user_ids,
+                          "storage_url": self.storage_url,
+                          "checkpoint": {"rows": self.rows, "positions": self.positions, "skipped": self.skipped},
+                          "started_at": self.started_at, "elapsed_before": self.elapsed_before,
+                          "updated_at": datetime.utcnow()}},
+                upsert=True)
+        except Exception as e:
+            logger.error(f"Twitter job {self.job_id}: could not record progress, {e}")
+
+    def _skip(self, user, reason: str):
+        # Called before the user's last page is yielded, so the reason is checkpointed with its final position
+        self.skipped[str(user)] = reason
+
+    def _pending_users(self) -> list:
+        return [user for user in self.users if self.positions.get(str(user), [None])[0] != 0]
+
+    def run(self):
+        """ Extract, clean and upload every chunk, blocking until the extraction ends. Users completed at the last
+        checkpoint are skipped, the others continue from their checkpointed cursors.
+        """
+        self.status = "running"
+        self.error = None
+        self.started_at, self.finished_at = time.time(), None
+        self.persist()
+
+        users = self._pending_users()
+        resume_from = {user: tuple(self.positions[str(user)]) for user in users if str(user) in self.positions}
+        if resume_from:
+            logger.info(f"Twitter job {self.job_id}: resuming {len(resume_from)} users from their last checkpoint.")
+
+        try:
+            client = TwitterScraperClient(pool=self.pool)
+            batches = client.iter_follow_batches(
+                self.relationship_type, chunk_size=self.chunk_size, checkpoint_pages=self.checkpoint_pages,
+                resume_from=resume_from, on_user_unavailable=self._skip,
+                **{"user_ids" if self.user_ids is not None else "screen_names": users})
+            for chunk, positions in batches if users else []:
+                if len(chunk):
+                    write_path = self.cloud_utility.write_chunk_to_cloud_storage(
+                        clean_twitter_follows(chunk), self.storage_url + f"chunk_{len(self.write_paths):05d}.csv")
+                    self.write_paths.append(write_path)
+                    self.rows += len(chunk)
+                # Only positions whose edges are uploaded, a crash before this line fetches the batch again
+                self.positions.update({str(user): list(position) for user, position in positions.items()})
+                self.persist()
+
+            # Users skipped over a transient error end before their last page, and are retried on resume
+            incomplete = self._pending_users()
+            self.status = "partial" if incomplete else "done"
+            if incomplete:
+                self.error = f"{len(incomplete)} users did not complete, resubmit the job id to resume them"
+
+        except Exception as e:
+            logger.error(f"Twitter job {self.job_id}: failed after {self.rows} rows, {e}")
+            self.status = "failed"
+            self.error = str(e)
+
+        finally:
+            self.finished_at = time.time()
+            self.persist()
+
+        logger.info(
+            f"Twitter job {self.job_id}: {self.status}, {self.rows} {self.relationship_type} of "
+            f"{self.users_extracted}/{self.users_requested} users in {len(self.write_paths)} chunks.")
+
+
+class TwitterJobRunner:
+    ''' Runs TwitterScrapeJobs on a small thread pool of its own, the extraction itself runs on the client pool's
+    executor, and answers status queries for them. Jobs of other processes, or finished long ago, are read back
+    from twitter_metadata_collection. Jobs that stopped short, or died with their process, are resumed from their
+    checkpoint by resubmitting their job id.
+
+    Example Usage
+    =============
+    >>> twitter_job_runner = TwitterJobRunner(max_jobs=4)
+    >>> job = twitter_job_runner.submit(TwitterScrapeJob("followers", user="james201", screen_names=["koolaid"]))
+    >>> twitter_job_runner.status(job.job_id)["status"]
+    'running'
+    '''
+
+    def __init__(self, max_jobs: int = 4, jobs=twitter_metadata_collection):
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_jobs, thread_name_prefix="twitter-job")
+        self.jobs = jobs
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def submit(self, job: TwitterScrapeJob) -> TwitterScrapeJob:
+        job.persist()
+        with self._lock:
+            self._jobs[job.job_id] = job
+            finished = [job_id for job_id, known in self._jobs.items() if known.finished]
+            for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[job_id]
+        self.executor.submit(job.run)
+        return job
+
+    def resume(self, job_id: str, relationship_type: str = None, **kwargs) -> Optional[TwitterScrapeJob]:
+        """ Run a job again from its last checkpoint, unless it is complete or still running.
+        None for unknown ids, or jobs of another relationship type than the one given.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None and not job.finished:
+            return job if relationship_type in (None, job.relationship_type) else None
+
+        document = self.jobs.find_one({"_id": job_id})
+        if document is None or relationship_type not in (None, document["job_description"]["relationship_type"]):
+            return None
+        job = TwitterScrapeJob.from_document(document, jobs=self.jobs, **kwargs)
+
+        updated_at = document.get("updated_at")
+        alive = job.status in ("queued", "running") and updated_at is not None and \
+            (datetime.utcnow() - updated_at).total_seconds() < STALE_SECONDS
+        if job.status == "done" or alive:
+            return job
+
+        # Claim the job only if nobody touched it since we read it, so of two processes resuming it only one runs it
+        claimed = self.jobs.update_one(
+            {"_id": job_id, "updated_at": updated_at},
+            {"$set": {"status": "queued", "updated_at": datetime.utcnow()}})
+        if claimed.modified_count != 1:
+            logger.info(f"Twitter job {job_id}: already resumed elsewhere.")
+            return TwitterScrapeJob.from_document(self.jobs.find_one({"_id": job_id}), jobs=self.jobs, **kwargs)
+
+        logger.info(f"Twitter job {job_id}: resuming {job.status} job with {job.rows} rows written.")
+        job.status = "queued"
+        return self.submit(job)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.summary()
+
+        document = self.jobs.find_one({"_id": job_id})
+        if document is None:
+            return None
+        if document.get("status") == "running" and document.get("started_at"):
+            # Last recorded at the previous chunk, the job is still going. A resumed job adds the time of its earlier runs
+            document["time_elapsed_seconds"] = document.get("elapsed_before", 0) + \
+                int(time.time() - document["started_at"])
+        return document
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
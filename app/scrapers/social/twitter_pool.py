@@ -0,0 +1,130 @@
+import os
+import time
+import tweepy
+import threading
+import concurrent.futures
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from app.utils.alerts.logger import logger
+from app.utils.ratelimit.ledger import RateLimitLedger, DeferredScheduler
+
+# Calls per 15 minute window of the v1.1 /followers/ids and /friends/ids endpoints, assumed until a response says otherwise
+DEFAULT_WINDOW_CALLS = 15
+WINDOW_SECONDS = 15 * 60
+ENDPOINTS = ["followers", "followings"]
+
+
+class TwitterClientPool:
+    ''' Process wide pool of authenticated tweepy clients, one per API key, created once at startup and shared by
+    every request.
+
+    Each key's remaining calls and reset time are tracked per endpoint across requests in a RateLimitLedger, from the
+    rate limit headers of the responses. checkout() hands out the key with the fewest concurrent users and the most
+    calls left, skipping keys known to be exhausted until their reset, so concurrent jobs spread over the keys instead
+    of each rediscovering which ones are spent.
+
+    Extraction work of every request runs on the pool's executor, one thread per key. Work that finds every key
+    exhausted is parked on the pool's scheduler until the ledger predicts a key frees up, so waiting never holds
+    a thread.
+
+    Example Usage
+    =============
+    >>> twitter_client_pool = TwitterClientPool(api_keys=11)
+    >>> index, client = twitter_client_pool.checkout("followers")
+    >>> ids, cursors = client.get_follower_ids(screen_name="koolaid")
+    >>> twitter_client_pool.record(index, "followers", client.last_response)
+    >>> twitter_client_pool.release(index, "followers")
+    '''
+
+    def __init__(self, api_keys: int):
+        self.n = api_keys
+        self.clients = self.create_thread_clients(self._get_auth_keys(api_keys))
+
+        self._lock = threading.Lock()
+        self.ledger = RateLimitLedger(default_calls=DEFAULT_WINDOW_CALLS, window_seconds=WINDOW_SECONDS)
+        self._leases = Counter()
+
+        # More threads than keys would only wait on the keys
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, len(self.clients)), thread_name_prefix="twitter-extraction")
+        self.scheduler = DeferredScheduler("Twitter")
+
+    ''' Client Creation Methods '''
+
+    @staticmethod
+    def _get_auth_keys(n) -> List[dict]:
+        """ The authentication keys of each of the n key sets, TWITTER_..._1 to TWITTER_..._n
+        """
+        return [{
+            "consumer_key": os.environ.get("TWITTER_CONSUMER_KEY_" + str(i)),
+            "consumer_secret": os.environ.get("TWITTER_CONSUMER_SECRET_" + str(i)),
+            "twitter_secret_token": os.environ.get("TWITTER_SECRET_ACCESS_TOKEN_" + str(i)),
+            "twitter_access_token": os.environ.get("TWITTER_ACCESS_TOKEN_" + str(i)),
+        } for i in range(1, n + 1)]
+
+    @staticmethod
+    def _create_tweepy_client(consumer_key: str, consumer_secret: str, twitter_secret_token: str, twitter_access_token: str):
+        """ Creates a tweepy client instance, provides access to API endpoints
+        """
+        auth = tweepy.OAuthHandler(consumer_key, consumer_secret)
+        auth.set_access_token(twitter_access_token, twitter_secret_token)
+        return tweepy.API(auth, wait_on_rate_limit=False)
+
+    def create_thread_clients(self, auth_keys: List[dict]) -> list:
+        """ Creates the Twitter Client Instances using concurrency (speeds up client creation), in key order
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(auth_keys) + 1) as executor:
+            clients = list(executor.map(lambda keys: self._create_tweepy_client(**keys), auth_keys))
+        logger.info(f"Twitter client pool: {len(clients)} clients initialized.")
+        return clients
+
+    ''' Quota Tracking '''
+
+    def record(self, index: int, endpoint: str, response=None, exhausted: bool = False):
+        """ Update a key's quota from the x-rate-limit-* headers of its last response
+        """
+        self.ledger.record(index, endpoint, getattr(response, "headers", None), exhausted=exhausted)
+
+    def next_available(self, endpoint: str) -> Tuple[int, float]:
+        """ The client that has, or first gets, calls left on endpoint, and the epoch time it does
+        """
+        return self.ledger.next_available(endpoint, range(len(self.clients)))
+
+    def seconds_until_available(self, endpoint: str) -> float:
+        """ Seconds until the first exhausted key resets, 0 when a key has calls left
+        """
+        return max(0, self.next_available(endpoint)[1] - time.time())
+
+    ''' Leasing '''
+
+    def checkout(self, endpoint: str) -> Tuple[Optional[int], Optional[tweepy.API]]:
+        """ Lease the key with the fewest concurrent users, then the most calls left on endpoint.
+        (None, None) when every key is exhausted, see seconds_until_available.
+        """
+        with self._lock:
+            remaining = {index: self.ledger.remaining(index, endpoint) for index in range(len(self.clients))}
+            available = [index for index in remaining if remaining[index] > 0]
+            if not available:
+                return None, None
+
+            index = min(available, key=lambda index: (self._leases[(index, endpoint)], -remaining[index]))
+            self._leases[(index, endpoint)] += 1
+            return index, self.clients[index]
+
+    def release(self, index: int, endpoint: str):
+        with self._lock:
+            self._leases[(index, endpoint)] -= 1
+            if self._leases[(index, endpoint)] <= 0:
+                del self._leases[(index, endpoint)]
+
+    def status(self) -> Dict[str, List[dict]]:
+        """ Known quota and lease count of every key, per endpoint, for monitoring
+        """
+        with self._lock:
+            endpoints = sorted({endpoint for _, endpoint in self._leases} | set(ENDPOINTS))
+            return {endpoint: [{"client": index + 1, "remaining": self.ledger.remaining(index, endpoint),
+                                "reset": self.ledger.reset_at(index, endpoint),
+                                "leases": self._leases[(index, endpoint)]}
+                               for index in range(len(self.clients))]
+                    for endpoint in endpoints}
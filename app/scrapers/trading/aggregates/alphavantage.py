@@ -1,43 +1,59 @@
 import os
-import csv
-import requests
-import numpy as np
+import json
+import asyncio
+import aiohttp
 import pandas as pd
 
-from itertools import cycle
 from dotenv import load_dotenv
 from datetime import datetime
 from typing import Union, List
 
 from app.utils.alerts.logger import logging
+from app.scrapers.trading.aggregates.session import get_client_session
+from app.scrapers.trading.routing import provider_request
+from app.utils.cleaning.datetime_clean import date_to_utc_unixtime
+from app.utils.cleaning.ohlcv_clean import format_ohlcv_frame
+from app.utils.cleaning.decoders import decode_alphavantage_csv
+from app.utils.ratelimit.keypool import KeyPoolScheduler
 from app.models.endpoints.trading import AssetHistoricalData
-from app.utils.alerts.exceptions.api_exception import RateLimitException
+from app.utils.alerts.exceptions.api_exception import RateLimitException, UnsupportedRangeException
 env_loaded = load_dotenv()
 
+SLICE_DAYS = 30
+MAX_SLICES = 24  # Two years of extended intraday history
+DAILY_RESOLUTIONS = ("d", "1d", "daily")
+
 
 class AlphaVantageClient:
 
     def __init__(self, keys_to_use: int = 16):
-        ''' Keys has a rate limit of 500 per day'''
+        ''' Keys have a rate limit of 5 per minute and 500 per day, budgeted across worker processes by the key pool'''
         self.keys_to_use = keys_to_use
-        self.APIKEYS = cycle(
-            [os.environ['ALPHA_VANTAGE_API_KEY_' + str(key)] for key in range(keys_to_use)])
-        self.APIKEY = next(self.APIKEYS)
+        self.key_pool = KeyPoolScheduler(
+            "alphavantage",
+            keys=[os.environ['ALPHA_VANTAGE_API_KEY_' + str(key)]
+                  for key in range(keys_to_use)],
+            limits=[(5, 60), (500, 24 * 60 * 60)])
 
-    def get_historical_data(
+    async def get_historical_data(
             self,
             ticker: str,
             resolution: str = "5min",
             from_date: str = "2022-02-20",
+            to_date: str = None,
             data_format: str = "json",
             retries: int = None) -> Union[pd.DataFrame, List[AssetHistoricalData]]:
-        """ Retrieve historical data from alpha vantage up to the last two years.
+        """ Retrieve historical data from alpha vantage, intraday bars up to the last two years and daily bars over
+        the full history. Every 30 day intraday slice covering the range is fetched concurrently, then merged into one
+        date sorted frame.
 
         Parameters
         =============
         ticker      : Ticker symbol.
-        resolution  : Data interval 1min, 5min, 15min, 30min, 60min
-        date_range  : Date in %Y-%m-%d
+        resolution  : Data interval 1min, 5min, 15min, 30min, 60min, or D for the full daily history
+        from_date   : Date in %Y-%m-%d, or a single slice name e.g. year1month2
+        to_date     : Date in %Y-%m-%d, bars after this date are dropped
+        data_format : json, csv or frame (canonical OHLCV frame)
 
         Rate Limits
         =============
@@ -46,7 +62,7 @@ class AlphaVantageClient:
 
         Example Usage
         =============
-        >>> trading_client.get_historical_data( ticker="AAPL", from_date="2022-01-01", data_format = "csv")
+        >>> await trading_client.get_historical_data( ticker="AAPL", from_date="2022-01-01", data_format = "csv")
         >>> date	            open	        high	        low	            close	        volume  symbol
         0	2021-11-08 20:00:00	121.381548423	121.381548423	121.381548423	121.381548423	130     AAPL
         1	2021-11-08 19:59:00	121.381645887	121.381645887	121.381645887	121.381645887	150     AAPL
@@ -56,66 +72,119 @@ class AlphaVantageClient:
 
         """
 
-        if retries is None:
-            retries = self.keys_to_use
-
-        def get_date_range(from_date: str):
-            days = max(13 * 28, (datetime.today() -
-                       datetime.strptime(from_date, "%Y-%m-%d")).days)
-            months = np.ceil(days / 28).astype(int)
-            return "year" + str(months//12) + "month" + str(months % 12)
-
         resolution = resolution.strip(" ").lower()
 
-        try:
-            if "-" in from_date:
-                date_range = get_date_range(from_date)
-            else:
-                date_range = from_date
+        if resolution in DAILY_RESOLUTIONS:
+            # The whole daily history is a single call
+            frames = [await self._get_csv(
+                ticker=ticker, query=f"function=TIME_SERIES_DAILY&symbol={ticker}&outputsize=full&datatype=csv",
+                label="daily", retries=retries, timezone=None)]
+        else:
+            if "-" in from_date and (datetime.utcnow() - datetime.strptime(from_date, "%Y-%m-%d")).days >= MAX_SLICES * SLICE_DAYS:
+                # Bars we cannot serve are not bars that do not exist, leave the range to another provider
+                raise UnsupportedRangeException(
+                    f"AlphaVantage serves the last {MAX_SLICES * SLICE_DAYS} days of intraday bars, {ticker} from {from_date} is older")
+
+            # A slice name can still be passed directly as from_date, e.g. year1month3
+            slices = self.plan_slices(
+                from_date, to_date) if "-" in from_date else [from_date]
+
+            logging.info(
+                f"AlphaVantage: fetching {len(slices)} slice(s) of {ticker} {resolution} concurrently.")
+            frames = await asyncio.gather(*[
+                self._get_csv(
+                    ticker=ticker, query=f"function=TIME_SERIES_INTRADAY_EXTENDED&symbol={ticker}&interval={resolution}&slice={date_range}",
+                    label=f"slice {date_range}", retries=retries)
+                for date_range in slices])
+
+        df = pd.concat(frames, ignore_index=True)\
+            .drop_duplicates(subset="date", keep="last")\
+            .sort_values("date", kind="stable")\
+            .reset_index(drop=True)
+
+        if "-" in from_date:
+            df = df[df.date >= date_to_utc_unixtime(from_date, "%Y-%m-%d")]
+        if to_date is not None:
+            df = df[df.date < date_to_utc_unixtime(
+                to_date, "%Y-%m-%d") + 24 * 60 * 60]
+
+        return format_ohlcv_frame(df.reset_index(drop=True), data_format)
+
+    @staticmethod
+    def plan_slices(from_date: str, to_date: str = None) -> List[str]:
+        """ Names of the extended intraday slices covering from_date to to_date. Slice yearYmonthM holds the bars of
+        roughly 30 days, counted back from today: year1month1 is the last 30 days, year2month12 the oldest available.
+        The slice edges are approximate, so one neighbouring slice is added on each side.
 
-            base_endpoint = "https://www.alphavantage.co/query?"
-            endpoint = f"function=TIME_SERIES_INTRADAY_EXTENDED&symbol={ticker}&interval={resolution}&slice={date_range}&apikey={self.APIKEY}"
-
-            url = base_endpoint + endpoint
-
-            with requests.Session() as s:
-                download = s.get(url)
-                decoded_content = download.content.decode('utf-8')
-                cr = csv.reader(decoded_content.splitlines(), delimiter=',')
-                my_list = list(cr)
-
-            df = pd.DataFrame(my_list[1:], columns=my_list[0]).rename(
-                columns={"time": "date"})
-            df['symbol'] = ticker
+        Example Usage
+        =============
+        >>> AlphaVantageClient.plan_slices("2022-01-01", "2022-02-01")     # on 2022-02-20
+        ['year1month1', 'year1month2', 'year1month3']
+        """
+        today = datetime.utcnow()
 
-            assert df.shape[0] > 0, "Empty dataframe"
+        def days_ago(date): return (today - datetime.strptime(date, "%Y-%m-%d")).days
 
-            if data_format == "json":
-                return eval(df.to_json(orient="table", index=False))['data']
+        newest = days_ago(to_date) // SLICE_DAYS if to_date is not None else 0
+        oldest = days_ago(from_date) // SLICE_DAYS
+        newest, oldest = max(0, newest - 1), min(MAX_SLICES - 1, oldest + 1)
 
-            elif data_format == "csv":
-                return df
+        return [f"year{index // 12 + 1}month{index % 12 + 1}" for index in range(newest, oldest + 1)]
 
-        except Exception as e:
-            if retries == 0:
-                raise RateLimitException
+    async def _get_csv(
+            self,
+            ticker: str,
+            query: str,
+            label: str,
+            retries: int = None,
+            timezone: str = "America/New_York") -> pd.DataFrame:
+        """ Fetch a single csv query, e.g. one extended intraday slice, as a canonical OHLCV frame, every attempt on its own key.
+        timezone is the zone of the csv's wall clock times, see decode_alphavantage_csv
+        """
+        if retries is None:
+            retries = self.keys_to_use
 
-            else:
+        session = get_client_session()
+        base_endpoint = "https://www.alphavantage.co/query?"
+
+        # Each attempt draws the key with the most budget left from the shared key pool,
+        # so concurrent slices are spread over different keys
+        loop = asyncio.get_running_loop()
+        for attempt in range(retries + 1):
+            apikey = await self.key_pool.acquire()
+            try:
+                with provider_request():
+                    async with session.get(f"{base_endpoint}{query}&apikey={apikey}") as download:
+                        download.raise_for_status()
+                        content = await download.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == retries:
+                    raise
+                logging.error(f"AlphaVantage: request for {label} of {ticker} failed, {e}. Retrying on the next key...")
+                continue
+
+            # Rejected calls come back as a json message instead of csv
+            if content.lstrip().startswith(b"{"):
+                message = json.loads(content)
+                if "Note" not in message and "Information" not in message:
+                    # e.g. "Invalid API call" for an unknown ticker, the same on every key
+                    raise ValueError(
+                        f"AlphaVantage rejected {label} of {ticker}: {message.get('Error Message', message)}")
+
+                await loop.run_in_executor(None, self.key_pool.mark_exhausted, apikey, 60)
+                if attempt == retries:
+                    raise RateLimitException
                 logging.error(
-                    "Rate limit reached on API Key. Rotating to next available key... ...")
-                self.APIKEY = next(self.APIKEYS)
-                self.get_historical_data(
-                    ticker=ticker,
-                    resolution=resolution,
-                    from_date=date_range,
-                    data_format=data_format,
-                    retries=retries - 1)
+                    f"Rate limit reached on API Key for {label}. Rotating to next available key... ...")
+                continue
+
+            return decode_alphavantage_csv(content, symbol=ticker, timezone=timezone)
 
 
 if __name__ == '__main__':
     logging.info("Retrieving Finnhub Test data")
     trading_client = AlphaVantageClient()
-    data = trading_client.get_historical_data(
+    data = asyncio.run(trading_client.get_historical_data(
         ticker="AAPL",
-        from_date="2022-01-01")
+        from_date="2022-01-01"))
     print("Completed: " + str(data))
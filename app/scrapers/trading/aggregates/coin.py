@@ -1,17 +1,41 @@
-import re
-import requests
+import asyncio
 import pandas as pd
+from datetime import datetime
+from typing import Union, List
 
 from app.utils.alerts.logger import logger
 from app.scrapers.base import BaseClient
+from app.scrapers.trading.aggregates.session import get_client_session
+from app.scrapers.trading.routing import provider_request
+from app.utils.ratelimit.limiters import AsyncTokenBucket
+from app.utils.cleaning.datetime_clean import date_to_utc_unixtime, utc_unixtime_to_date
+from app.utils.cleaning.ohlcv_clean import format_ohlcv_frame, empty_ohlcv_frame, parse_resolution
+from app.utils.cleaning.decoders import decode_json_records, decode_coinapi_ohlcv
+from app.models.endpoints.trading import AssetHistoricalData
+
+# Trading resolution units to CoinAPI period_id units
+_COINAPI_PERIOD_UNITS = {"MIN": "MIN", "H": "HRS", "D": "DAY", "M": "MTH"}
 
 
 class CoinapiAssetScraperClient(BaseClient):
 
+    # 3 requests / second, up to 6 / second in bursts, shared by every instance in the process
+    rate_limiter = AsyncTokenBucket(rate=3, period=1, burst=6)
+
     def __init__(self):
-        super().__init__(self)
+        super().__init__()
 
-    def get_cryptoexchange_symbols(
+    async def _get_content(self, url: str) -> bytes:
+        """ GET a CoinAPI endpoint through the shared keep-alive connection pool
+        """
+        session = get_client_session()
+        await self.rate_limiter.acquire()
+        with provider_request():
+            async with session.get(url, headers={'X-CoinAPI-Key': self.COINAPI_API_KEY}) as response:
+                response.raise_for_status()
+                return await response.read()
+
+    async def get_cryptoexchange_symbols(
             self,
             symbol: str = "OKEX") -> pd.DataFrame:
         """ Get all of the cryptocurrencies listed on the exchange
@@ -26,26 +50,113 @@ class CoinapiAssetScraperClient(BaseClient):
         3 requests per second, up to 6 requests per second in bursts
         """
 
-        url = f'https://rest.coinapi.io/v1/symbols?filter_exchange_id={symbol}'
-        headers = {'X-CoinAPI-Key': self.COINAPI_APIKEY}
-        response = requests.get(url, headers=headers)
-
-        symbols = eval(response.text.replace(
-            "true,", "'',").replace("false,", "'',"))
-        symbols = pd.DataFrame(symbols)
+        symbols = decode_json_records(await self._get_content(
+            f'https://rest.coinapi.io/v1/symbols?filter_exchange_id={symbol}'))
 
         spot_symbols = symbols[(symbols.symbol_type == "SPOT")
                                & (symbols.asset_id_quote == "USDT")]
 
         return spot_symbols
 
-    def get_crypto_historicaldata(
+    @staticmethod
+    def coinapi_period(resolution: str) -> str:
+        """ CoinAPI period_id of a trading resolution, e.g. 1H -> 1HRS, D -> 1DAY. CoinAPI periods pass through as is.
+
+        Example Usage
+        =============
+        >>> CoinapiAssetScraperClient.coinapi_period("15MIN"), CoinapiAssetScraperClient.coinapi_period("D")
+        ('15MIN', '1DAY')
+        """
+        resolution = resolution.strip(" ")
+        if resolution.upper().endswith(("SEC", "HRS", "DAY", "MTH", "YRS")):
+            return resolution.upper()
+        multiple, unit = parse_resolution(resolution)
+        if unit not in _COINAPI_PERIOD_UNITS:
+            raise ValueError(f"Resolution {resolution} has no CoinAPI period")
+        return f"{multiple}{_COINAPI_PERIOD_UNITS[unit]}"
+
+    @staticmethod
+    def coinapi_symbol(ticker: str, exchange: str = "OKEX", quote: str = "USDT") -> str:
+        """ CoinAPI symbol id of a spot pair, e.g. BTC -> OKEX_SPOT_BTC_USDT. Full symbol ids pass through as is.
+        """
+        ticker = ticker.strip(" ").upper()
+        return ticker if "_" in ticker else f"{exchange}_SPOT_{ticker}_{quote}"
+
+    async def get_historical_data(
+            self,
+            ticker: str,
+            from_date: str = "2021-09-01",
+            to_date: str = None,
+            resolution: str = "30MIN",
+            data_format: str = "json",
+            page_size: int = 10_000) -> Union[pd.DataFrame, List[AssetHistoricalData]]:
+        """ Retrieve historical crypto bars, paging through the range in windows of at most page_size bars.
+        Windows are planned up front and fetched concurrently, the shared rate limiter keeps them within the quota.
+        CoinAPI bills every 100 returned bars as one request, so a pull costs ceil(bars / 100) whatever the page size.
+
+        Parameters
+        =============
+        ticker -> [str]         : Base asset of an OKEX USDT spot pair e.g. BTC, or a full CoinAPI symbol id
+        from_date -> [str]      : %Y-%m-%d
+        to_date -> [str]        : %Y-%m-%d inclusive, defaults to today
+        resolution -> [str]     : Trading resolution (1MIN, 1H, D, ...) or a CoinAPI period id (1HRS, 1DAY, ...)
+        data_format -> [str]    : json, csv or frame (canonical OHLCV frame)
+        page_size -> [int]      : Bars per request, at most 100000
+
+        Rate Limits
+        =============
+        3 requests per second, up to 6 requests per second in bursts
+
+        Example Usage
+        =============
+        >>> await coin_client.get_historical_data(ticker="BTC", from_date="2022-01-01", to_date="2022-02-01", resolution="1H", data_format="csv")
+        """
+        if to_date is None:
+            to_date = datetime.strftime(datetime.utcnow(), "%Y-%m-%d")
+
+        symbol_id = self.coinapi_symbol(ticker)
+        period = self.coinapi_period(resolution)
+        start = date_to_utc_unixtime(from_date, "%Y-%m-%d")
+        end = min(date_to_utc_unixtime(to_date, "%Y-%m-%d") + 24 * 60 * 60, int(datetime.utcnow().timestamp()))
+
+        # A window of page_size bar lengths never holds more than page_size bars, so no page is truncated
+        window = page_size * self._period_seconds(period)
+        windows = [(window_start, min(window_start + window, end))
+                   for window_start in range(start, end, window)]
+
+        def iso(epoch): return utc_unixtime_to_date(epoch, "%Y-%m-%dT%H:%M:%S")
+
+        logger.info(
+            f"CoinAPI: fetching {len(windows)} page(s) of {symbol_id} {period}.")
+        pages = await asyncio.gather(*[
+            self._get_content(
+                f'https://rest.coinapi.io/v1/ohlcv/{symbol_id}/history?period_id={period}'
+                f'&time_start={iso(window_start)}&time_end={iso(window_end)}&limit={page_size}')
+            for window_start, window_end in windows])
+
+        frames = [decode_coinapi_ohlcv(page, symbol=ticker) for page in pages]
+        historical = pd.concat(frames, ignore_index=True)\
+            .drop_duplicates(subset="date", keep="last")\
+            .sort_values("date", kind="stable")\
+            .reset_index(drop=True) if frames else empty_ohlcv_frame()
+
+        return format_ohlcv_frame(historical, data_format)
+
+    @staticmethod
+    def _period_seconds(period: str) -> int:
+        units = {"SEC": 1, "MIN": 60, "HRS": 60 * 60, "DAY": 24 * 60 * 60, "MTH": 28 * 24 * 60 * 60,
+                 "YRS": 365 * 24 * 60 * 60}
+        unit = period[-3:]
+        # Months and years use their shortest length, so a window never spans more than page_size bars
+        return int(period[:-3] or 1) * units[unit]
+
+    async def get_crypto_historicaldata(
             self,
             symbol: str = "BTC",
             period: str = "30MIN",
             from_date: str = "2021-09-01",
-            limit: int = 100000) -> pd.DataFrame:
-        """
+            to_date: str = None) -> pd.DataFrame:
+        """ OKEX USDT spot bars in the csv layout, see get_historical_data
 
         Parameters
         =============
@@ -58,42 +169,16 @@ class CoinapiAssetScraperClient(BaseClient):
         Month	1MTH, 2MTH, 3MTH, 4MTH, 6MTH
         Year	1YRS, 2YRS, 3YRS, 4YRS, 5YRS
         from_date -> [str]  : %Y-%m-%d - date to scrape from
+        to_date -> [str]    : %Y-%m-%d - date to scrape to, inclusive, defaults to today
 
         Rate Limit 
         =============
         3 requests per second, up to 6 requests per second in bursts
-
-        Additional Remarks
-        =============
-        Amount of items to return (optional, mininum is 1, maximum is 100000, default value is 100
-        If the parameter is used then every 100 output items are counted as one request)
-
         """
-        timestart = from_date + "T00:00:00"
-        ticker = "OKEX_SPOT_" + symbol + "_USDT"
-
-        url = f'https://rest.coinapi.io/v1/ohlcv/{ticker}/history?period_id={period}&time_start={timestart}&limit={limit}'
-        headers = {'X-CoinAPI-Key': self.COINAPI_APIKEY}
-
         try:
-
-            response = requests.get(url, headers=headers)
-
-            data = pd.DataFrame(eval(response.text)).drop(columns=['time_period_start', 'time_open', 'time_close']).rename(columns={
-                "time_period_end": "date",
-                "price_open": "open",
-                "price_close": "close",
-                "price_low": "low",
-                "price_high": "high",
-                "volume_traded": "volume",
-                "trade_count": "trades"})
-
-            data.date = data.date.apply(lambda x: re.findall(
-                "....-..-..T..:..:..", x)[0].replace("T", " "))
-
-        except:
-
+            return await self.get_historical_data(
+                ticker=symbol, from_date=from_date, to_date=to_date, resolution=period, data_format="csv")
+        except Exception as e:
             logger.error(
-                "Errored out while retriving historical crypto prices from coin API")
-
-        return data
+                f"Errored out while retriving historical crypto prices from coin API, {e}")
+            raise
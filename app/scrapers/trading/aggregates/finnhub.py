@@ -1,35 +1,61 @@
-import requests
+import asyncio
 import pandas as pd
-from typing import Union, List
-from datetime import datetime, timedelta
+from typing import Union, List, Tuple
+from datetime import datetime
 
 from app.scrapers.base import BaseClient
+from app.scrapers.trading.aggregates.session import get_client_session
+from app.scrapers.trading.routing import provider_request
+from app.utils.ratelimit.limiters import AsyncTokenBucket
 from app.utils.alerts.logger import logging
-from app.utils.cleaning.datetime_clean import date_to_unixtime
+from app.utils.cleaning.datetime_clean import date_to_utc_unixtime
+from app.utils.cleaning.ohlcv_clean import format_ohlcv_frame, parse_resolution
+from app.utils.cleaning.decoders import decode_json_records, decode_finnhub_candles
 from app.models.endpoints.trading import AssetHistoricalData
 
+DAY_SECONDS = 24 * 60 * 60
+# Bars per candle request, longer ranges are split into windows of this many bars
+MAX_CANDLES = 10_000
+CANDLE_SECONDS = {"1": 60, "5": 5 * 60, "15": 15 * 60, "30": 30 * 60, "60": 60 * 60,
+                  "D": DAY_SECONDS, "W": 7 * DAY_SECONDS, "M": 31 * DAY_SECONDS}
+
 
 class FinnhubClient(BaseClient):
 
     """ Finnhub API data forms the base of this client
     """
 
+    # 60 API calls / minute and at most 30 / second, shared by every instance in the process
+    rate_limiter = AsyncTokenBucket(rate=60, period=60, burst=30)
+
     def __init__(self):
         super().__init__()
 
-    def retrieve_symbols(
+    async def _get_text(self, url: str) -> str:
+        """ GET a finnhub endpoint through the shared keep-alive connection pool. Non 2xx responses, e.g. 429 once the
+        quota is spent or 403 for symbols outside the plan, raise aiohttp.ClientResponseError
+        """
+        session = get_client_session()
+        await self.rate_limiter.acquire()
+        with provider_request():
+            async with session.get(url) as response:
+                response.raise_for_status()
+                return await response.text()
+
+    async def retrieve_symbols(
             self) -> pd.DataFrame:
         """ Get all the available Forex and Stock Symbols available on FinnHub API
         """
 
         try:
-            forexSymbols = requests.get(
-                f"https://finnhub.io/api/v1/forex/symbol?exchange=oanda&token={self.FINNHUB_APIKEY}").text
-            stockSymbols = requests.get(
-                f"https://finnhub.io/api/v1/stock/symbol?exchange=US&token={self.FINNHUB_APIKEY}").text
+            forexSymbols, stockSymbols = await asyncio.gather(
+                self._get_text(
+                    f"https://finnhub.io/api/v1/forex/symbol?exchange=oanda&token={self.FINNHUB_API_KEY}"),
+                self._get_text(
+                    f"https://finnhub.io/api/v1/stock/symbol?exchange=US&token={self.FINNHUB_API_KEY}"))
 
-            supportStocks = pd.DataFrame(eval(stockSymbols))
-            supportForex = pd.DataFrame(eval(forexSymbols))
+            supportStocks = decode_json_records(stockSymbols)
+            supportForex = decode_json_records(forexSymbols)
 
             supportForex['type'] = "Forex"
             supportStocks = supportStocks.rename(columns={
@@ -44,20 +70,43 @@ class FinnhubClient(BaseClient):
                 f"Error occurred while retrieving symbols, please check request methods for finnhub api.")
             return None
 
-    def get_historical_data(
+    @staticmethod
+    def finnhub_resolution(resolution: str) -> str:
+        """ Finnhub candle resolution of a trading resolution, minutes for intraday bars
+
+        Example Usage
+        =============
+        >>> FinnhubClient.finnhub_resolution("1MIN"), FinnhubClient.finnhub_resolution("1H"), FinnhubClient.finnhub_resolution("1D")
+        ('1', '60', 'D')
+        """
+        if resolution.strip(" ").isdigit():
+            return resolution.strip(" ")
+        multiple, unit = parse_resolution(resolution)
+        if unit == "MIN":
+            return str(multiple)
+        if unit == "H":
+            return str(60 * multiple)
+        return unit
+
+    async def get_historical_data(
         self,
         ticker: str,
         from_date: str = "2022-02-20",
+        to_date: str = None,
         resolution: int = "D",
         data_format: str = "json"
     ) -> Union[pd.DataFrame, List[AssetHistoricalData]]:
-        """
+        """ Retrieve candles from from_date to to_date. Ranges longer than MAX_CANDLES bars are split into windows
+        fetched concurrently, then stitched into one date sorted frame.
+
         Parameters
         =============
         ticker -> [str]         : ticker name string
         from_date -> [str]      : %Y-%m-%d
-        resolution -> [str]     : Supported resolution includes 1, 5, 15, 30, 60, D, W, M .Some timeframes might not be available depending on the exchange.
-        data_format -> [str]    : the default data format to return, either json or csv
+        to_date -> [str]        : %Y-%m-%d inclusive, defaults to today so the latest bar is included
+        resolution -> [str]     : Supported resolution includes 1, 5, 15, 30, 60, D, W, M, or the same as 1MIN, 5MIN, 1H, 1D...
+                                  Some timeframes might not be available depending on the exchange.
+        data_format -> [str]    : the default data format to return, either json, csv or frame (canonical OHLCV frame)
 
         Rate Limits
         =============
@@ -65,44 +114,60 @@ class FinnhubClient(BaseClient):
 
         Example Usage
         =============
-        >>> trading_client.get_historical_data( ticker="AAPL", from_date="2022-01-01", data_format = "json")
-        >>> [{"close": 23.2, "high": 24.4, "low": 21.3, "open": 23.4, "date": 1642321312, "volume": 23013}, {...}, ...]
-
-        >>> trading_client.get_historical_data( ticker="AAPL", from_date="2022-01-01", data_format = "csv")
-        >>>      close      high     low     open                 date     volume symbol
-            0   177.57  179.2300  177.26  178.085  2021-12-31 00:00:00   64062261   AAPL
-            1   182.01  182.8800  177.71  177.830  2022-01-03 00:00:00  104701220   AAPL
-            2   179.70  182.9400  179.12  182.630  2022-01-04 00:00:00   99310438   AAPL
-            3   174.92  180.1700  174.64  179.610  2022-01-05 00:00:00   94537602   AAPL
+        >>> await trading_client.get_historical_data( ticker="AAPL", from_date="2022-01-01", data_format = "json")
+        >>> [{"date": 1642321312, "open": 23.4, "high": 24.4, "low": 21.3, "close": 23.2, "volume": 23013.0, "symbol": "AAPL"}, {...}, ...]
+
+        >>> await trading_client.get_historical_data( ticker="AAPL", from_date="2022-01-01", data_format = "csv")
+        >>>                   date     open      high     low   close       volume symbol
+            0  2021-12-31 00:00:00  178.085  179.2300  177.26  177.57   64062261.0   AAPL
+            1  2022-01-03 00:00:00  177.830  182.8800  177.71  182.01  104701220.0   AAPL
+            2  2022-01-04 00:00:00  182.630  182.9400  179.12  179.70   99310438.0   AAPL
+            3  2022-01-05 00:00:00  179.610  180.1700  174.64  174.92   94537602.0   AAPL
         """
 
-        to_date = datetime.strftime(
-            datetime.now() + timedelta(days=1), "%Y-%m-%d")
-        fromdate, todate = date_to_unixtime(
-            from_date, "%Y-%m-%d"), date_to_unixtime(to_date, "%Y-%m-%d")
-        resolution = resolution.strip("1")
-
-        hist = requests.get(
-            f"https://finnhub.io/api/v1/stock/candle?symbol={ticker}&resolution={resolution}&from={fromdate}&to={todate}&token={self.FINNHUB_API_KEY}").text
-
-        historical = pd.DataFrame(eval(hist))\
-            .rename(columns={"c": "close", "h": "high", "l": "low", "o": "open", "s": "status", "t": "date", "v": "volume"})\
-            .drop(columns=['status'])
-        historical['symbol'] = ticker
-
-        if data_format == "json":
-            return eval(historical.to_json(orient="table", index=False))['data']
+        if to_date is None:
+            to_date = datetime.strftime(datetime.utcnow(), "%Y-%m-%d")
+        # to_date is inclusive, so the candle request runs up to the last second of that day
+        fromdate, todate = date_to_utc_unixtime(
+            from_date, "%Y-%m-%d"), date_to_utc_unixtime(to_date, "%Y-%m-%d") + DAY_SECONDS - 1
+        resolution = self.finnhub_resolution(resolution)
+
+        windows = self.plan_windows(fromdate, todate, resolution)
+        if len(windows) > 1:
+            logging.info(
+                f"Finnhub: fetching {len(windows)} window(s) of {ticker} {resolution} concurrently.")
+        # The shared rate limiter spreads the windows over the 60 / minute budget
+        payloads = await asyncio.gather(*[
+            self._get_text(
+                f"https://finnhub.io/api/v1/stock/candle?symbol={ticker}&resolution={resolution}&from={window_from}&to={window_to}&token={self.FINNHUB_API_KEY}")
+            for window_from, window_to in windows])
+
+        historical = pd.concat([decode_finnhub_candles(payload, symbol=ticker) for payload in payloads], ignore_index=True)\
+            .drop_duplicates(subset="date", keep="last")\
+            .sort_values("date", kind="stable")
+        historical = historical[(historical.date >= fromdate) & (historical.date <= todate)].reset_index(drop=True)
+
+        return format_ohlcv_frame(historical, data_format)
+
+    @staticmethod
+    def plan_windows(fromdate: int, todate: int, resolution: str) -> List[Tuple[int, int]]:
+        """ Split an inclusive [fromdate, todate] epoch range into candle requests of at most MAX_CANDLES bars each,
+        with window edges on whole days
 
-        elif data_format == "csv":
-            historical.date = historical.date.apply(
-                lambda ts: datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S'))
-            return historical
+        Example Usage
+        =============
+        >>> FinnhubClient.plan_windows(1640995200, 1643673599, "1")    # January 2022 of 1 minute bars
+        [(1640995200, 1641513599), (1641513600, 1642031999), (1642032000, 1642550399), (1642550400, 1643068799), (1643068800, 1643587199), (1643587200, 1643673599)]
+        """
+        window = max(DAY_SECONDS, MAX_CANDLES * CANDLE_SECONDS.get(resolution, DAY_SECONDS) // DAY_SECONDS * DAY_SECONDS)
+        return [(window_from, min(window_from + window - 1, todate))
+                for window_from in range(fromdate, todate + 1, window)]
 
 
 if __name__ == '__main__':
     logging.info("Retrieving Finnhub Test data")
     trading_client = FinnhubClient()
-    data = trading_client.get_historical_data(
+    data = asyncio.run(trading_client.get_historical_data(
         ticker="AAPL",
-        from_date="2022-01-01")
+        from_date="2022-01-01"))
     print("Completed: " + str(data))
@@ -0,0 +1,56 @@
+import asyncio
+import aiohttp
+from typing import Optional
+
+from app.utils.alerts.logger import logging
+
+# One keep-alive connection pool shared by every trading provider client in the process
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+CONNECTION_LIMIT = 200  # Total sockets held open across all providers
+CONNECTION_LIMIT_PER_HOST = 50  # Sockets held open per provider host
+REQUEST_TIMEOUT_SECONDS = 60
+
+
+def get_client_session() -> aiohttp.ClientSession:
+    """ Return the process wide aiohttp session, creating it on first use.
+
+    The session is bound to the running event loop, so a new one is created if the previous loop has
+    gone away (e.g. between two asyncio.run calls in a script).
+
+    Example Usage
+    =============
+    >>> session = get_client_session()
+    >>> async with session.get(url) as response:
+            payload = await response.text()
+    """
+    global _session, _session_loop
+
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=CONNECTION_LIMIT,
+            limit_per_host=CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_SECONDS),
+        )
+        _session_loop = loop
+        logging.info("Opened shared trading provider connection pool.")
+
+    return _session
+
+
+async def close_client_session():
+    """ Close the shared session, called on application shutdown
+    """
+    global _session, _session_loop
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logging.info("Closed shared trading provider connection pool.")
+    _session, _session_loop = None, None
@@ -0,0 +1,207 @@
+import time
+import asyncio
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List
+
+from app.scrapers.trading.main import TradingDataClient
+from app.utils.alerts.logger import logging
+from app.utils.storage.storage_urls import trading_backfill_storage_url
+from app.models.singletons.mongodbclients import backfill_checkpoint_collection
+
+
+class BackfillProgress:
+    ''' Counters of a backfill run, with throughput and a remaining time estimate
+    '''
+
+    def __init__(self, total: int, skipped: int = 0):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.rows = 0
+        self.started_at = time.monotonic()
+
+    def summary(self) -> dict:
+        elapsed = time.monotonic() - self.started_at
+        finished = self.done + self.failed
+        units_per_second = finished / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.skipped - finished
+        return {
+            "total": self.total,
+            "skipped": self.skipped,
+            "done": self.done,
+            "failed": self.failed,
+            "rows": self.rows,
+            "elapsed_seconds": round(elapsed, 1),
+            "units_per_second": round(units_per_second, 2),
+            "rows_per_second": round(self.rows / elapsed if elapsed > 0 else 0.0, 1),
+            "eta_seconds": round(remaining / units_per_second) if units_per_second else None,
+        }
+
+
+class BackfillJob:
+    ''' Bulk historical backfill of many tickers into partitioned parquet on cloud storage.
+
+    The work is planned as (ticker, window) units of one calendar year each. Units run concurrently through
+    TradingDataClient, so the provider router and each provider's rate limiter keep every provider at its quota.
+    Each finished unit is written to its own parquet partition and checkpointed in mongo, under the job id,
+    so running the same job id again after a crash only does the units that did not complete.
+
+    Example Usage
+    =============
+    >>> job = BackfillJob(job_id="2022Q2", from_date="2000-01-01", to_date="2022-03-31")
+    >>> await job.run()                     # the US stock universe from Finnhub
+    >>> await job.run(tickers=["AAPL", "MSFT"])
+    '''
+
+    def __init__(
+            self,
+            job_id: str,
+            from_date: str,
+            to_date: str,
+            resolution: str = "D",
+            instrument: str = "stock",
+            max_concurrency: int = 32,
+            report_seconds: float = 30,
+            trading_client: TradingDataClient = None,
+            cloud_utility=None,
+            checkpoints=backfill_checkpoint_collection):
+        """
+        Parameters
+        =============
+        job_id -> [str]             : Identifies the job's checkpoints and storage prefix, reuse it to resume
+        from_date, to_date -> [str] : %Y-%m-%d, inclusive
+        resolution, instrument      : Same as TradingDataClient.get_historical_frame
+        max_concurrency -> [int]    : Upper bound on units in flight, the providers' rate limiters set the actual pace
+        report_seconds -> [float]   : Interval of the progress log lines
+        """
+        self.job_id = job_id
+        self.from_date = from_date
+        self.to_date = to_date
+        self.resolution = resolution
+        self.instrument = instrument
+        self.max_concurrency = max_concurrency
+        self.report_seconds = report_seconds
+        self.trading_client = trading_client or TradingDataClient()
+        self._cloud_utility = cloud_utility
+        self.checkpoints = checkpoints
+        self.progress = None
+
+    @property
+    def cloud_utility(self):
+        if self._cloud_utility is None:
+            # Imported on first write, the GCS clients are only set up in processes that run backfills
+            from app.utils.storage.cloud_utils import CloudUtility
+            self._cloud_utility = CloudUtility()
+        return self._cloud_utility
+
+    def plan_units(self, tickers: List[str]) -> List[Dict[str, str]]:
+        """ One unit per ticker and calendar year of the range
+
+        Example Usage
+        =============
+        >>> BackfillJob("2022Q2", "2020-06-01", "2021-03-31").plan_units(["AAPL"])
+        [{"ticker": "AAPL", "from_date": "2020-06-01", "to_date": "2020-12-31", ...},
+         {"ticker": "AAPL", "from_date": "2021-01-01", "to_date": "2021-03-31", ...}]
+        """
+        windows = []
+        for year in range(int(self.from_date[:4]), int(self.to_date[:4]) + 1):
+            windows.append((max(self.from_date, f"{year}-01-01"), min(self.to_date, f"{year}-12-31")))
+
+        return [{"ticker": ticker, "from_date": from_date, "to_date": to_date,
+                 "resolution": self.resolution, "instrument": self.instrument}
+                for ticker in tickers for from_date, to_date in windows]
+
+    def unit_id(self, unit: Dict[str, str]) -> str:
+        return f"{self.job_id}/{unit['instrument']}/{unit['resolution']}/{unit['ticker']}/{unit['from_date']}/{unit['to_date']}"
+
+    def completed_unit_ids(self) -> set:
+        return {checkpoint["_id"] for checkpoint in self.checkpoints.find(
+            {"job_id": self.job_id, "status": "done"}, {"_id": 1})}
+
+    def _checkpoint(self, unit: Dict[str, str], status: str, rows: int = 0, write_path: str = None, detail: str = None):
+        self.checkpoints.update_one(
+            {"_id": self.unit_id(unit)},
+            {"$set": {**unit, "job_id": self.job_id, "status": status, "rows": rows, "write_path": write_path,
+                      "detail": detail, "updated_at": datetime.utcnow()}},
+            upsert=True)
+
+    async def _universe(self) -> List[str]:
+        symbols = await self.trading_client.finnhub_client.retrieve_symbols()
+        if symbols is None:
+            raise ValueError("Finnhub returned no symbols to backfill")
+        return sorted(symbols[symbols.type.fillna("") != "Forex"].symbol.dropna().unique())
+
+    async def _run_unit(self, unit: Dict[str, str]):
+        loop = asyncio.get_running_loop()
+        try:
+            frame = await self.trading_client.fetch_historical_frame(**unit)
+            write_path = None
+            if len(frame):
+                write_path = await loop.run_in_executor(
+                    None, self.cloud_utility.write_parquet_to_cloud_storage,
+                    frame, trading_backfill_storage_url(self.job_id, unit))
+            await loop.run_in_executor(None, self._checkpoint, unit, "done", len(frame), write_path)
+            self.progress.done += 1
+            self.progress.rows += len(frame)
+
+        except Exception as e:
+            logging.error(
+                f"Backfill {self.job_id}: failed {unit['ticker']} {unit['from_date']} to {unit['to_date']}, {e}")
+            self.progress.failed += 1
+            try:
+                await loop.run_in_executor(None, self._checkpoint, unit, "failed", 0, None, str(e))
+            except Exception as e:
+                logging.error(f"Backfill {self.job_id}: failed to checkpoint {self.unit_id(unit)}, {e}")
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_seconds)
+            logging.info(f"Backfill {self.job_id}: {self.progress.summary()}")
+
+    async def run(self, tickers: List[str] = None) -> dict:
+        """ Run every unit not yet checkpointed as done. Failed units are recorded and retried by the next run.
+
+        Outputs
+        =============
+        summary -> [dict]   : BackfillProgress.summary() of the run
+        """
+        if tickers is None:
+            tickers = await self._universe()
+
+        loop = asyncio.get_running_loop()
+        units = self.plan_units(tickers)
+        completed = await loop.run_in_executor(None, self.completed_unit_ids)
+        pending = [unit for unit in units if self.unit_id(unit) not in completed]
+
+        self.progress = BackfillProgress(total=len(units), skipped=len(units) - len(pending))
+        logging.info(
+            f"Backfill {self.job_id}: {len(pending)} of {len(units)} unit(s) to run over {len(tickers)} ticker(s).")
+
+        # A fixed pool of workers over a queue, rather than a task per unit, for universes of thousands of tickers
+        queue = asyncio.Queue()
+        for unit in pending:
+            queue.put_nowait(unit)
+
+        async def worker():
+            while not queue.empty():
+                await self._run_unit(queue.get_nowait())
+
+        reporter = asyncio.create_task(self._report_loop())
+        try:
+            await asyncio.gather(*[worker() for _ in range(min(self.max_concurrency, len(pending)))])
+        finally:
+            reporter.cancel()
+
+        summary = self.progress.summary()
+        logging.info(f"Backfill {self.job_id}: finished, {summary}")
+        return summary
+
+
+if __name__ == '__main__':
+    job = BackfillJob(
+        job_id=datetime.utcnow().strftime("%YQ") + str((datetime.utcnow().month - 1) // 3 + 1),
+        from_date="2000-01-01",
+        to_date=datetime.utcnow().strftime("%Y-%m-%d"))
+    print(asyncio.run(job.run()))
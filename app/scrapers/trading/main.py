@@ -1,15 +1,52 @@
+import time
+import asyncio
+import functools
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
 from app.scrapers.trading.aggregates.alphavantage import AlphaVantageClient
 from app.scrapers.trading.aggregates.finnhub import FinnhubClient
+from app.scrapers.trading.aggregates.coin import CoinapiAssetScraperClient
+from app.scrapers.trading.routing import ProviderRouter
+from app.utils.alerts.logger import logging
+from app.middleware.decorators.single_flight import SingleFlight
+from app.utils.storage.ohlcv_cache import OHLCVCache, OHLCVCacheKey
+from app.utils.cleaning.ohlcv_clean import format_ohlcv_frame, empty_ohlcv_frame, resolution_seconds, normalize_resolution
+from app.utils.analytics.resample import base_resolution, bucket_bounds, resample_ohlcv, resample_batches
+from app.utils.analytics.correlation import align_closes, returns_matrix, pairwise_matrices, rolling_pairwise_matrices
+from app.utils.analytics.indicators import IndicatorMemo, compute_indicator, normalise_indicator_params
+from app.utils.cleaning.datetime_clean import date_to_utc_unixtime, utc_unixtime_to_date
+
+DAY_SECONDS = 24 * 60 * 60
+
+SUPPORTED_RESOLUTIONS = [
+    "1MIN", "5MIN", "15MIN", "30MIN", "1H",
+    "D", "5D", "15D", "30D", "60D",
+    "W", "5W", "15W", "30W", "60W",
+    "M", "5M", "15M", "30M", "60M"]
 
 
 class TradingDataClient:
 
-    def __init__(self, ):
+    def __init__(self, read_through=None):
+        """
+        Parameters
+        =============
+        read_through -> [HistoricalReadThrough] : Optional source consulted for cache gaps before the providers,
+                                                  e.g. datasets previously written to cloud storage
+        """
+        self.read_through = read_through
         self.finnhub_client = FinnhubClient()
         self.alphavantage_client = AlphaVantageClient()
+        self.coin_client = CoinapiAssetScraperClient()
+        self.cache = OHLCVCache()
+        self.historical_flights = SingleFlight("Historical data")
+        self.provider_router = ProviderRouter()
+        self.indicator_memo = IndicatorMemo()
 
-    def get_historical_data(
+    async def get_historical_data(
         self,
         ticker: str,
         from_date: str,
@@ -17,61 +54,387 @@ class TradingDataClient:
         resolution: str = "1D",
         instrument: str = "stock",
         data_format: str = "json",
+    ) -> Union[pd.DataFrame, List[dict]]:
+        """ Get historical ticker data, formatted as json records or a csv style dataframe.
+
+        Parameters
+        =============
+        Same as get_historical_frame, plus
+        data_format -> [str]: the default data format to return, either json or csv
+        """
+        historical_data = await self.get_historical_frame(
+            ticker=ticker, from_date=from_date, to_date=to_date, resolution=resolution, instrument=instrument)
+
+        return format_ohlcv_frame(historical_data, data_format)
+
+    async def get_historical_frame(
+        self,
+        ticker: str,
+        from_date: str,
+        to_date: str = "2022-02-20",
+        resolution: str = "1D",
+        instrument: str = "stock",
     ) -> pd.DataFrame:
-        """ Get historical ticker data.
+        """ Get historical ticker data as a canonical OHLCV frame. Bars already held in the local OHLCV cache are served
+        from disk, only the missing head / tail ranges are fetched from the provider.
+
+        Only two base series are ever fetched, 1MIN bars for intraday resolutions and daily bars for the rest.
+        Every other resolution is resampled from its base series, widened to whole bars, so the first and last
+        bar may start before from_date / end after to_date.
 
         Parameters
         =============
-        ticker -> [str]     : The ticker symbol 
-        from_date -> [str]  : %Y-%m-%d 
+        ticker -> [str]     : The ticker symbol
+        from_date -> [str]  : %Y-%m-%d
         to_date -> [str]    : %Y-%m-%d
-        resolution -> [str] : Supported resolutions are - 
-                              MINUTE: 1MIN, 5MIN, 15MIN, 30MIN, 
+        resolution -> [str] : Supported resolutions are -
+                              MINUTE: 1MIN, 5MIN, 15MIN, 30MIN,
                               HOUR: 1H
                               DAY: 1D, 5D, 15D, 30D, 60D
                               WEEK: 1W, 5W, 15W, 30W, 60W
                               MONTH: 1M, 5M, 15M, 30M, 60M
-        data_format -> [str]: the default data format to return, either json or csv
         """
-        alphavantage_supported_intervals = [
-            "1MIN", "5MIN", "15MIN", "30MIN", "1H"]
-        finnhub_supported_intervals = [
-            "D", "5D", "15D", "30D", "60D", "W", "5W", "15W", "30W", "60W", "M", "5M", "15M", "30M", "60M"]
+        key, provider_fetch, resolution = self._resolve_series(
+            ticker=ticker, resolution=resolution, instrument=instrument)
+        start, end = bucket_bounds(
+            *self._date_bounds(from_date, to_date), resolution)
+
+        # Identical requests arriving together (e.g. 1D and D for the same days) share one fetch and read
+        return await self.historical_flights.do(
+            (key, start, end, resolution), self._load_frame, key, start, end, resolution, provider_fetch)
+
+    async def get_indicators(
+        self,
+        ticker: str,
+        from_date: str,
+        to_date: str,
+        indicators: List[dict],
+        resolution: str = "1D",
+        instrument: str = "stock",
+    ) -> Dict[str, np.ndarray]:
+        """ Compute technical indicators over the cached series, returning only the date and indicator columns.
+        Results are memoised per (series, cache version, indicator, params), so repeated requests skip both the read
+        and the computation until the series is updated.
+
+        Parameters
+        =============
+        Same as get_historical_frame, plus
+        indicators -> List[dict]    : {"name": sma | ema | rsi | macd | vwap | bollinger, "params": {...}} per indicator
+
+        Example Usage
+        =============
+        >>> await trading_client.get_indicators(ticker="AAPL", from_date="2021-01-01", to_date="2022-01-01", resolution="D",
+                indicators=[{"name": "sma", "params": {"window": 50}}, {"name": "rsi", "params": {}}])
+        >>> {"date": array([...]), "sma_50": array([...]), "rsi_14": array([...])}
+        """
+        key, provider_fetch, resolution = self._resolve_series(
+            ticker=ticker, resolution=resolution, instrument=instrument)
+        start, end = bucket_bounds(
+            *self._date_bounds(from_date, to_date), resolution)
+        requested = [(indicator["name"], normalise_indicator_params(indicator["name"], indicator.get("params") or {}))
+                     for indicator in indicators]
+
+        await self._fill_cache_gaps(key, start, end, provider_fetch)
+
+        loop = asyncio.get_running_loop()
+        # Read the version before the bars, so a concurrent merge can only make the memoised data newer than its key
+        version = await loop.run_in_executor(None, self.cache.version, key)
+        series = (key, start, end, resolution, version)
 
+        def compute() -> Dict[str, np.ndarray]:
+            frame = None
+            columns = {}
+            for name, params in [("date", ())] + requested:
+                memo_key = (series, name, params)
+                result = self.indicator_memo.get(memo_key)
+                if result is None:
+                    if frame is None:
+                        frame = self._read_resampled(key, start, end, resolution)
+                    result = {"date": frame.date.to_numpy()} if name == "date" else \
+                        compute_indicator(frame, name, dict(params))
+                    self.indicator_memo.put(memo_key, result)
+                columns.update(result)
+            return columns
+
+        return await loop.run_in_executor(None, compute)
+
+    async def fetch_historical_frame(
+        self,
+        ticker: str,
+        from_date: str,
+        to_date: str,
+        resolution: str = "1D",
+        instrument: str = "stock",
+    ) -> pd.DataFrame:
+        """ Same as get_historical_frame, but straight from the providers, bypassing the local OHLCV cache.
+        For bulk jobs that would otherwise fill the cache with series nobody reads again.
+        """
+        key, provider_fetch, resolution = self._resolve_series(
+            ticker=ticker, resolution=resolution, instrument=instrument)
+        start, end = bucket_bounds(
+            *self._date_bounds(from_date, to_date), resolution)
+
+        base = await provider_fetch(
+            from_date=utc_unixtime_to_date(start, "%Y-%m-%d"), to_date=utc_unixtime_to_date(end - 1, "%Y-%m-%d"))
+        base = base[(base.date >= start) & (base.date < end)].reset_index(drop=True)
+        return base if resolution == key.resolution else resample_ohlcv(base, resolution)
+
+    def request_key(
+        self,
+        ticker: str,
+        from_date: str,
+        to_date: str,
+        resolution: str,
+        instrument: str = "stock",
+    ) -> tuple:
+        """ Normalised identity of a historical request, equal for requests that resolve to the same bars
+        """
+        key, _, resolution = self._resolve_series(
+            ticker=ticker, resolution=resolution, instrument=instrument)
+        return (key, *bucket_bounds(*self._date_bounds(from_date, to_date), resolution), resolution)
+
+    async def _load_frame(
+            self,
+            key: OHLCVCacheKey,
+            start: int,
+            end: int,
+            resolution: str,
+            provider_fetch: Callable) -> pd.DataFrame:
+        await self._fill_cache_gaps(key, start, end, provider_fetch)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._read_resampled, key, start, end, resolution)
+
+    async def iter_historical_batches(
+        self,
+        ticker: str,
+        from_date: str,
+        to_date: str = "2022-02-20",
+        resolution: str = "1D",
+        instrument: str = "stock",
+        batch_size: int = 65_536,
+    ) -> Iterator[pa.RecordBatch]:
+        """ Same as get_historical_frame, but returns an iterator of arrow record batches read lazily from the cache,
+        so the range is never held in memory at once. Gaps are filled from the provider before the iterator is returned.
+
+        Example Usage
+        =============
+        >>> for batch in await trading_client.iter_historical_batches(ticker="AAPL", from_date="2020-01-01", to_date="2022-01-01", resolution="1MIN"):
+                ...
+        """
+        key, provider_fetch, resolution = self._resolve_series(
+            ticker=ticker, resolution=resolution, instrument=instrument)
+        start, end = bucket_bounds(
+            *self._date_bounds(from_date, to_date), resolution)
+
+        await self._fill_cache_gaps(key, start, end, provider_fetch)
+
+        batches = self.cache.iter_batches(key, start, end, batch_size=batch_size)
+        if resolution != key.resolution:
+            batches = resample_batches(batches, resolution)
+        return batches
+
+    def _resolve_series(
+        self,
+        ticker: str,
+        resolution: str,
+        instrument: str,
+    ) -> Tuple[OHLCVCacheKey, Callable, str]:
+        """ Normalise the series parameters, and resolve the base series the resolution is served from
+        into its cache key and the provider call that fills it. Crypto series come from CoinAPI. Stock and forex bars
+        come from Finnhub or AlphaVantage, whichever the provider router finds healthiest, preferring Finnhub for
+        daily bars and AlphaVantage for intraday bars.
+
+        Outputs
+        =============
+        key -> [OHLCVCacheKey]      : Cache key of the base series
+        provider_fetch -> [Callable]: Routed provider call for the base series, takes from_date and to_date
+        resolution -> [str]         : The normalised requested resolution
+        """
         instrument = instrument.strip(" ").lower()
-        resolution = resolution.strip(" ").upper()
-        resolution = resolution.strip(
-            "1") if (
-                "MIN" not in resolution and
-                "H" not in resolution and
-                "D" not in resolution
-        ) else resolution
-        print(resolution)
-        if resolution in finnhub_supported_intervals:
-            historical_data = self.finnhub_client.get_historical_data(
-                ticker=ticker,
-                resolution=resolution,
-                data_format=data_format,
-                from_date=from_date)
-        elif resolution in alphavantage_supported_intervals:
-            historical_data = self.alphavantage_client.get_historical_data(
-                ticker=ticker,
-                resolution=resolution,
-                data_format=data_format,
-                from_date=from_date)
-        else:
+        try:
+            resolution = normalize_resolution(resolution)
+        except ValueError:
+            resolution = None
+
+        if resolution not in SUPPORTED_RESOLUTIONS:
             raise ValueError(
                 "Resolution is not supported. Please check documentation for list of supported resolutions.")
 
-        return historical_data
+        series_resolution = base_resolution(resolution)
+        if instrument in ("crypto", "cryptocurrency"):
+            instrument = "crypto"
+            providers = [("coinapi", self.coin_client)]
+        elif series_resolution == "D":
+            providers = [("finnhub", self.finnhub_client), ("alphavantage", self.alphavantage_client)]
+        else:
+            providers = [("alphavantage", self.alphavantage_client), ("finnhub", self.finnhub_client)]
+
+        candidates = [(name, functools.partial(
+            client.get_historical_data, ticker=ticker, resolution=series_resolution, data_format="frame"))
+            for name, client in providers]
+        provider_fetch = functools.partial(self.provider_router.fetch, candidates)
+
+        key = OHLCVCacheKey(ticker=ticker.upper(),
+                            resolution=series_resolution, instrument=instrument)
+        return key, provider_fetch, resolution
+
+    def _read_resampled(self, key: OHLCVCacheKey, start: int, end: int, resolution: str) -> pd.DataFrame:
+        base = self.cache.read(key, start, end)
+        return base if resolution == key.resolution else resample_ohlcv(base, resolution)
+
+    async def get_historical_batch(
+        self,
+        requests: List[dict],
+        max_concurrency: int = 64,
+    ) -> Tuple[pd.DataFrame, List[dict]]:
+        """ Fetch many historical series concurrently. Provider quotas are enforced by each provider client's
+        rate limiter, so the fan out runs as fast as the quotas allow and one failing ticker does not fail the batch.
+
+        Parameters
+        =============
+        requests -> List[dict]      : get_historical_frame keyword arguments, one dict per series
+        max_concurrency -> [int]    : Upper bound on series being fetched at the same time
+
+        Outputs
+        =============
+        historical_data -> [pd.DataFrame]  : All series in one canonical OHLCV frame, with resolution and instrument columns
+        statuses -> List[dict]             : One status per request, in request order
+
+        Example Usage
+        =============
+        >>> await trading_client.get_historical_batch([{"ticker": "AAPL", "from_date": "2022-01-01", "to_date": "2022-02-01", "resolution": "D"}, ...])
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch(request: dict):
+            async with semaphore:
+                try:
+                    # The frame may be shared with coalesced callers, add the columns to a copy
+                    frame = (await self.get_historical_frame(**request)).assign(
+                        resolution=request.get("resolution", "1D"), instrument=request.get("instrument", "stock"))
+                    return frame, {**request, "status": "success", "rows": frame.shape[0], "detail": None}
+                except Exception as e:
+                    logging.error(
+                        f"Historical batch: failed to retrieve {request.get('ticker')}, {e}")
+                    return None, {**request, "status": "failed", "rows": 0, "detail": str(e)}
+
+        results = await asyncio.gather(*[fetch(request) for request in requests])
+
+        frames = [frame for frame, _ in results if frame is not None]
+        historical_data = pd.concat(frames, ignore_index=True) if frames else \
+            empty_ohlcv_frame().assign(resolution=[], instrument=[])
+
+        return historical_data, [status for _, status in results]
+
+    async def get_correlation(
+        self,
+        tickers: List[str],
+        from_date: str,
+        to_date: str,
+        resolution: str = "D",
+        instrument: str = "stock",
+        returns: str = "log",
+        window: int = None,
+        step: int = 1,
+        max_concurrency: int = 64,
+    ) -> dict:
+        """ Align many cached series on their common dates and compute their returns, correlation and covariance
+        matrices, over the whole range and optionally over rolling windows. Tickers that fail to load are left out.
+
+        Parameters
+        =============
+        tickers -> List[str]    : The ticker symbols, duplicates are dropped
+        returns -> [str]        : log or simple returns
+        window -> [int]         : Rolling window in bars of returns, no rolling matrices when None
+        step -> [int]           : Bars between consecutive rolling windows
+
+        Outputs
+        =============
+        {"tickers", "dates", "returns", "correlation", "covariance", "rolling", "status"}, dates aligned with the
+        returns rows and rolling a generator of (date, correlation, covariance) computed as it is consumed
+
+        Example Usage
+        =============
+        >>> await trading_client.get_correlation(["AAPL", "MSFT", "NVDA"], from_date="2021-01-01", to_date="2022-01-01", window=60, step=20)
+        """
+        tickers = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        frame, statuses = await self.get_historical_batch(
+            [{"ticker": ticker, "from_date": from_date, "to_date": to_date, "resolution": resolution,
+              "instrument": instrument} for ticker in tickers],
+            max_concurrency=max_concurrency)
+        tickers = [status["ticker"] for status in statuses if status["status"] == "success"]
+
+        def compute() -> dict:
+            dates, closes = align_closes(frame.assign(symbol=frame.symbol.str.upper()), tickers)
+            returns_ = returns_matrix(closes, returns)
+            correlation, covariance = pairwise_matrices(returns_)
+            rolling = rolling_pairwise_matrices(returns_, window, step) if window else iter(())
+            return {
+                "tickers": tickers,
+                "dates": dates[1:],
+                "returns": returns_,
+                "correlation": correlation,
+                "covariance": covariance,
+                "rolling": ((dates[end + 1], corr, cov) for end, corr, cov in rolling),
+            }
+
+        loop = asyncio.get_running_loop()
+        return {**await loop.run_in_executor(None, compute), "status": statuses}
+
+    @staticmethod
+    def _date_bounds(from_date: str, to_date: str) -> Tuple[int, int]:
+        """ Half open [start, end) epoch range covering both dates in full
+        """
+        start = date_to_utc_unixtime(from_date, "%Y-%m-%d")
+        end = date_to_utc_unixtime(to_date, "%Y-%m-%d") + DAY_SECONDS
+        return start, end
+
+    async def _fill_cache_gaps(
+            self,
+            key: OHLCVCacheKey,
+            start: int,
+            end: int,
+            provider_fetch: Callable):
+        """ Fetch the parts of [start, end) missing from the cache and merge them in, from the read through source
+        where it has them, through provider_fetch otherwise.
+
+        Bars in the still forming period (the last bar up to now) are stored but never marked as covered,
+        so the next request refreshes them. The read through source only holds settled bars, so it is only consulted
+        for the settled part of the gaps.
+        """
+        loop = asyncio.get_running_loop()
+        gaps = await loop.run_in_executor(None, self.cache.missing_ranges, key, start, end)
+        settled_until = int(time.time()) - resolution_seconds(key.resolution)
+
+        settled_gaps = [(gap_start, min(gap_end, settled_until)) for gap_start, gap_end in gaps if gap_start < settled_until]
+        if settled_gaps and self.read_through is not None:
+            loaded = await loop.run_in_executor(None, self.read_through.load, key, settled_gaps)
+            for frame, covered in loaded:
+                await loop.run_in_executor(None, self.cache.merge, key, frame, covered)
+            if loaded:
+                gaps = await loop.run_in_executor(None, self.cache.missing_ranges, key, start, end)
+
+        if gaps:
+            logging.info(
+                f"OHLCV cache: fetching {len(gaps)} missing range(s) for {key.ticker} {key.resolution} from provider.")
+            fetched = await asyncio.gather(*[
+                provider_fetch(
+                    from_date=utc_unixtime_to_date(gap_start, "%Y-%m-%d"),
+                    to_date=utc_unixtime_to_date(gap_end - 1, "%Y-%m-%d"))
+                for gap_start, gap_end in gaps])
+
+            for (gap_start, gap_end), frame in zip(gaps, fetched):
+                await loop.run_in_executor(
+                    None, self.cache.merge, key, frame, (gap_start, min(gap_end, settled_until)))
 
 
 if __name__ == '__main__':
     trading_client = TradingDataClient()
 
-    print(trading_client.get_historical_data(
+    print(asyncio.run(trading_client.get_historical_data(
         ticker="AAPL",
         from_date="2022-01-01",
         resolution="D",
         data_format="json"
-    ))
+    )))
@@ -0,0 +1,56 @@
+from typing import Dict, List
+
+MINUTE_SECONDS = 60
+
+
+class MinuteBarAggregator:
+    ''' Rolls trade ticks into live 1 minute OHLCV bars per symbol. A bar closes when the first tick of a later minute
+    arrives, or on flush once its minute is over. Ticks older than a symbol's open bar are ignored.
+
+    Bars use the canonical OHLCV layout, dated at the start of their minute.
+
+    Example Usage
+    =============
+    >>> bars = MinuteBarAggregator()
+    >>> bars.add([{"symbol": "AAPL", "price": 170.1, "volume": 10, "timestamp": 1643720401.5}])
+    []
+    >>> bars.flush(now=1643720520)
+    [{"date": 1643720400, "open": 170.1, "high": 170.1, "low": 170.1, "close": 170.1, "volume": 10.0, "symbol": "AAPL"}]
+    '''
+
+    def __init__(self):
+        self._open: Dict[str, dict] = {}
+
+    def add(self, ticks: List[dict]) -> List[dict]:
+        """ Add trade ticks, returns the bars they closed
+        """
+        closed = []
+        for tick in ticks:
+            minute = int(tick["timestamp"]) // MINUTE_SECONDS * MINUTE_SECONDS
+            price, volume = float(tick["price"]), float(tick["volume"])
+            bar = self._open.get(tick["symbol"])
+
+            if bar is None or minute > bar["date"]:
+                if bar is not None:
+                    closed.append(bar)
+                self._open[tick["symbol"]] = {
+                    "date": minute, "open": price, "high": price, "low": price, "close": price, "volume": volume,
+                    "symbol": tick["symbol"]}
+
+            elif minute == bar["date"]:
+                bar["high"] = max(bar["high"], price)
+                bar["low"] = min(bar["low"], price)
+                bar["close"] = price
+                bar["volume"] += volume
+
+        return closed
+
+    def flush(self, now: float) -> List[dict]:
+        """ Close the bars of symbols that have not traded since their minute ended
+        """
+        current_minute = int(now) // MINUTE_SECONDS * MINUTE_SECONDS
+        closed = [bar for bar in self._open.values()
+                  if bar["date"] < current_minute]
+        for bar in closed:
+            del self._open[bar["symbol"]]
+        return closed
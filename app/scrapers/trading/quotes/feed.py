@@ -0,0 +1,106 @@
+import os
+import json
+import asyncio
+import aiohttp
+from typing import Callable, List
+
+from app.scrapers.trading.aggregates.session import get_client_session
+from app.utils.alerts.logger import logging
+
+
+class FinnhubTradeFeed:
+    ''' One upstream Finnhub trades websocket, subscribed to the union of symbols wanted by our clients.
+    Reconnects with exponential backoff and re-subscribes every symbol after a reconnect.
+
+    Ticks are handed to on_ticks as {"symbol", "price", "volume", "timestamp"} dicts, timestamp in epoch seconds,
+    one list per upstream message. The API key is read from FINNHUB_API_KEY when the socket is first opened, unless
+    a token or a full url is given.
+
+    Example Usage
+    =============
+    >>> feed = FinnhubTradeFeed(on_ticks=print)
+    >>> asyncio.create_task(feed.run())
+    >>> await feed.subscribe("AAPL")
+    '''
+
+    name = "finnhub"
+
+    def __init__(
+            self,
+            on_ticks: Callable[[List[dict]], None],
+            url: str = None,
+            token: str = None,
+            max_backoff_seconds: float = 30):
+        self.url = url
+        self.token = token
+        self.on_ticks = on_ticks
+        self.max_backoff_seconds = max_backoff_seconds
+        self.symbols = set()
+        self.connected = asyncio.Event()
+        self._websocket = None
+
+    def _url(self) -> str:
+        if self.url is None:
+            self.url = f"wss://ws.finnhub.io?token={self.token or os.environ['FINNHUB_API_KEY']}"
+        return self.url
+
+    async def _send(self, message_type: str, symbol: str):
+        if self._websocket is not None and not self._websocket.closed:
+            await self._websocket.send_str(json.dumps({"type": message_type, "symbol": symbol}))
+
+    async def subscribe(self, symbol: str):
+        if symbol not in self.symbols:
+            self.symbols.add(symbol)
+            await self._send("subscribe", symbol)
+
+    async def unsubscribe(self, symbol: str):
+        if symbol in self.symbols:
+            self.symbols.discard(symbol)
+            await self._send("unsubscribe", symbol)
+
+    @staticmethod
+    def parse_ticks(message: str) -> List[dict]:
+        """ {"type": "trade", "data": [{"s": "AAPL", "p": 170.1, "v": 10, "t": 1643720401500}, ...]} to ticks,
+        every other message type (ping, error) has no ticks
+        """
+        payload = json.loads(message)
+        if payload.get("type") != "trade":
+            return []
+        return [{"symbol": trade["s"], "price": trade["p"], "volume": trade["v"], "timestamp": trade["t"] / 1000}
+                for trade in payload.get("data", [])]
+
+    async def run(self):
+        """ Keep the websocket connected until cancelled
+        """
+        backoff = 1
+        while True:
+            try:
+                async with get_client_session().ws_connect(self._url(), heartbeat=30) as websocket:
+                    self._websocket = websocket
+                    for symbol in sorted(self.symbols):
+                        await self._send("subscribe", symbol)
+                    self.connected.set()
+                    backoff = 1
+                    logging.info(
+                        f"Quote feed: {self.name} connected, {len(self.symbols)} symbol(s) subscribed.")
+
+                    async for message in websocket:
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            ticks = self.parse_ticks(message.data)
+                            if ticks:
+                                self.on_ticks(ticks)
+                        elif message.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Quote feed: {self.name} connection failed, {e}")
+            finally:
+                self._websocket = None
+                self.connected.clear()
+
+            logging.info(
+                f"Quote feed: {self.name} disconnected, reconnecting in {backoff}s.")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff_seconds)
@@ -0,0 +1,157 @@
+import time
+import asyncio
+import pandas as pd
+from collections import Counter
+from typing import Iterable, List
+
+from app.utils.alerts.logger import logging
+from app.utils.storage.ohlcv_cache import OHLCVCache, OHLCVCacheKey
+from app.scrapers.trading.quotes.ring import EventRingBuffer
+from app.scrapers.trading.quotes.bars import MinuteBarAggregator
+from app.scrapers.trading.quotes.feed import FinnhubTradeFeed
+
+
+class QuoteSubscription:
+    ''' A client's view of the quote hub, iterating over the hub's events for its symbols.
+    Use as an async context manager, so the symbols are released when the client goes away.
+
+    Events are {"type": "trade", ...tick} and {"type": "bar", ...1 minute bar}, plus {"type": "dropped", "count": n}
+    when the client fell behind further than the ring buffer reaches.
+    '''
+
+    def __init__(self, hub, symbols: List[str]):
+        self.hub = hub
+        self.symbols = set(symbols)
+        self.cursor = hub.ring.next_seq
+
+    async def next_events(self) -> List[dict]:
+        """ Wait for the next events for our symbols
+        """
+        while True:
+            await self.hub.ring.wait(self.cursor)
+            events, self.cursor, dropped = self.hub.ring.read(self.cursor)
+            events = [event for event in events if event["symbol"] in self.symbols]
+            if dropped:
+                events.insert(0, {"type": "dropped", "count": dropped})
+            if events:
+                return events
+
+    async def close(self):
+        await self.hub.release(self.symbols)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+        return False
+
+
+class QuoteHub:
+    ''' In process fan out of real time quotes. Keeps one upstream feed connection, subscribed to the union of symbols
+    our clients want, and publishes every tick into a ring buffer that all clients read from.
+
+    Ticks are also rolled into live 1 minute bars, which are published to clients and written to the OHLCV cache in
+    one batch per symbol every persist_seconds. Live bars claim no coverage and only fill in minutes the cache does not
+    hold, so they never overwrite provider bars, and provider bars still replace them once fetched.
+
+    Example Usage
+    =============
+    >>> quote_hub = QuoteHub(cache=trading_client.cache)
+    >>> async with await quote_hub.subscribe(["AAPL", "MSFT"]) as subscription:
+            while True:
+                events = await subscription.next_events()
+    '''
+
+    def __init__(
+            self,
+            cache: OHLCVCache = None,
+            feed_url: str = None,
+            ring_capacity: int = 65_536,
+            flush_seconds: float = 5,
+            persist_seconds: float = 60,
+            instrument: str = "stock"):
+        self.ring = EventRingBuffer(ring_capacity)
+        self.feed = FinnhubTradeFeed(on_ticks=self.publish, url=feed_url)
+        self.bars = MinuteBarAggregator()
+        self.cache = cache
+        self.flush_seconds = flush_seconds
+        self.persist_seconds = persist_seconds
+        self.instrument = instrument
+
+        self._subscribers = Counter()
+        self._pending_bars = []
+        self._unsaved_bars = []
+        self._tasks = []
+
+    def publish(self, ticks: List[dict]):
+        """ Fan ticks out to every client and roll them into 1 minute bars. Runs on the event loop, never blocks
+        """
+        closed = self.bars.add(ticks)
+        self.ring.extend([{"type": "trade", **tick} for tick in ticks] +
+                         [{"type": "bar", **bar} for bar in closed])
+        self._pending_bars.extend(closed)
+
+    def _start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self.feed.run()),
+                           asyncio.create_task(self._flush_bars_loop())]
+
+    async def subscribe(self, symbols: Iterable[str]) -> QuoteSubscription:
+        symbols = sorted({symbol.strip().upper() for symbol in symbols if symbol.strip()})
+        self._start()
+        for symbol in symbols:
+            self._subscribers[symbol] += 1
+            await self.feed.subscribe(symbol)
+        return QuoteSubscription(self, symbols)
+
+    async def release(self, symbols: Iterable[str]):
+        """ Drop a client's symbols, unsubscribing upstream from those no client wants anymore
+        """
+        for symbol in symbols:
+            self._subscribers[symbol] -= 1
+            if self._subscribers[symbol] <= 0:
+                del self._subscribers[symbol]
+                await self.feed.unsubscribe(symbol)
+
+    async def flush_bars(self, now: float = None):
+        """ Close finished bars of quiet symbols, and queue every closed bar for the next cache write
+        """
+        closed = self.bars.flush(time.time() if now is None else now)
+        if closed:
+            self.ring.extend([{"type": "bar", **bar} for bar in closed])
+        self._unsaved_bars += self._pending_bars + closed
+        self._pending_bars = []
+
+    async def persist_bars(self):
+        """ Write the queued bars to the cache, one merge per symbol
+        """
+        bars, self._unsaved_bars = self._unsaved_bars, []
+        if self.cache is None or not bars:
+            return
+
+        loop = asyncio.get_running_loop()
+        for symbol, frame in pd.DataFrame(bars).groupby("symbol"):
+            key = OHLCVCacheKey(ticker=symbol, resolution="1MIN", instrument=self.instrument)
+            try:
+                # Empty covered interval and no replacing: the provider stays the source of truth for the range
+                await loop.run_in_executor(None, self.cache.merge, key, frame, (0, 0), False)
+            except Exception as e:
+                logging.error(f"Quote hub: failed to merge live bars of {symbol} into the cache, {e}")
+
+    async def _flush_bars_loop(self):
+        persisted_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush_bars()
+            if time.monotonic() - persisted_at >= self.persist_seconds:
+                await self.persist_bars()
+                persisted_at = time.monotonic()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush_bars()
+        await self.persist_bars()
@@ -0,0 +1,57 @@
+import asyncio
+from typing import Any, List, Tuple
+
+
+class EventRingBuffer:
+    ''' Fixed size buffer of the latest stream events, numbered by a sequence that only grows.
+
+    One buffer is written per upstream feed and read by every client, each client keeping its own cursor. Publishing
+    is an O(1) slot write that never waits on readers. A reader that falls more than capacity events behind skips
+    ahead to the oldest event still held and is told how many it missed.
+
+    Example Usage
+    =============
+    >>> ring = EventRingBuffer(capacity=4)
+    >>> ring.extend(["a", "b", "c"])
+    >>> ring.read(1)
+    (['b', 'c'], 3, 0)
+    '''
+
+    def __init__(self, capacity: int = 65_536):
+        self.capacity = capacity
+        self.next_seq = 0
+        self._slots = [None] * capacity
+        self._changed = None
+
+    def extend(self, events: List[Any]):
+        for event in events:
+            self._slots[self.next_seq % self.capacity] = event
+            self.next_seq += 1
+        if events and self._changed is not None:
+            # Wake every waiting reader at once, later readers wait on a fresh event
+            self._changed.set()
+            self._changed = None
+
+    def read(self, seq: int) -> Tuple[List[Any], int, int]:
+        """ Events from sequence number seq onwards
+
+        Outputs
+        =============
+        events -> [list]    : Events held from seq to the latest, oldest first
+        next_seq -> [int]   : Cursor to pass to the next read
+        dropped -> [int]    : Events between seq and the oldest held one, overwritten before they were read
+        """
+        oldest = max(0, self.next_seq - self.capacity)
+        dropped = max(0, oldest - seq)
+        seq = max(seq, oldest)
+        events = [self._slots[i % self.capacity]
+                  for i in range(seq, self.next_seq)]
+        return events, self.next_seq, dropped
+
+    async def wait(self, seq: int):
+        """ Wait until an event with sequence number seq or later has been published
+        """
+        while self.next_seq <= seq:
+            if self._changed is None:
+                self._changed = asyncio.Event()
+            await self._changed.wait()
@@ -0,0 +1,247 @@
+import time
+import asyncio
+import contextvars
+import numpy as np
+from collections import deque
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.utils.alerts.logger import logging
+from app.utils.alerts.exceptions.api_exception import UnsupportedRangeException
+
+Candidate = Tuple[str, Callable[..., Awaitable]]
+
+
+class CallTimer:
+    ''' Time the requests of one routed call spend on the wire, leaving out waits on rate limiters and key pools.
+    Provider clients report their requests through provider_request().
+    '''
+
+    def __init__(self):
+        self.started_at = None  # Start of the first request, None while the call is still queued on its limiter
+        self.latency = 0.0  # Longest finished request
+        self._in_flight = []
+
+    @contextmanager
+    def request(self):
+        started_at = time.monotonic()
+        if self.started_at is None:
+            self.started_at = started_at
+        self._in_flight.append(started_at)
+        try:
+            yield
+        finally:
+            self._in_flight.remove(started_at)
+            self.latency = max(self.latency, time.monotonic() - started_at)
+
+    def in_flight_for(self) -> Optional[float]:
+        """ Time the oldest request still in flight has been waiting for its response, None between requests
+        """
+        return time.monotonic() - min(self._in_flight) if self._in_flight else None
+
+    def elapsed(self) -> Optional[float]:
+        """ Longest request so far, counting requests still in flight up to now. None when no request was made
+        """
+        if self.started_at is None:
+            return None
+        return max(self.latency, self.in_flight_for() or 0.0)
+
+
+_call_timer = contextvars.ContextVar("provider_call_timer", default=None)
+
+
+@contextmanager
+def provider_request():
+    ''' Wrap each provider HTTP request, after its rate limiter, so the router times the request and not the queueing
+
+    Example Usage
+    =============
+    >>> await self.rate_limiter.acquire()
+    >>> with provider_request():
+            async with session.get(url) as response:
+                ...
+    '''
+    timer = _call_timer.get()
+    if timer is None:
+        yield
+    else:
+        with timer.request():
+            yield
+
+
+class ProviderStats:
+    ''' Rolling request latency and error rate of one provider, over its last window calls.
+
+    A call cancelled after losing a hedge race adds the time its requests had taken as a censored sample. It is a lower
+    bound of the true latency, but still ranks a provider that keeps losing as slow, and does not count as an error.
+    '''
+
+    def __init__(self, window: int = 200):
+        # (latency, failed), latency None for calls that made no request, failed None for censored samples
+        self.samples = deque(maxlen=window)
+
+    def record(self, latency: Optional[float], failed: bool):
+        self.samples.append((latency, failed))
+
+    def record_censored(self, latency: float):
+        self.samples.append((latency, None))
+
+    @property
+    def calls(self) -> int:
+        return len(self.samples)
+
+    def error_rate(self) -> float:
+        outcomes = [failed for _, failed in self.samples if failed is not None]
+        return sum(outcomes) / len(outcomes) if outcomes else 0.0
+
+    def percentile(self, q: float, default: float) -> float:
+        latencies = [latency for latency, _ in self.samples if latency is not None]
+        return float(np.percentile(latencies, q)) if latencies else default
+
+
+class ProviderRouter:
+    ''' Routes each provider call to the healthiest provider able to serve it, and hedges slow calls.
+
+    Providers are ranked by their rolling p95 request latency, inflated by their error rate. If the chosen provider's
+    request has not answered after its own p95 latency, a hedged duplicate goes to the next provider and whichever
+    succeeds first wins, the other call is cancelled. A failed call falls through to the next provider straight away,
+as does a provider raising UnsupportedRangeException, which is not counted against its health.
+
+    Latency and the hedge clock only count time on the wire, see provider_request, so a call queued on its provider's
+    rate limiter under load is neither hedged nor recorded as slow.
+
+    Providers without enough calls yet keep the caller's order, so the preferred provider is tried first until there
+    is data saying otherwise.
+
+    Example Usage
+    =============
+    >>> router = ProviderRouter()
+    >>> frame = await router.fetch([("finnhub", finnhub_fetch), ("alphavantage", alphavantage_fetch)],
+                                   from_date="2022-01-01", to_date="2022-02-01")
+    '''
+
+    def __init__(
+            self,
+            window: int = 200,
+            min_calls: int = 5,
+            default_latency: float = 2.0,
+            min_hedge_delay: float = 0.25,
+            error_penalty: float = 10.0):
+        """
+        Parameters
+        =============
+        window -> [int]             : Calls per provider the statistics are computed over
+        min_calls -> [int]          : Calls before a provider's statistics are trusted for ranking and hedging
+        default_latency -> [float]  : Seconds, p95 assumed for providers without enough calls
+        min_hedge_delay -> [float]  : Seconds, lower bound of the hedge delay so fast providers are not hedged on jitter
+        error_penalty -> [float]    : A provider's p95 is scaled by 1 + error_penalty * error rate for ranking
+        """
+        self.window = window
+        self.min_calls = min_calls
+        self.default_latency = default_latency
+        self.min_hedge_delay = min_hedge_delay
+        self.error_penalty = error_penalty
+        self.stats: Dict[str, ProviderStats] = {}
+
+    def _stats(self, provider: str) -> ProviderStats:
+        if provider not in self.stats:
+            self.stats[provider] = ProviderStats(self.window)
+        return self.stats[provider]
+
+    def p95(self, provider: str) -> float:
+        stats = self._stats(provider)
+        if stats.calls < self.min_calls:
+            return self.default_latency
+        return stats.percentile(95, self.default_latency)
+
+    def score(self, provider: str) -> float:
+        """ Expected cost of a call, lower is healthier
+        """
+        return self.p95(provider) * (1 + self.error_penalty * self._stats(provider).error_rate())
+
+    def rank(self, candidates: List[Candidate]) -> List[Candidate]:
+        # Stable, ties keep the caller's order of preference
+        return sorted(candidates, key=lambda candidate: self.score(candidate[0]))
+
+    def hedge_delay(self, provider: str) -> float:
+        return max(self.min_hedge_delay, self.p95(provider))
+
+    def summary(self) -> Dict[str, dict]:
+        return {provider: {"calls": stats.calls, "p50": stats.percentile(50, None), "p95": stats.percentile(95, None),
+                           "error_rate": stats.error_rate()}
+                for provider, stats in self.stats.items()}
+
+    async def _timed(self, provider: str, fetch: Callable[..., Awaitable], timer: CallTimer, **kwargs):
+        # Runs in its own task, so the timer is only seen by this call's requests
+        _call_timer.set(timer)
+        try:
+            result = await fetch(**kwargs)
+        except asyncio.CancelledError:
+            # Lost the race, its requests took at least this long
+            if timer.elapsed() is not None:
+                self._stats(provider).record_censored(timer.elapsed())
+            raise
+        except UnsupportedRangeException:
+            raise
+        except Exception:
+            self._stats(provider).record(timer.elapsed(), failed=True)
+            raise
+        self._stats(provider).record(timer.elapsed(), failed=False)
+        return result
+
+    async def fetch(self, candidates: List[Candidate], **kwargs):
+        """ Call the healthiest candidate with kwargs, hedged by the next ones. Raises the first error if every
+        candidate fails.
+
+        Parameters
+        =============
+        candidates -> List[Tuple[str, Callable]]    : (provider name, async call) pairs able to serve the request,
+                                                      in order of preference
+        """
+        ranked = self.rank(candidates)
+        pending: Dict[asyncio.Task, str] = {}
+        errors = []
+
+        def launch():
+            provider, fetch = ranked.pop(0)
+            timer = CallTimer()
+            pending[asyncio.ensure_future(self._timed(provider, fetch, timer, **kwargs))] = provider
+            return provider, timer
+
+        try:
+            primary, timer = launch()
+            while pending:
+                # Wait for the running calls, until a request of the primary has been out for its p95, while there
+                # is still a provider to hedge with. Between requests the primary is queued on its limiter,
+                # check back later
+                timeout = None
+                if ranked:
+                    in_flight_for = timer.in_flight_for()
+                    timeout = self.min_hedge_delay if in_flight_for is None else \
+                        max(0, self.hedge_delay(primary) - in_flight_for)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if (timer.in_flight_for() or 0) >= self.hedge_delay(primary):
+                        hedge, hedge_timer = launch()
+                        logging.info(
+                            f"Provider router: {primary} slower than {self.hedge_delay(primary):.2f}s, hedging with {hedge}.")
+                        primary, timer = hedge, hedge_timer
+                    continue
+
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(task.exception())
+                    logging.error(
+                        f"Provider router: {provider} failed, {task.exception()}")
+
+                if not pending and ranked:
+                    primary, timer = launch()
+
+            raise errors[0]
+
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,97 @@
+import time
+import asyncio
+import pandas as pd
+
+from app.scrapers.trading.aggregates.finnhub import FinnhubClient
+from app.scrapers.trading.aggregates.coin import CoinapiAssetScraperClient
+from app.utils.alerts.logger import logging
+from app.utils.storage.symbol_index import SymbolIndex, SYMBOL_INDEX_COLUMNS
+
+
+class SymbolUniverse:
+    ''' The tradable symbol universe (Finnhub US stocks and OANDA forex, CoinAPI exchange spot pairs), downloaded
+    once and refreshed on a schedule into an in-memory SymbolIndex. Searches never wait on the providers, and a
+    provider failing on refresh keeps its previous listing.
+
+    Example Usage
+    =============
+    >>> symbol_universe = SymbolUniverse()
+    >>> await symbol_universe.search("aapl")
+    '''
+
+    def __init__(self, refresh_seconds: int = 6 * 60 * 60, crypto_exchange: str = "OKEX"):
+        self.refresh_seconds = refresh_seconds
+        self.crypto_exchange = crypto_exchange
+        self.finnhub_client = FinnhubClient()
+        self.coin_client = CoinapiAssetScraperClient()
+
+        self.index = SymbolIndex()
+        self.refreshed_at = None
+        self._listings = {}
+        self._refresh_lock = None
+
+    async def _finnhub_listing(self) -> pd.DataFrame:
+        symbols = await self.finnhub_client.retrieve_symbols()
+        if symbols is None:
+            raise ValueError("Finnhub returned no symbols")
+        return pd.DataFrame({
+            "symbol": symbols.symbol,
+            "description": symbols.description,
+            "type": symbols.type.fillna("").replace("", "Stock"),
+            "source": "finnhub",
+        })
+
+    async def _coinapi_listing(self) -> pd.DataFrame:
+        symbols = await self.coin_client.get_cryptoexchange_symbols(self.crypto_exchange)
+        return pd.DataFrame({
+            "symbol": symbols.asset_id_base,
+            "description": symbols.symbol_id,
+            "type": "Crypto",
+            "source": "coinapi",
+        })
+
+    async def refresh(self):
+        """ Download every listing and swap in a freshly built index
+        """
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+
+        async with self._refresh_lock:
+            sources = {"finnhub": self._finnhub_listing, "coinapi": self._coinapi_listing}
+            listings = await asyncio.gather(*[listing() for listing in sources.values()], return_exceptions=True)
+
+            for source, listing in zip(sources, listings):
+                if isinstance(listing, Exception):
+                    logging.error(
+                        f"Symbol universe: failed to refresh {source} symbols, keeping the previous listing. {listing}")
+                else:
+                    self._listings[source] = listing
+
+            symbols = pd.concat(self._listings.values(), ignore_index=True) if self._listings else \
+                pd.DataFrame(columns=SYMBOL_INDEX_COLUMNS)
+
+            # Building the index is CPU bound, keep it off the event loop
+            loop = asyncio.get_running_loop()
+            self.index = await loop.run_in_executor(None, SymbolIndex, symbols)
+            self.refreshed_at = time.time()
+
+            logging.info(
+                f"Symbol universe: indexed {len(self.index)} symbols.")
+
+    async def ensure_loaded(self):
+        if self.refreshed_at is None:
+            await self.refresh()
+
+    async def run_refresh_loop(self):
+        """ Refresh the index forever, every refresh_seconds. Meant to run as a background task for the app's lifetime
+        """
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Symbol universe: refresh failed, {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    async def search(self, query: str, limit: int = 10) -> list:
+        await self.ensure_loaded()
+        return self.index.search(query, limit=limit)
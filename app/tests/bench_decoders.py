@@ -0,0 +1,98 @@
+""" Benchmark of the provider payload decoders against the eval based parsing they replaced,
+on a synthetic 100k bar intraday response.
+
+Run with: python -m app.tests.bench_decoders
+"""
+import csv
+import json
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from app.utils.cleaning.ohlcv_clean import format_ohlcv_frame
+from app.utils.cleaning.decoders import decode_finnhub_candles, decode_alphavantage_csv
+
+BARS = 100_000
+REPEATS = 3
+
+
+def make_finnhub_payload(bars: int) -> str:
+    rng = np.random.default_rng(0)
+    close = 100 + rng.standard_normal(bars).cumsum()
+    return json.dumps({
+        "c": close.round(4).tolist(),
+        "h": (close + 0.5).round(4).tolist(),
+        "l": (close - 0.5).round(4).tolist(),
+        "o": close.round(4).tolist(),
+        "s": "ok",
+        "t": (1640995200 + 60 * np.arange(bars)).tolist(),
+        "v": rng.integers(100, 10_000, bars).tolist(),
+    })
+
+
+def make_alphavantage_payload(bars: int) -> str:
+    candles = json.loads(make_finnhub_payload(bars))
+    rows = ["time,open,high,low,close,volume"] + [
+        f"{datetime.utcfromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S')},{o},{h},{l},{c},{v}"
+        for t, o, h, l, c, v in zip(candles["t"], candles["o"], candles["h"], candles["l"], candles["c"], candles["v"])]
+    return "\n".join(rows)
+
+
+''' Previous implementations '''
+
+
+def eval_finnhub(payload: str, data_format: str):
+    historical = pd.DataFrame(eval(payload))\
+        .rename(columns={"c": "close", "h": "high", "l": "low", "o": "open", "s": "status", "t": "date", "v": "volume"})\
+        .drop(columns=['status'])
+    historical['symbol'] = "AAPL"
+    if data_format == "json":
+        return eval(historical.to_json(orient="table", index=False))['data']
+    historical.date = historical.date.apply(
+        lambda ts: datetime.utcfromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S'))
+    return historical
+
+
+def csv_reader_alphavantage(payload: str, data_format: str):
+    my_list = list(csv.reader(payload.splitlines(), delimiter=','))
+    df = pd.DataFrame(my_list[1:], columns=my_list[0]).rename(
+        columns={"time": "date"})
+    df['symbol'] = "AAPL"
+    if data_format == "json":
+        return eval(df.to_json(orient="table", index=False))['data']
+    return df
+
+
+''' Decoders '''
+
+
+def decode_finnhub(payload: str, data_format: str):
+    return format_ohlcv_frame(decode_finnhub_candles(payload, symbol="AAPL"), data_format)
+
+
+def decode_alphavantage(payload: str, data_format: str):
+    return format_ohlcv_frame(decode_alphavantage_csv(payload, symbol="AAPL"), data_format)
+
+
+def best_of(fn, *args) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == '__main__':
+    payloads = {
+        "finnhub": (make_finnhub_payload(BARS), eval_finnhub, decode_finnhub),
+        "alphavantage": (make_alphavantage_payload(BARS), csv_reader_alphavantage, decode_alphavantage),
+    }
+    print(f"{BARS} bars, best of {REPEATS}")
+    for provider, (payload, previous, decoder) in payloads.items():
+        for data_format in ("json", "csv"):
+            previous_time = best_of(previous, payload, data_format)
+            decoder_time = best_of(decoder, payload, data_format)
+            print(f"{provider:<13} {data_format:<5} previous {previous_time * 1000:8.1f} ms   "
+                  f"decoder {decoder_time * 1000:8.1f} ms   speedup {previous_time / decoder_time:5.1f}x")
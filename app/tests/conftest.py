@@ -0,0 +1,177 @@
+import os
+import time
+import pytest
+import tweepy
+import requests
+from types import SimpleNamespace
+
+from app.utils.storage.ohlcv_cache import OHLCVCache
+from app.scrapers.social.twitter_pool import TwitterClientPool
+
+
+@pytest.fixture
+def provider_env(monkeypatch, tmp_path):
+    ''' Placeholder provider secrets, and scratch directories for the key pools and the OHLCV cache. The clients, models
+    and cloud utilities read these on import or construction, so import them inside a fixture that uses this one.
+    '''
+    for index in range(16):
+        monkeypatch.setenv(f"NEWS_APIKEY_{index}", "key")
+        monkeypatch.setenv(f"ALPHA_VANTAGE_API_KEY_{index}", f"key{index}")
+    for name in ["FINNHUB_API_KEY", "COIN_API_KEY", "USDA_FAS_API_KEY",
+                 "GOOGLE_APPLICATION_CREDENTIALS", "GOOGLE_BUCKET_NAME", "GOOGLE_PROJECT_ID"]:
+        monkeypatch.setenv(name, "key")
+    monkeypatch.setenv("KEY_POOL_STATE_DIR", str(tmp_path / "keypools"))
+    monkeypatch.setenv("OHLCV_CACHE_DIR", str(tmp_path / "ohlcv"))
+    monkeypatch.setenv("ENVIRONMENT", os.environ.get("ENVIRONMENT", "dev"))
+
+
+@pytest.fixture
+def trading_client(provider_env, tmp_path):
+    # The trading models pick their storage types from the environment on import
+    from app.scrapers.trading.main import TradingDataClient
+    trading_client = TradingDataClient()
+    trading_client.cache = OHLCVCache(cache_dir=str(tmp_path / "ohlcv"))
+    return trading_client
+
+
+class FakeResponse:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    async def read(self):
+        return self.body
+
+
+class FakeSession:
+    ''' Serves the given bodies in order, and records the urls requested '''
+
+    def __init__(self, bodies):
+        self.bodies = list(bodies)
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return FakeResponse(self.bodies.pop(0))
+
+
+@pytest.fixture
+def fake_session(monkeypatch):
+    ''' Replaces a provider module's shared aiohttp session, e.g. fake_session("app.scrapers.trading.aggregates.coin", [b"[]"])
+    '''
+    def serve(module: str, bodies) -> FakeSession:
+        session = FakeSession(bodies)
+        monkeypatch.setattr(f"{module}.get_client_session", lambda: session)
+        return session
+    return serve
+
+
+class FakeCloudUtility:
+    ''' Keeps every frame written, by storage url '''
+
+    def __init__(self):
+        self.objects = {}
+
+    def write_to_cloud_storage(self, dataframe, storage_url):
+        self.objects[storage_url] = dataframe
+        return "gs://bucket/" + storage_url
+
+    write_chunk_to_cloud_storage = write_parquet_to_cloud_storage = write_to_cloud_storage
+
+
+class FakeCollection:
+    ''' The parts of a pymongo collection the jobs use. update_one only matches a document on every field of the query '''
+
+    def __init__(self):
+        self.documents = {}
+
+    def update_one(self, query, update, upsert=False):
+        document = self.documents.get(query["_id"])
+        if document is None and upsert:
+            document = self.documents[query["_id"]] = {"_id": query["_id"]}
+        if document is None or any(document.get(field) != value for field, value in query.items()):
+            return SimpleNamespace(modified_count=0)
+        document.update(update["$set"])
+        return SimpleNamespace(modified_count=1)
+
+    def find_one(self, query):
+        return self.documents.get(query["_id"])
+
+    def find(self, query, projection=None):
+        return [document for document in self.documents.values()
+                if all(document.get(field) == value for field, value in query.items())]
+
+
+''' Twitter '''
+
+
+class RateLimitResponse:
+    ''' A Twitter response with its rate limit headers, the window resets reset_in seconds from now '''
+    status_code, reason, text = 429, "Too Many Requests", ""
+
+    def __init__(self, remaining, reset_in=900):
+        self.headers = {"x-rate-limit-remaining": str(remaining), "x-rate-limit-reset": str(time.time() + reset_in)}
+
+    def json(self):
+        return {}
+
+
+def not_found():
+    response = requests.Response()
+    response.status_code, response.reason = 404, "Not Found"
+    response._content = b'{"errors": [{"code": 34, "message": "Sorry, that page does not exist."}]}'
+    return tweepy.NotFound(response)
+
+
+class FakeTwitterClient:
+    ''' Pages of 3 follower ids per user, cursors -1, 1, 2, ..., pages - 1, then 0, and records every call.
+    Answers 429 once budget calls are spent, fails once on the (user, cursor) pairs in fail_at, and always on the users
+    in gone '''
+
+    def __init__(self, budget=None, pages=3, fail_at=None, gone=()):
+        self.budget, self.pages, self.last_response = budget, pages, None
+        self.fail_at, self.calls, self.gone = fail_at or set(), [], gone
+
+    def get_follower_ids(self, cursor, **kwargs):
+        user = kwargs.get("screen_name")
+        self.calls.append((user, cursor))
+        if user in self.gone:
+            raise not_found()
+        if (user, cursor) in self.fail_at:
+            self.fail_at.discard((user, cursor))
+            raise RuntimeError("connection reset")
+        if self.budget is not None:
+            if self.budget == 0:
+                raise tweepy.TooManyRequests(RateLimitResponse(0))
+            self.budget -= 1
+            self.last_response = RateLimitResponse(self.budget)
+        page = max(cursor, 0)
+        return [page * 10 + i for i in range(3)], (0, page + 1 if page + 1 < self.pages else 0)
+
+
+@pytest.fixture
+def twitter_pool(monkeypatch):
+    ''' Builds a TwitterClientPool over placeholder keys, one per fake client. Pool threads are shut down after the test
+    '''
+    pools = []
+
+    def make(clients) -> TwitterClientPool:
+        for index in range(1, len(clients) + 1):
+            for key in ["CONSUMER_KEY", "CONSUMER_SECRET", "SECRET_ACCESS_TOKEN", "ACCESS_TOKEN"]:
+                monkeypatch.setenv(f"TWITTER_{key}_{index}", "key")
+        pool = TwitterClientPool(api_keys=len(clients))
+        pool.clients = list(clients)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.executor.shutdown(wait=True, cancel_futures=True)
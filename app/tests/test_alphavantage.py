@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+import pandas as pd
+from datetime import datetime, timedelta
+
+from app.utils.storage.ohlcv_cache import OHLCVCacheKey
+from app.utils.cleaning.datetime_clean import date_to_utc_unixtime
+from app.utils.alerts.exceptions.api_exception import UnsupportedRangeException
+
+DAY = 24 * 60 * 60
+
+
+def test_slices_cover_the_range_with_a_neighbour_on_each_side(trading_client):
+    today = datetime.utcnow()
+
+    def ago(days): return (today - timedelta(days=days)).strftime("%Y-%m-%d")
+
+    plan_slices = trading_client.alphavantage_client.plan_slices
+    assert plan_slices(ago(45), ago(35)) == ["year1month1", "year1month2", "year1month3"]
+    assert plan_slices(ago(10)) == ["year1month1", "year1month2"]
+    assert plan_slices(ago(5_000), ago(4_000)) == []
+
+
+def test_ranges_older_than_the_slices_fall_back_without_claiming_coverage(trading_client, monkeypatch):
+    def no_requests():
+        raise AssertionError("AlphaVantage was called for a range it does not serve")
+    monkeypatch.setattr("app.scrapers.trading.aggregates.alphavantage.get_client_session", no_requests)
+
+    with pytest.raises(UnsupportedRangeException):
+        asyncio.run(trading_client.alphavantage_client.get_historical_data(
+            "AAPL", resolution="1min", from_date="2001-01-02", to_date="2001-01-03", data_format="frame"))
+
+    start = date_to_utc_unixtime("2001-01-02", "%Y-%m-%d")
+
+    async def finnhub_bars(ticker, resolution, from_date, to_date, data_format):
+        return pd.DataFrame({"date": [start + 60 * minute for minute in range(3)], "open": 1.0, "high": 2.0,
+                             "low": 0.5, "close": 1.5, "volume": 100.0, "symbol": ticker})
+    trading_client.finnhub_client.get_historical_data = finnhub_bars
+
+    frame = asyncio.run(trading_client.get_historical_frame(
+        ticker="AAPL", from_date="2001-01-02", to_date="2001-01-02", resolution="1MIN"))
+
+    assert frame.date.tolist() == [start, start + 60, start + 120]
+    assert trading_client.provider_router.stats["alphavantage"].error_rate() == 0
+    key = OHLCVCacheKey(ticker="AAPL", resolution="1MIN", instrument="stock")
+    assert trading_client.cache.missing_ranges(key, start, start + DAY) == []
@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+import pandas as pd
+
+from app.utils.cleaning.datetime_clean import date_to_utc_unixtime
+from app.tests.conftest import FakeCloudUtility, FakeCollection
+
+
+class FakeTradingClient:
+    ''' One daily bar per unit, an empty frame for tickers in empty. Fails once on the (ticker, from_date) in fail_at '''
+
+    def __init__(self, fail_at=None, empty=()):
+        self.fail_at, self.empty, self.calls = fail_at or set(), empty, []
+
+    async def fetch_historical_frame(self, ticker, from_date, to_date, resolution, instrument):
+        self.calls.append((ticker, from_date))
+        if (ticker, from_date) in self.fail_at:
+            self.fail_at.discard((ticker, from_date))
+            raise ConnectionError("provider down")
+        dates = [] if ticker in self.empty else [date_to_utc_unixtime(from_date, "%Y-%m-%d")]
+        return pd.DataFrame({"date": dates, "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 100.0,
+                             "symbol": ticker})
+
+
+@pytest.fixture
+def backfill_job(provider_env):
+    # The trading models pick their storage types from the environment on import
+    from app.scrapers.trading.backfill import BackfillJob
+
+    def make(trading_client, cloud_utility, checkpoints):
+        return BackfillJob("2022Q2", from_date="2020-06-01", to_date="2021-03-31", max_concurrency=2,
+                           trading_client=trading_client, cloud_utility=cloud_utility, checkpoints=checkpoints)
+    return make
+
+
+def test_backfill_writes_a_partition_per_unit(backfill_job):
+    trading_client, cloud_utility, checkpoints = FakeTradingClient(empty={"DELISTED"}), FakeCloudUtility(), FakeCollection()
+    summary = asyncio.run(backfill_job(trading_client, cloud_utility, checkpoints).run(tickers=["AAPL", "DELISTED"]))
+
+    assert (summary["total"], summary["done"], summary["failed"], summary["rows"]) == (4, 4, 0, 2)
+    assert sorted(cloud_utility.objects) == [
+        "trading/backfill/2022Q2/instrument=stock/resolution=D/year=2020/ticker=AAPL/2020-06-01_2020-12-31.parquet",
+        "trading/backfill/2022Q2/instrument=stock/resolution=D/year=2021/ticker=AAPL/2021-01-01_2021-03-31.parquet",
+    ]
+    assert {document["status"] for document in checkpoints.documents.values()} == {"done"}
+    # Units without bars are done, with nothing written
+    assert [document["write_path"] for document in checkpoints.documents.values()
+            if document["ticker"] == "DELISTED"] == [None, None]
+
+
+def test_backfill_resumes_only_the_units_not_done(backfill_job):
+    trading_client = FakeTradingClient(fail_at={("MSFT", "2021-01-01")})
+    cloud_utility, checkpoints = FakeCloudUtility(), FakeCollection()
+
+    first = asyncio.run(backfill_job(trading_client, cloud_utility, checkpoints).run(tickers=["AAPL", "MSFT"]))
+    assert (first["done"], first["failed"]) == (3, 1)
+    failed = [document for document in checkpoints.documents.values() if document["status"] == "failed"]
+    assert [(document["ticker"], document["detail"]) for document in failed] == [("MSFT", "provider down")]
+
+    fetched = len(trading_client.calls)
+    second = asyncio.run(backfill_job(trading_client, cloud_utility, checkpoints).run(tickers=["AAPL", "MSFT"]))
+    assert (second["skipped"], second["done"], second["failed"]) == (3, 1, 0)
+    assert trading_client.calls[fetched:] == [("MSFT", "2021-01-01")]
+    assert len(cloud_utility.objects) == 4
+    assert {document["status"] for document in checkpoints.documents.values()} == {"done"}
@@ -0,0 +1,57 @@
+import json
+import asyncio
+import pytest
+from urllib.parse import urlparse, parse_qs
+
+
+@pytest.fixture
+def coin_client(provider_env):
+    from app.scrapers.trading.aggregates.coin import CoinapiAssetScraperClient
+    return CoinapiAssetScraperClient()
+
+
+@pytest.mark.parametrize("resolution, period", [
+    ("1MIN", "1MIN"), ("15min", "15MIN"), ("15m", "15MIN"), ("1H", "1HRS"), ("4H", "4HRS"), ("D", "1DAY"), ("1M", "1MTH"),
+    ("30MIN", "30MIN"), ("1HRS", "1HRS"), ("1DAY", "1DAY"),
+])
+def test_resolutions_map_to_coinapi_periods(coin_client, resolution, period):
+    assert coin_client.coinapi_period(resolution) == period
+
+
+def test_weeks_have_no_coinapi_period(coin_client):
+    with pytest.raises(ValueError):
+        coin_client.coinapi_period("W")
+
+
+def test_tickers_map_to_okex_usdt_spot_symbols(coin_client):
+    assert coin_client.coinapi_symbol("btc") == "OKEX_SPOT_BTC_USDT"
+    assert coin_client.coinapi_symbol("ETH", exchange="BINANCE") == "BINANCE_SPOT_ETH_USDT"
+    assert coin_client.coinapi_symbol("BITSTAMP_SPOT_BTC_USD") == "BITSTAMP_SPOT_BTC_USD"
+
+
+def bars(starts):
+    return json.dumps([{"time_period_start": start, "price_open": 1.0, "price_high": 2.0, "price_low": 0.5,
+                        "price_close": 1.5, "volume_traded": 10.0} for start in starts]).encode()
+
+
+def test_ranges_are_paged_in_windows_of_page_size_bars(coin_client, fake_session):
+    # 20 days of minutes are 28800 bars, three pages of at most 10000, the second page repeats the first one's last bar
+    session = fake_session("app.scrapers.trading.aggregates.coin", [
+        bars(["2022-01-01T00:00:00Z", "2022-01-07T22:39:00Z"]),
+        bars(["2022-01-07T22:39:00Z", "2022-01-07T22:40:00Z"]),
+        bars(["2022-01-20T23:59:00Z"]),
+    ])
+    frame = asyncio.run(coin_client.get_historical_data(
+        "BTC", from_date="2022-01-01", to_date="2022-01-20", resolution="1MIN", data_format="frame"))
+
+    queries = [parse_qs(urlparse(url).query) for url in session.urls]
+    assert all(urlparse(url).path == "/v1/ohlcv/OKEX_SPOT_BTC_USDT/history" for url in session.urls)
+    assert [query["period_id"][0] for query in queries] == ["1MIN"] * 3
+    assert [query["limit"][0] for query in queries] == ["10000"] * 3
+    assert [(query["time_start"][0], query["time_end"][0]) for query in queries] == [
+        ("2022-01-01T00:00:00", "2022-01-07T22:40:00"),
+        ("2022-01-07T22:40:00", "2022-01-14T21:20:00"),
+        ("2022-01-14T21:20:00", "2022-01-21T00:00:00"),
+    ]
+    assert frame.date.is_unique and frame.date.is_monotonic_increasing
+    assert len(frame) == 4 and set(frame.symbol) == {"BTC"}
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from app.utils.analytics.correlation import align_closes, returns_matrix, pairwise_matrices, rolling_pairwise_matrices, pack_upper
+
+
+def random_returns(rows=300, columns=7, seed=3):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, 0.01, (rows, columns)) @ rng.normal(0, 1, (columns, columns))
+    returns[rng.random(returns.shape) < 0.05] = np.nan
+    return returns
+
+
+def test_blocked_matrices_match_pandas_pairwise():
+    returns = random_returns()
+    correlation, covariance = pairwise_matrices(returns, block=3)
+
+    expected = pd.DataFrame(returns)
+    np.testing.assert_allclose(correlation, expected.corr().to_numpy(), atol=1e-10)
+    np.testing.assert_allclose(covariance, expected.cov().to_numpy(), atol=1e-12)
+
+
+def test_rolling_matches_each_window():
+    returns = random_returns(rows=50, columns=4)
+    windows = list(rolling_pairwise_matrices(returns, window=20, step=7, min_periods=2, block=2))
+
+    assert [end for end, _, _ in windows] == [19, 26, 33, 40, 47]
+    end, correlation, _ = windows[-1]
+    np.testing.assert_allclose(
+        correlation, pd.DataFrame(returns[end - 19:end + 1]).corr().to_numpy(), atol=1e-10)
+
+
+def test_align_carries_closes_forward_and_packs_upper():
+    frame = pd.DataFrame({
+        "date": [1, 2, 3, 1, 3, 2],
+        "close": [10.0, 11.0, 12.0, 5.0, 6.0, 100.0],
+        "symbol": ["A", "A", "A", "B", "B", "C"],
+    })
+    dates, closes = align_closes(frame, ["A", "B", "C"])
+
+    assert dates.tolist() == [1, 2, 3]
+    np.testing.assert_array_equal(closes, [[10, 5, np.nan], [11, 5, 100], [12, 6, 100]])
+    np.testing.assert_allclose(returns_matrix(closes, "simple")[:, 0], [0.1, 12 / 11 - 1])
+    assert pack_upper(np.arange(9.0).reshape(3, 3)).tolist() == [0, 1, 2, 4, 5, 8]
@@ -0,0 +1,103 @@
+import json
+import asyncio
+import pytest
+import pandas as pd
+from types import SimpleNamespace
+
+from app.utils.cleaning.decoders import decode_finnhub_candles, decode_alphavantage_csv, decode_coinapi_ohlcv, \
+    decode_json_records
+from app.utils.cleaning.ohlcv_clean import OHLCV_COLUMNS
+from app.utils.cleaning.datetime_clean import date_to_utc_unixtime
+
+
+def test_finnhub_candles_decode_to_the_canonical_frame():
+    frame = decode_finnhub_candles(json.dumps(
+        {"s": "ok", "t": [1641220200, 1641220140], "o": [2, 1], "h": [3, 2], "l": [1, 0.5], "c": [2.5, 1.5],
+         "v": [200, 100]}), "AAPL")
+
+    assert frame.columns.tolist() == OHLCV_COLUMNS
+    assert frame.date.dtype == "int64" and frame.open.dtype == "float64"
+    assert frame.date.tolist() == [1641220140, 1641220200]
+    assert frame.close.tolist() == [1.5, 2.5] and frame.volume.tolist() == [100.0, 200.0]
+    assert set(frame.symbol) == {"AAPL"}
+
+
+@pytest.mark.parametrize("eastern, utc", [
+    ("2022-01-03 09:31:00", "2022-01-03 14:31:00"),     # EST
+    ("2022-07-01 09:31:00", "2022-07-01 13:31:00"),     # EDT
+])
+def test_a_minute_decodes_to_the_same_epoch_from_both_providers(eastern, utc):
+    epoch = int(pd.Timestamp(utc, tz="UTC").timestamp())
+    finnhub = decode_finnhub_candles(json.dumps(
+        {"s": "ok", "t": [epoch], "o": [1.0], "h": [2.0], "l": [0.5], "c": [1.5], "v": [100]}), "AAPL")
+    alphavantage = decode_alphavantage_csv(
+        f"time,open,high,low,close,volume\n{eastern},1.0,2.0,0.5,1.5,100\n", "AAPL")
+
+    assert alphavantage.date.tolist() == finnhub.date.tolist() == [epoch]
+
+
+def test_alphavantage_csv_decodes_newest_first_rows_in_date_order():
+    frame = decode_alphavantage_csv(
+        "time,open,high,low,close,volume\n"
+        "2022-01-03 09:32:00,2.0,3.0,1.0,2.5,200\n"
+        "2022-01-03 09:31:00,1.0,2.0,0.5,1.5,100\n", "AAPL")
+
+    assert frame.columns.tolist() == OHLCV_COLUMNS
+    assert frame.date.diff().dropna().tolist() == [60]
+    assert frame.open.tolist() == [1.0, 2.0] and frame.volume.dtype == "float64"
+    assert decode_alphavantage_csv(b"", "AAPL").empty
+
+
+def test_alphavantage_daily_bars_stay_on_utc_midnight():
+    daily = decode_alphavantage_csv(
+        "timestamp,open,high,low,close,volume\n2022-01-03,1.0,2.0,0.5,1.5,100\n", "AAPL", timezone=None)
+    assert daily.date.tolist() == [date_to_utc_unixtime("2022-01-03", "%Y-%m-%d")]
+
+
+def test_coinapi_bars_are_dated_by_period_start():
+    bars = [{"time_period_start": f"2022-01-01T00:{minute:02d}:00.0000000Z",
+             "time_period_end": f"2022-01-01T00:{minute + 1:02d}:00.0000000Z",
+             "price_open": 1.0 + minute, "price_high": 2.0, "price_low": 0.5, "price_close": 1.5,
+             "volume_traded": 10.0} for minute in (1, 0)]
+    frame = decode_coinapi_ohlcv(json.dumps(bars), "BTC")
+
+    start = date_to_utc_unixtime("2022-01-01", "%Y-%m-%d")
+    assert frame.columns.tolist() == OHLCV_COLUMNS
+    assert frame.date.tolist() == [start, start + 60]
+    assert frame.open.tolist() == [1.0, 2.0]
+    assert decode_coinapi_ohlcv("[]", "BTC").empty
+
+
+def test_coinapi_error_payloads_raise():
+    with pytest.raises(ValueError, match="Invalid API key"):
+        decode_coinapi_ohlcv(json.dumps({"error": "Invalid API key"}), "BTC")
+
+
+def test_symbol_listings_decode_without_eval():
+    listing = decode_json_records(b'[{"symbol": "AAPL", "description": "__import__(\'os\')"}]')
+    assert listing.to_dict("records") == [{"symbol": "AAPL", "description": "__import__('os')"}]
+
+
+def test_coinapi_exchange_symbols_keep_usdt_spot_pairs(provider_env, fake_session):
+    from app.scrapers.trading.aggregates.coin import CoinapiAssetScraperClient
+    symbols = [
+        {"symbol_id": "OKEX_SPOT_BTC_USDT", "symbol_type": "SPOT", "asset_id_quote": "USDT"},
+        {"symbol_id": "OKEX_SPOT_BTC_USDC", "symbol_type": "SPOT", "asset_id_quote": "USDC"},
+        {"symbol_id": "OKEX_PERP_BTC_USDT", "symbol_type": "PERPETUAL", "asset_id_quote": "USDT"},
+    ]
+    session = fake_session("app.scrapers.trading.aggregates.coin", [json.dumps(symbols).encode()])
+
+    spot = asyncio.run(CoinapiAssetScraperClient().get_cryptoexchange_symbols("OKEX"))
+    assert spot.symbol_id.tolist() == ["OKEX_SPOT_BTC_USDT"]
+    assert session.urls == ["https://rest.coinapi.io/v1/symbols?filter_exchange_id=OKEX"]
+
+
+def test_esr_commodities_are_decoded_into_lookups(provider_env, monkeypatch):
+    from app.scrapers.economics.agriculture import esr
+    commodities = [{"commodityCode": 401, "commodityName": "Corn", "unitId": 1},
+                   {"commodityCode": 801, "commodityName": "Soybeans", "unitId": 1}]
+    monkeypatch.setattr(esr.requests, "get", lambda **kwargs: SimpleNamespace(text=json.dumps(commodities)))
+
+    client = esr.ESR()
+    assert client.get_commodity_id("Corn") == 401
+    assert client.commodity_id_to_name == {401: "Corn", 801: "Soybeans"}
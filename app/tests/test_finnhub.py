@@ -0,0 +1,45 @@
+import json
+import asyncio
+import pytest
+from urllib.parse import urlparse, parse_qs
+
+from app.utils.cleaning.datetime_clean import date_to_utc_unixtime
+
+DAY = 24 * 60 * 60
+
+
+@pytest.mark.parametrize("resolution", ["1", "5", "15", "30", "60", "D", "W", "M"])
+def test_windows_are_contiguous_and_within_the_candle_limit(trading_client, resolution):
+    from app.scrapers.trading.aggregates.finnhub import MAX_CANDLES, CANDLE_SECONDS
+    fromdate = date_to_utc_unixtime("2020-01-01", "%Y-%m-%d")
+    todate = date_to_utc_unixtime("2022-03-15", "%Y-%m-%d") + DAY - 1
+    windows = trading_client.finnhub_client.plan_windows(fromdate, todate, resolution)
+
+    assert windows[0][0] == fromdate and windows[-1][1] == todate
+    assert all(window_to + 1 == next_from for (_, window_to), (next_from, _) in zip(windows, windows[1:]))
+    assert all(window_from % DAY == 0 for window_from, _ in windows)
+    assert all((window_to - window_from + 1) // CANDLE_SECONDS[resolution] <= MAX_CANDLES
+               for window_from, window_to in windows)
+
+
+def test_windows_are_stitched_without_overlaps_up_to_to_date(trading_client):
+    requested = []
+
+    async def minute_candles(url):
+        # Every window answers one bar past its end, like a provider rounding the range up
+        query = parse_qs(urlparse(url).query)
+        window_from, window_to = int(query["from"][0]), int(query["to"][0])
+        requested.append((window_from, window_to))
+        dates = list(range(window_from, window_to + 61, 60))
+        return json.dumps({"s": "ok", "t": dates, "o": [1.0] * len(dates), "h": [2.0] * len(dates),
+                           "l": [0.5] * len(dates), "c": [1.5] * len(dates), "v": [100] * len(dates)})
+
+    trading_client.finnhub_client._get_text = minute_candles
+    frame = asyncio.run(trading_client.finnhub_client.get_historical_data(
+        "AAPL", from_date="2022-01-01", to_date="2022-01-20", resolution="1MIN", data_format="frame"))
+
+    start, end = date_to_utc_unixtime("2022-01-01", "%Y-%m-%d"), date_to_utc_unixtime("2022-01-21", "%Y-%m-%d")
+    assert len(requested) > 1 and requested[-1][1] == end - 1
+    assert frame.date.is_unique and frame.date.is_monotonic_increasing
+    assert frame.date.iloc[0] == start and frame.date.iloc[-1] == end - 60
+    assert len(frame) == 20 * 24 * 60
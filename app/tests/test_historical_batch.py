@@ -0,0 +1,56 @@
+import asyncio
+import pandas as pd
+
+
+def fake_frames(failing, delay=0.01):
+    running, most_running = [0], [0]
+
+    async def get_historical_frame(ticker, from_date, to_date, resolution="1D", instrument="stock"):
+        running[0] += 1
+        most_running[0] = max(most_running[0], running[0])
+        try:
+            await asyncio.sleep(delay)
+            if ticker in failing:
+                raise ValueError(f"{ticker} is not listed")
+            return pd.DataFrame({"date": [1, 2], "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5,
+                                 "volume": 100.0, "symbol": ticker})
+        finally:
+            running[0] -= 1
+
+    return get_historical_frame, most_running
+
+
+def test_batches_fan_out_within_the_concurrency_bound(trading_client):
+    trading_client.get_historical_frame, most_running = fake_frames(failing=[])
+    requests = [{"ticker": f"T{index}", "from_date": "2022-01-03", "to_date": "2022-01-07", "resolution": "D"}
+                for index in range(10)]
+
+    frame, statuses = asyncio.run(trading_client.get_historical_batch(requests, max_concurrency=4))
+
+    assert most_running[0] == 4
+    assert len(frame) == 20 and frame.symbol.unique().tolist() == [f"T{index}" for index in range(10)]
+    assert set(frame.resolution) == {"D"} and set(frame.instrument) == {"stock"}
+    assert [status["status"] for status in statuses] == ["success"] * 10
+
+
+def test_failed_tickers_get_their_own_status(trading_client):
+    trading_client.get_historical_frame, _ = fake_frames(failing=["NOPE"])
+    requests = [{"ticker": ticker, "from_date": "2022-01-03", "to_date": "2022-01-07", "instrument": "stock"}
+                for ticker in ["AAPL", "NOPE", "MSFT"]]
+
+    frame, statuses = asyncio.run(trading_client.get_historical_batch(requests))
+
+    assert frame.symbol.unique().tolist() == ["AAPL", "MSFT"]
+    assert [(status["ticker"], status["status"], status["rows"]) for status in statuses] == [
+        ("AAPL", "success", 2), ("NOPE", "failed", 0), ("MSFT", "success", 2)]
+    assert statuses[1]["detail"] == "NOPE is not listed"
+
+
+def test_a_batch_of_failures_is_an_empty_frame(trading_client):
+    trading_client.get_historical_frame, _ = fake_frames(failing=["NOPE"])
+
+    frame, statuses = asyncio.run(trading_client.get_historical_batch(
+        [{"ticker": "NOPE", "from_date": "2022-01-03", "to_date": "2022-01-07"}]))
+
+    assert frame.empty and {"resolution", "instrument"} <= set(frame.columns)
+    assert statuses[0]["status"] == "failed"
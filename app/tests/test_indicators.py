@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import pandas as pd
+
+from app.utils.analytics.indicators import ema, rsi, sma, rolling_std, vwap, compute_indicator
+
+
+def test_ema_matches_recursive_definition():
+    close = 100 + np.random.default_rng(0).standard_normal(5_000).cumsum()
+    for span in (2, 12, 200):
+        expected = pd.Series(close).ewm(span=span, adjust=False, min_periods=span).mean().to_numpy()
+        np.testing.assert_allclose(ema(close, span), expected, rtol=1e-10)
+        assert np.isnan(ema(close, span)[:span - 1]).all()
+
+
+def test_rolling_std_matches_pandas():
+    close = 10_000 + np.random.default_rng(1).standard_normal(5_000).cumsum()
+    close[2_000:2_100] = close[2_000]
+    for window in (1, 2, 20, 500):
+        expected = pd.Series(close).rolling(window).std(ddof=0).to_numpy()
+        actual = rolling_std(close, window, block=700)
+        # pandas' running update drifts on near flat windows, by about 1e-9 of the price level
+        np.testing.assert_allclose(actual, expected, rtol=1e-6, atol=1e-4)
+        np.testing.assert_allclose(actual[window - 1:], np.lib.stride_tricks.sliding_window_view(
+            close, window).std(axis=1), rtol=1e-9, atol=1e-8)
+    assert (rolling_std(close, 20)[2_019:2_100] == 0).all()
+    assert np.isnan(rolling_std(close[:10], 20)).all()
+
+
+def test_rolling_kernels_leave_unfilled_windows_nan():
+    close = np.arange(1, 31, dtype=float)
+    assert np.isnan(sma(close, 5)[:4]).all()
+    assert sma(close, 5)[4] == 3.0
+    assert (rsi(close, 14)[14:] == 100).all()
+
+
+def test_macd_is_null_until_its_averages_are_warmed_up():
+    close = 100 + np.random.default_rng(2).standard_normal(100).cumsum()
+    columns = compute_indicator(pd.DataFrame({"close": close}), "macd", {"fast": 3, "slow": 6, "signal": 4})
+
+    fast = pd.Series(close).ewm(span=3, adjust=False).mean()
+    line = fast - pd.Series(close).ewm(span=6, adjust=False).mean()
+    signal = line.ewm(span=4, adjust=False).mean()
+    assert np.isnan(columns["macd_3_6_4"][:5]).all() and not np.isnan(columns["macd_3_6_4"][5:]).any()
+    assert np.isnan(columns["macd_signal_3_6_4"][:8]).all() and not np.isnan(columns["macd_signal_3_6_4"][8:]).any()
+    np.testing.assert_allclose(columns["macd_3_6_4"][5:], line[5:], rtol=1e-10)
+    np.testing.assert_allclose(columns["macd_signal_3_6_4"][8:], signal[8:], rtol=1e-10)
+    np.testing.assert_allclose(columns["macd_hist_3_6_4"][8:], (line - signal)[8:], rtol=1e-10)
+
+
+def test_vwap_restarts_every_day():
+    frame = pd.DataFrame({
+        "date": [0, 3600, 86400, 90000],
+        "high": [10.0, 20.0, 30.0, 40.0],
+        "low": [10.0, 20.0, 30.0, 40.0],
+        "close": [10.0, 20.0, 30.0, 40.0],
+        "volume": [1.0, 3.0, 1.0, 1.0],
+    })
+    np.testing.assert_allclose(vwap(frame, "D"), [10.0, 17.5, 30.0, 35.0])
+    np.testing.assert_allclose(compute_indicator(frame, "vwap", {"anchor": "d"})["vwap_d"], [10.0, 17.5, 30.0, 35.0])
+    np.testing.assert_allclose(vwap(frame, "None"), [10.0, 17.5, 20.0, 140 / 6])
+    with pytest.raises(ValueError, match="Unknown vwap anchor"):
+        vwap(frame, "W")
+    assert list(compute_indicator(frame, "macd", {})) == ["macd_12_26_9", "macd_signal_12_26_9", "macd_hist_12_26_9"]
@@ -0,0 +1,75 @@
+import json
+import asyncio
+import threading
+import pytest
+
+from app.utils.ratelimit.keypool import KeyPoolScheduler
+
+
+def test_key_pool_hands_out_key_with_most_budget(tmp_path):
+    key_pool = KeyPoolScheduler("test", keys=["a", "b"], limits=[
+                                (2, 60), (3, 24 * 60 * 60)], state_dir=str(tmp_path))
+
+    first, _ = key_pool.try_acquire()
+    second, _ = key_pool.try_acquire()
+    assert {first, second} == {"a", "b"}
+
+    key_pool.mark_exhausted("a")
+    assert key_pool.try_acquire()[0] == "b"
+
+    key, wait = key_pool.try_acquire()
+    assert key is None and 0 < wait <= 30
+
+
+def test_key_pool_state_is_shared_between_instances(tmp_path):
+    limits = [(1, 60)]
+    KeyPoolScheduler("shared", keys=["a"], limits=limits,
+                     state_dir=str(tmp_path)).try_acquire()
+
+    other_worker = KeyPoolScheduler(
+        "shared", keys=["a"], limits=limits, state_dir=str(tmp_path))
+    assert other_worker.try_acquire()[0] is None
+
+
+def test_key_pool_waits_for_recovery(tmp_path):
+    key_pool = KeyPoolScheduler("wait", keys=["a"], limits=[
+                                (1, 0.2)], state_dir=str(tmp_path))
+    key_pool.try_acquire()
+    assert asyncio.run(key_pool.acquire()) == "a"
+
+
+def test_key_pool_bookkeeping_runs_off_the_event_loop(tmp_path):
+    key_pool = KeyPoolScheduler("executor", keys=["a"], limits=[
+                                (5, 60)], state_dir=str(tmp_path))
+    try_acquire, threads = key_pool.try_acquire, []
+
+    def recording_try_acquire():
+        threads.append(threading.get_ident())
+        return try_acquire()
+
+    key_pool.try_acquire = recording_try_acquire
+
+    async def acquire():
+        return threading.get_ident(), await key_pool.acquire()
+
+    loop_thread, key = asyncio.run(acquire())
+    assert key == "a"
+    assert threads and loop_thread not in threads
+
+
+def test_alphavantage_only_rotates_keys_on_throttle_notes(trading_client, fake_session):
+    alphavantage_client = trading_client.alphavantage_client
+    csv = b"time,open,high,low,close,volume\n2022-01-03 09:31:00,1.0,2.0,0.5,1.5,100\n"
+    note = json.dumps({"Note": "Our standard API call frequency is 5 calls per minute"}).encode()
+    invalid = json.dumps({"Error Message": "Invalid API call. Please retry or visit the documentation"}).encode()
+
+    session = fake_session("app.scrapers.trading.aggregates.alphavantage", [note, csv])
+    frame = asyncio.run(alphavantage_client._get_csv("AAPL", "function=TIME_SERIES_INTRADAY", "slice year1month1"))
+    assert len(frame) == 1 and len(session.urls) == 2
+    assert sorted(calls[60] for calls in alphavantage_client.key_pool.remaining().values())[:2] == [0, 4]
+
+    session = fake_session("app.scrapers.trading.aggregates.alphavantage", [invalid])
+    with pytest.raises(ValueError, match="Invalid API call"):
+        asyncio.run(alphavantage_client._get_csv("NOPE", "function=TIME_SERIES_INTRADAY", "slice year1month1"))
+    assert len(session.urls) == 1
+    assert sorted(calls[60] for calls in alphavantage_client.key_pool.remaining().values())[:4] == [0, 4, 4, 5]
@@ -0,0 +1,119 @@
+import os
+import json
+import asyncio
+import pytest
+import pandas as pd
+import pyarrow as pa
+
+from app.utils.cleaning.decoders import decode_finnhub_candles
+from app.utils.cleaning.datetime_clean import date_to_utc_unixtime
+from app.utils.storage.ohlcv_cache import OHLCVCache, OHLCVCacheKey, merge_intervals, subtract_intervals
+
+DAY = 24 * 60 * 60
+
+
+def make_bars(dates):
+    return pd.DataFrame({
+        "date": dates,
+        "open": [1.0] * len(dates),
+        "high": [2.0] * len(dates),
+        "low": [0.5] * len(dates),
+        "close": [1.5] * len(dates),
+        "volume": [100] * len(dates),
+        "symbol": ["AAPL"] * len(dates),
+    })
+
+
+def test_interval_arithmetic():
+    assert merge_intervals([(5, 10), (0, 3), (3, 4), (8, 12)]) == [(0, 4), (5, 12)]
+    assert subtract_intervals((0, 10), [(2, 4), (6, 8)]) == [(0, 2), (4, 6), (8, 10)]
+    assert subtract_intervals((0, 10), [(0, 10)]) == []
+
+
+def test_cache_only_reports_uncovered_gaps(tmp_path):
+    cache = OHLCVCache(cache_dir=str(tmp_path))
+    key = OHLCVCacheKey(ticker="AAPL", resolution="D", instrument="stock")
+
+    assert cache.missing_ranges(key, 0, 100) == [(0, 100)]
+
+    cache.merge(key, make_bars([10, 20, 30]), (0, 50))
+    cache.merge(key, make_bars([30, 40, 60]), (30, 70))
+
+    assert cache.missing_ranges(key, 0, 100) == [(70, 100)]
+    assert cache.version(key) == 2
+
+    bars = cache.read(key, 15, 60)
+    assert bars.date.tolist() == [20, 30, 40]
+    assert bars.date.dtype == "int64"
+
+
+def test_fill_in_merges_append_parts_instead_of_rewriting(tmp_path):
+    cache = OHLCVCache(cache_dir=str(tmp_path), max_parts=3)
+    key = OHLCVCacheKey(ticker="AAPL", resolution="1MIN", instrument="stock")
+    cache.merge(key, make_bars([0, 60, 180]), (0, 240))
+    data_file = os.stat(cache._data_path(key))
+
+    # Settled bars are kept, only the new dates are written, to a part file of their own
+    live = make_bars([180, 120, 240]).assign(close=9.0)
+    cache.merge(key, live, (0, 0), replace=False)
+    assert os.stat(cache._data_path(key)).st_ino == data_file.st_ino
+    assert len(cache._part_paths(key)) == 1
+
+    bars = cache.read(key)
+    assert bars.date.tolist() == [0, 60, 120, 180, 240]
+    assert bars.close.tolist() == [1.5, 1.5, 9.0, 1.5, 9.0]
+    streamed = pa.Table.from_batches(list(cache.iter_batches(key, 0, 300, batch_size=2)))
+    assert streamed.column("date").to_pylist() == [0, 60, 120, 180, 240]
+    assert streamed.column("close").to_pylist() == [1.5, 1.5, 9.0, 1.5, 9.0]
+
+    # A fill in that brings nothing new writes nothing
+    cache.merge(key, make_bars([60]), (0, 0), replace=False)
+    assert len(cache._part_paths(key)) == 1
+
+
+def test_parts_are_compacted_into_the_series(tmp_path):
+    cache = OHLCVCache(cache_dir=str(tmp_path), max_parts=3)
+    key = OHLCVCacheKey(ticker="AAPL", resolution="1MIN", instrument="stock")
+
+    for minute in range(2):
+        cache.merge(key, make_bars([60 * minute]), (0, 0), replace=False)
+    assert len(cache._part_paths(key)) == 2
+    assert [date for batch in cache.iter_batches(key, 0, 300) for date in batch.column("date").to_pylist()] == [0, 60]
+
+    cache.merge(key, make_bars([120]), (0, 0), replace=False)
+    assert cache._part_paths(key) == []
+    assert cache.read(key).date.tolist() == [0, 60, 120]
+
+    # Replacing merges fold pending parts in as well, and win on equal dates
+    cache.merge(key, make_bars([180]), (0, 0), replace=False)
+    cache.merge(key, make_bars([180, 240]).assign(close=3.0), (0, 300))
+    assert cache._part_paths(key) == []
+    assert cache.read(key).close.tolist() == [1.5, 1.5, 1.5, 3.0, 3.0]
+
+
+def test_finnhub_error_payloads_raise_and_no_data_is_empty():
+    with pytest.raises(ValueError, match="API limit reached"):
+        decode_finnhub_candles(json.dumps({"error": "API limit reached. Please try again later."}), "AAPL")
+    with pytest.raises(ValueError):
+        decode_finnhub_candles(json.dumps({"s": "error"}), "AAPL")
+
+    assert decode_finnhub_candles(json.dumps({"s": "no_data"}), "AAPL").empty
+
+
+def test_provider_errors_do_not_extend_cache_coverage(trading_client):
+    async def rate_limited(url):
+        return json.dumps({"error": "API limit reached. Please try again later."})
+
+    async def unavailable(**kwargs):
+        raise ConnectionError("alphavantage down")
+
+    trading_client.finnhub_client._get_text = rate_limited
+    trading_client.alphavantage_client.get_historical_data = unavailable
+
+    with pytest.raises(ValueError):
+        asyncio.run(trading_client.get_historical_frame(
+            ticker="AAPL", from_date="2022-01-03", to_date="2022-01-07", resolution="D"))
+
+    start = date_to_utc_unixtime("2022-01-03", "%Y-%m-%d")
+    key = OHLCVCacheKey(ticker="AAPL", resolution="D", instrument="stock")
+    assert trading_client.cache.missing_ranges(key, start, start + 5 * DAY) == [(start, start + 5 * DAY)]
@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+
+from app.scrapers.trading.routing import ProviderRouter, provider_request
+
+
+def provider(name, delay, calls, fail=False, queued=0):
+    async def fetch(**kwargs):
+        calls.append(name)
+        await asyncio.sleep(queued)     # Waiting on the provider's rate limiter
+        with provider_request():
+            await asyncio.sleep(delay)
+        if fail:
+            raise ConnectionError(f"{name} down")
+        return name
+    return name, fetch
+
+
+def test_slow_provider_is_hedged_and_the_fastest_answer_wins():
+    calls = []
+    router = ProviderRouter(min_hedge_delay=0.05, default_latency=0.05)
+    candidates = [provider("finnhub", 0.5, calls), provider("alphavantage", 0.01, calls)]
+
+    assert asyncio.run(router.fetch(candidates)) == "alphavantage"
+    assert calls == ["finnhub", "alphavantage"]
+    # The cancelled call counts as a censored latency sample, not as an error
+    assert router.stats["finnhub"].calls == 1
+    assert router.stats["finnhub"].percentile(95, None) >= 0.05
+    assert router.stats["finnhub"].error_rate() == 0
+
+
+def test_time_queued_on_the_rate_limiter_is_not_latency():
+    calls = []
+    router = ProviderRouter(min_hedge_delay=0.05, default_latency=0.05)
+    candidates = [provider("finnhub", 0.01, calls, queued=0.3), provider("alphavantage", 0.01, calls)]
+
+    assert asyncio.run(router.fetch(candidates)) == "finnhub"
+    # Not hedged while queued, and only the request itself is timed
+    assert calls == ["finnhub"]
+    assert router.stats["finnhub"].percentile(95, None) < 0.1
+
+
+def test_failing_provider_falls_through_and_is_ranked_down():
+    calls = []
+    router = ProviderRouter(min_calls=1, default_latency=1)
+    candidates = [provider("finnhub", 0, calls, fail=True), provider("alphavantage", 0, calls)]
+
+    assert asyncio.run(router.fetch(candidates)) == "alphavantage"
+    assert router.stats["finnhub"].error_rate() == 1
+    assert [name for name, _ in router.rank(candidates)] == ["alphavantage", "finnhub"]
+
+
+def test_every_provider_failing_raises():
+    calls = []
+    router = ProviderRouter()
+    candidates = [provider("finnhub", 0, calls, fail=True), provider("alphavantage", 0, calls, fail=True)]
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(router.fetch(candidates))
+    assert calls == ["finnhub", "alphavantage"]
@@ -0,0 +1,100 @@
+import json
+import asyncio
+import pandas as pd
+from aiohttp import web
+
+from app.scrapers.trading.quotes.hub import QuoteHub
+from app.scrapers.trading.aggregates.session import close_client_session
+from app.utils.storage.ohlcv_cache import OHLCVCache, OHLCVCacheKey
+
+MINUTE = 1643720400
+
+
+async def start_finnhub_stand_in(trades):
+    ''' Local websocket standing in for wss://ws.finnhub.io, sends the trades once a symbol is subscribed '''
+    subscriptions = []
+
+    async def handler(request):
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        async for message in websocket:
+            payload = json.loads(message.data)
+            subscriptions.append((payload["type"], payload["symbol"]))
+            if payload["type"] == "subscribe":
+                await websocket.send_str(json.dumps({"type": "ping"}))
+                await websocket.send_str(json.dumps({"type": "trade", "data": [
+                    trade for trade in trades if trade["s"] == payload["symbol"]]}))
+        return websocket
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"ws://127.0.0.1:{port}/", subscriptions
+
+
+def test_hub_fans_out_ticks_and_rolls_bars_into_the_cache(tmp_path):
+    trades = [
+        {"s": "AAPL", "p": 170.0, "v": 10, "t": (MINUTE + 1) * 1000},
+        {"s": "AAPL", "p": 171.0, "v": 5, "t": (MINUTE + 30) * 1000},
+        {"s": "AAPL", "p": 169.5, "v": 1, "t": (MINUTE + 61) * 1000},
+        {"s": "MSFT", "p": 300.0, "v": 2, "t": (MINUTE + 2) * 1000},
+    ]
+
+    async def scenario():
+        runner, url, subscriptions = await start_finnhub_stand_in(trades)
+        cache = OHLCVCache(cache_dir=str(tmp_path))
+        hub = QuoteHub(cache=cache, feed_url=url)
+        try:
+            first = await hub.subscribe(["aapl"])
+            second = await hub.subscribe(["AAPL"])
+
+            events = []
+            while len([event for event in events if event["type"] == "trade"]) < 3:
+                events += await asyncio.wait_for(first.next_events(), 5)
+            shared = await asyncio.wait_for(second.next_events(), 5)
+
+            await first.close()
+            await second.close()
+            await hub.flush_bars(now=MINUTE + 120)
+            await hub.persist_bars()
+            return events, shared, subscriptions, cache.read(OHLCVCacheKey("AAPL", "1MIN", "stock"))
+        finally:
+            await hub.close()
+            await runner.cleanup()
+            await close_client_session()
+
+    events, shared, subscriptions, cached = asyncio.run(scenario())
+
+    assert [event["price"] for event in events if event["type"] == "trade"] == [170.0, 171.0, 169.5]
+    assert [event["price"] for event in shared if event["type"] == "trade"] == [170.0, 171.0, 169.5]
+    assert subscriptions == [("subscribe", "AAPL"), ("unsubscribe", "AAPL")]
+
+    first_bar = [event for event in events if event["type"] == "bar"][0]
+    assert (first_bar["open"], first_bar["high"], first_bar["close"], first_bar["volume"]) == (170.0, 171.0, 171.0, 15.0)
+    assert cached.date.tolist() == [MINUTE, MINUTE + 60]
+
+
+def test_live_bars_never_overwrite_provider_bars(tmp_path):
+    cache = OHLCVCache(cache_dir=str(tmp_path))
+    key = OHLCVCacheKey("AAPL", "1MIN", "stock")
+    settled = {"date": [MINUTE], "open": [1.0], "high": [1.0], "low": [1.0], "close": [1.0], "volume": [100.0],
+               "symbol": ["AAPL"]}
+    cache.merge(key, pd.DataFrame(settled), (MINUTE, MINUTE + 60))
+
+    async def scenario():
+        hub = QuoteHub(cache=cache, feed_url="ws://127.0.0.1:9/")
+        hub.publish([{"symbol": "AAPL", "price": 2.0, "volume": 5, "timestamp": MINUTE + 1},
+                     {"symbol": "AAPL", "price": 3.0, "volume": 5, "timestamp": MINUTE + 61}])
+        await hub.flush_bars(now=MINUTE + 120)
+        await hub.persist_bars()
+
+    asyncio.run(scenario())
+
+    cached = cache.read(key)
+    assert cached.date.tolist() == [MINUTE, MINUTE + 60]
+    assert cached.close.tolist() == [1.0, 3.0]
+    assert cache.coverage(key) == [(MINUTE, MINUTE + 60)]
@@ -0,0 +1,27 @@
+import asyncio
+import pandas as pd
+
+from app.utils.storage.ohlcv_cache import OHLCVCacheKey
+
+DAY = 24 * 60 * 60
+
+
+def test_read_through_is_only_consulted_for_settled_gaps(trading_client):
+    class RecordingReadThrough:
+        def __init__(self):
+            self.requested = []
+
+        def load(self, key, gaps):
+            self.requested += gaps
+            return []
+
+    async def provider_fetch(from_date, to_date):
+        return pd.DataFrame(columns=["date", "open", "high", "low", "close", "volume", "symbol"])
+
+    trading_client.read_through = RecordingReadThrough()
+    key = OHLCVCacheKey(ticker="AAPL", resolution="D", instrument="stock")
+    today = int(pd.Timestamp.utcnow().normalize().timestamp())
+    asyncio.run(trading_client._fill_cache_gaps(key, today - 10 * DAY, today + DAY, provider_fetch))
+
+    assert trading_client.read_through.requested
+    assert all(gap_end <= today for _, gap_end in trading_client.read_through.requested)
@@ -0,0 +1,62 @@
+import pandas as pd
+import pyarrow as pa
+
+from app.utils.analytics.resample import resample_ohlcv, resample_batches, bucket_bounds
+from app.utils.cleaning.ohlcv_clean import normalize_resolution
+from app.utils.cleaning.datetime_clean import date_to_utc_unixtime
+
+DAY = 24 * 60 * 60
+
+
+def make_daily_bars(from_date: str, days: int):
+    start = date_to_utc_unixtime(from_date, "%Y-%m-%d")
+    return pd.DataFrame({
+        "date": [start + i * DAY for i in range(days)],
+        "open": [float(i) for i in range(days)],
+        "high": [float(i) + 1 for i in range(days)],
+        "low": [float(i) - 1 for i in range(days)],
+        "close": [float(i) + 0.5 for i in range(days)],
+        "volume": [10.0] * days,
+        "symbol": ["AAPL"] * days,
+    })
+
+
+def test_normalize_resolution():
+    assert normalize_resolution("1D") == "D"
+    assert normalize_resolution("15M") == "15M"
+    assert normalize_resolution("1min") == "1MIN"
+
+
+def test_a_lowercase_m_is_minutes_and_an_uppercase_m_months():
+    assert normalize_resolution("15m") == "15MIN"
+    assert normalize_resolution("m") == "1MIN"
+    assert normalize_resolution("15M") == "15M"
+    assert normalize_resolution("M") == "M"
+
+
+def test_weekly_and_monthly_buckets():
+    daily = make_daily_bars("2022-01-03", 35)   # monday 2022-01-03 to 2022-02-06
+
+    weekly = resample_ohlcv(daily, "W")
+    assert weekly.shape[0] == 5
+    assert weekly.date.iloc[0] == date_to_utc_unixtime("2022-01-03", "%Y-%m-%d")
+    assert weekly.iloc[0][["open", "high", "low", "close", "volume"]].tolist() == [0.0, 7.0, -1.0, 6.5, 70.0]
+
+    monthly = resample_ohlcv(daily, "M")
+    assert monthly.date.tolist() == [date_to_utc_unixtime("2022-01-01", "%Y-%m-%d"),
+                                     date_to_utc_unixtime("2022-02-01", "%Y-%m-%d")]
+    assert monthly.volume.tolist() == [290.0, 60.0]
+
+
+def test_batches_match_frame_resampling():
+    daily = make_daily_bars("2021-11-15", 120)
+    batches = pa.Table.from_pandas(daily, preserve_index=False).to_batches(max_chunksize=7)
+
+    streamed = pa.Table.from_batches(list(resample_batches(batches, "M"))).to_pandas()
+    pd.testing.assert_frame_equal(streamed, resample_ohlcv(daily, "M"))
+
+
+def test_bucket_bounds_cover_whole_bars():
+    start = date_to_utc_unixtime("2022-01-10", "%Y-%m-%d")
+    assert bucket_bounds(start, start + DAY, "M") == (
+        date_to_utc_unixtime("2022-01-01", "%Y-%m-%d"), date_to_utc_unixtime("2022-02-01", "%Y-%m-%d"))
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+
+from app.middleware.decorators.single_flight import SingleFlight, single_flight
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    calls = []
+
+    @single_flight(key=lambda ticker: ticker.upper())
+    async def fetch(ticker):
+        calls.append(ticker)
+        await asyncio.sleep(0.05)
+        return {"ticker": ticker.upper()}
+
+    async def burst():
+        return await asyncio.gather(*[fetch(ticker) for ticker in ["aapl", "AAPL", "aapl", "MSFT"]])
+
+    results = asyncio.run(burst())
+    assert len(calls) == 2
+    assert results[0] is results[1] is results[2]
+    assert fetch.flights.in_flight() == 0
+
+
+def test_errors_reach_every_caller_and_release_the_key():
+    flights = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("provider down")
+
+    async def burst():
+        return await asyncio.gather(*[flights.do("AAPL", failing) for _ in range(3)], return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(burst()))
+    assert flights.in_flight() == 0
+
+
+def test_cancelled_caller_does_not_cancel_the_call():
+    flights = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return 1
+
+    async def scenario():
+        first = asyncio.ensure_future(flights.do("AAPL", slow))
+        second = asyncio.ensure_future(flights.do("AAPL", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == 1
@@ -0,0 +1,76 @@
+import json
+import pytest
+import pyarrow as pa
+
+from app.utils.cleaning.ohlcv_clean import OHLCV_ARROW_SCHEMA
+from app.utils.responses.streaming import negotiate_stream_format, iter_ndjson, iter_arrow_ipc, log_stream_errors, \
+    _ChunkSink
+
+
+def make_batch(dates):
+    return pa.RecordBatch.from_pydict({
+        "date": dates, "open": [1.0] * len(dates), "high": [2.0] * len(dates), "low": [0.5] * len(dates),
+        "close": [1.5] * len(dates), "volume": [100.0] * len(dates), "symbol": ["AAPL"] * len(dates),
+    }, schema=OHLCV_ARROW_SCHEMA)
+
+
+def test_stream_format_is_negotiated_from_the_request_then_the_accept_header():
+    assert negotiate_stream_format("application/x-ndjson", "arrow") == "arrow"
+    assert negotiate_stream_format("application/x-ndjson") == "ndjson"
+    assert negotiate_stream_format("application/vnd.apache.arrow.stream, */*") == "arrow"
+    assert negotiate_stream_format("application/json") is None
+    assert negotiate_stream_format(None) is None
+
+
+def test_ndjson_round_trip():
+    chunks = list(iter_ndjson([make_batch([1, 2]), make_batch([3])]))
+
+    assert len(chunks) == 2
+    rows = [json.loads(line) for line in b"".join(chunks).decode("utf-8").splitlines()]
+    assert [row["date"] for row in rows] == [1, 2, 3]
+    assert rows[0] == {"date": 1, "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 100.0,
+                       "symbol": "AAPL"}
+
+
+def test_arrow_round_trip():
+    chunks = list(iter_arrow_ipc([make_batch([1, 2]), make_batch([3])], empty_schema=OHLCV_ARROW_SCHEMA))
+
+    # Schema, one chunk per batch, then the end of stream marker
+    assert len(chunks) == 4
+    table = pa.ipc.open_stream(b"".join(chunks)).read_all()
+    assert table.schema == OHLCV_ARROW_SCHEMA
+    assert table.column("date").to_pylist() == [1, 2, 3]
+
+
+def test_an_empty_range_is_still_a_valid_arrow_stream():
+    table = pa.ipc.open_stream(b"".join(iter_arrow_ipc([], empty_schema=OHLCV_ARROW_SCHEMA))).read_all()
+
+    assert table.num_rows == 0
+    assert table.schema == OHLCV_ARROW_SCHEMA
+
+
+def test_chunk_sink_hands_over_each_write_once():
+    sink = _ChunkSink()
+    assert sink.write(b"ab") == 2
+    sink.write(memoryview(b"cd"))
+    sink.flush()
+
+    assert sink.drain() == b"abcd"
+    assert sink.drain() == b""
+    sink.close()
+    assert sink.closed
+
+
+def test_errors_after_the_first_chunk_are_logged_and_abort_the_stream(monkeypatch):
+    errors = []
+    monkeypatch.setattr("app.utils.responses.streaming.logging.error", errors.append)
+
+    def chunks():
+        yield b"first"
+        raise ValueError("provider went away")
+
+    stream = log_stream_errors(chunks(), "historical AAPL 1MIN")
+    assert next(stream) == b"first"
+    with pytest.raises(ValueError):
+        next(stream)
+    assert errors and "historical AAPL 1MIN" in errors[0]
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from app.utils.storage.symbol_index import SymbolIndex
+
+
+def make_index():
+    return SymbolIndex(pd.DataFrame({
+        "symbol": ["AAPL", "AAP", "TSLA", "MSFT", "BTC"],
+        "description": ["APPLE INC", "ADVANCE AUTO PARTS INC", "TESLA INC", "MICROSOFT CORP", "OKEX_SPOT_BTC_USDT"],
+        "type": ["Common Stock", "Common Stock", "Common Stock", "Common Stock", "Crypto"],
+        "source": ["finnhub", "finnhub", "finnhub", "finnhub", "coinapi"],
+    }))
+
+
+def test_prefix_matches_symbols_shortest_first_then_descriptions():
+    index = make_index()
+    assert [match["symbol"] for match in index.search("aa", limit=2)] == ["AAP", "AAPL"]
+    assert index.search("micro", limit=1)[0]["symbol"] == "MSFT"
+    assert index.search("micro", limit=1)[0]["match"] == "prefix"
+
+
+def test_fuzzy_matches_tolerate_typos():
+    results = make_index().search("tesal", limit=1)
+    assert results[0]["symbol"] == "TSLA"
+    assert results[0]["match"] == "fuzzy"
+
+
+def test_empty_index():
+    assert SymbolIndex().search("AAPL") == []
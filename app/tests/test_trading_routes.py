@@ -0,0 +1,104 @@
+import pytest
+import pandas as pd
+import pyarrow as pa
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils.storage.ohlcv_cache import OHLCVCache
+from app.tests.conftest import FakeCloudUtility
+
+
+@pytest.fixture
+def assets(provider_env, monkeypatch, tmp_path):
+    # The router builds its trading client on import
+    from app.routers.endpoints.trading import assets
+    monkeypatch.setattr(assets.trading_client, "cache", OHLCVCache(cache_dir=str(tmp_path / "routes")))
+    return assets
+
+
+@pytest.fixture
+def client(assets):
+    app = FastAPI()
+    app.include_router(assets.router)
+    return TestClient(app)
+
+
+def test_historical_errors_are_bad_requests(client):
+    response = client.post("/trading/historical", headers={"token": "token"}, json={
+        "ticker": "AAPL", "from_date": "2022-01-03", "to_date": "2022-01-07", "resolution": "7X", "instrument": "Stock"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Resolution is not supported")
+
+
+def test_stream_errors_before_the_first_batch_are_bad_requests(assets, client, monkeypatch):
+    async def unavailable(**kwargs):
+        raise ValueError("AAPL has no 1MIN bars before 2001")
+    monkeypatch.setattr(assets.trading_client, "iter_historical_batches", unavailable)
+
+    response = client.post("/trading/historical", headers={"token": "token"}, json={
+        "ticker": "AAPL", "from_date": "1990-01-03", "to_date": "1990-01-07", "resolution": "1MIN",
+        "instrument": "Stock", "stream_format": "ndjson"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "AAPL has no 1MIN bars before 2001"
+
+
+def test_first_batch_errors_are_bad_requests(assets, client, monkeypatch):
+    def failing_batches():
+        raise ValueError("cache file is corrupt")
+        yield
+
+    async def batches(**kwargs):
+        return failing_batches()
+    monkeypatch.setattr(assets.trading_client, "iter_historical_batches", batches)
+
+    response = client.post("/trading/historical", json={
+        "ticker": "AAPL", "from_date": "2022-01-03", "to_date": "2022-01-07", "resolution": "1MIN",
+        "instrument": "Stock"}, headers={"token": "token", "Accept": "application/vnd.apache.arrow.stream"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "cache file is corrupt"
+
+
+def test_streams_start_with_the_batch_read_before_answering(assets, client, monkeypatch):
+    from app.utils.cleaning.ohlcv_clean import OHLCV_ARROW_SCHEMA
+
+    def batch(dates):
+        return pa.RecordBatch.from_pydict({
+            "date": dates, "open": [1.0] * len(dates), "high": [2.0] * len(dates), "low": [0.5] * len(dates),
+            "close": [1.5] * len(dates), "volume": [100.0] * len(dates), "symbol": ["AAPL"] * len(dates),
+        }, schema=OHLCV_ARROW_SCHEMA)
+
+    async def batches(**kwargs):
+        return iter([batch([1, 2]), batch([3])])
+    monkeypatch.setattr(assets.trading_client, "iter_historical_batches", batches)
+
+    response = client.post("/trading/historical", json={
+        "ticker": "AAPL", "from_date": "2022-01-03", "to_date": "2022-01-07", "resolution": "1MIN",
+        "instrument": "Stock", "stream_format": "arrow"}, headers={"token": "token"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    assert pa.ipc.open_stream(response.content).read_all().column("date").to_pylist() == [1, 2, 3]
+
+
+def test_batch_requests_answer_a_status_per_ticker(assets, client, monkeypatch):
+    async def get_historical_frame(ticker, from_date, to_date, resolution, instrument):
+        if ticker == "NOPE":
+            raise ValueError("NOPE is not listed")
+        return pd.DataFrame({"date": [1, 2], "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5,
+                             "volume": 100.0, "symbol": ticker})
+    monkeypatch.setattr(assets.trading_client, "get_historical_frame", get_historical_frame)
+    monkeypatch.setattr(assets, "CloudUtility", FakeCloudUtility)
+
+    response = client.post("/trading/historical/batch", headers={"token": "token"}, json={"requests": [
+        {"ticker": ticker, "from_date": "2022-01-03", "to_date": "2022-01-07", "resolution": "D", "instrument": "Stock"}
+        for ticker in ["AAPL", "NOPE"]]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["response"]["symbol"] == ["AAPL", "AAPL"]
+    assert [(status["ticker"], status["status"]) for status in body["status"]] == [("AAPL", "success"), ("NOPE", "failed")]
+    assert body["status"][1]["detail"] == "NOPE is not listed"
+    assert body["write_path"].startswith("gs://bucket/")
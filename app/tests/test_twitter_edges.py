@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from app.scrapers.social.twitter_edges import EdgeBuffer
+from app.utils.cleaning.platform.twitter_clean import clean_twitter_follows
+
+
+def test_buffer_grows_and_flushes_int64_columns():
+    edges = EdgeBuffer([320524842, "173149432"], columns=["twitter_followee_id", "twitter_follower_id"], capacity=2)
+    edges.extend(320524842, [1, 2, 3])
+    edges.extend("173149432", [4])
+
+    frame = edges.flush()
+    assert len(edges) == 0
+    assert frame.dtypes.tolist() == [np.int64, np.int64]
+    assert frame.twitter_followee_id.tolist() == [320524842] * 3 + [173149432]
+    assert frame.twitter_follower_id.tolist() == [1, 2, 3, 4]
+
+
+def test_cleaning_only_touches_text():
+    edges = EdgeBuffer(["koo\tlaid", "line\nbreak"], columns=["twitter_followee_id", "twitter_follower_id"])
+    edges.extend("line\nbreak", [7, 8])
+    edges.extend("koo\tlaid", [9])
+
+    frame = clean_twitter_follows(edges.flush())
+    assert isinstance(frame.twitter_followee_id.dtype, pd.CategoricalDtype)
+    assert frame.twitter_followee_id.tolist() == ["line // break", "line // break", "koolaid"]
+    assert frame.twitter_follower_id.dtype == np.int64
+
+    mixed = clean_twitter_follows(pd.DataFrame({"text": ["a\r\nb", 5], "id": [1, 2]}))
+    assert mixed.text.tolist() == ["a // b", 5] and mixed.id.dtype == np.int64
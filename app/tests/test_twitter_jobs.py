@@ -0,0 +1,119 @@
+import time
+import pytest
+from datetime import datetime, timedelta
+
+from app.scrapers.social.twitter_jobs import TwitterScrapeJob, TwitterJobRunner
+from app.tests.conftest import FakeTwitterClient, FakeCloudUtility, FakeCollection
+
+
+@pytest.fixture
+def pool(twitter_pool):
+    return twitter_pool([FakeTwitterClient(), FakeTwitterClient()])
+
+
+def test_job_uploads_each_chunk_and_records_progress(pool):
+    cloud_utility, collection = FakeCloudUtility(), FakeCollection()
+    job = TwitterScrapeJob("followers", user="james201", screen_names=["first", "second"], pool=pool,
+                           chunk_size=4, cloud_utility=cloud_utility, jobs=collection)
+    job.run()
+
+    summary = job.summary()
+    assert summary["status"] == "done"
+    # 2 users x 3 pages x 3 ids, in chunks of at least 4 edges ending on a page
+    assert summary["job_description"]["rows"] == "18"
+    assert summary["job_description"]["users_extracted"] == "2"
+    assert [path.rsplit("/", 1)[1] for path in summary["write_paths"]] == [f"chunk_0000{i}.csv" for i in range(3)]
+    assert sum(len(chunk) for chunk in cloud_utility.objects.values()) == 18
+    assert collection.documents[job.job_id]["write_paths"] == summary["write_paths"]
+
+
+def test_runner_answers_for_jobs_it_does_not_hold(pool):
+    collection = FakeCollection()
+    runner = TwitterJobRunner(max_jobs=1, jobs=collection)
+    job = runner.submit(TwitterScrapeJob("followers", user="james201", screen_names=["first"], pool=pool,
+                                         cloud_utility=FakeCloudUtility(), jobs=collection))
+    runner.executor.shutdown(wait=True)
+
+    assert runner.status(job.job_id)["status"] == "done"
+    assert TwitterJobRunner(jobs=collection).status(job.job_id)["job_description"]["rows"] == "9"
+    assert runner.status("unknown") is None
+
+
+def test_resubmitted_job_resumes_from_its_last_checkpoint(pool):
+    fail_at = {("second", 2)}
+    pool.clients = [FakeTwitterClient(fail_at=fail_at), FakeTwitterClient(fail_at=fail_at)]
+    cloud_utility, collection = FakeCloudUtility(), FakeCollection()
+    runner = TwitterJobRunner(max_jobs=1, jobs=collection)
+    job = TwitterScrapeJob("followers", user="james201", screen_names=["first", "second"], pool=pool,
+                           chunk_size=100, checkpoint_pages=1, cloud_utility=cloud_utility, jobs=collection)
+    job.run()
+
+    assert job.status == "partial"
+    assert collection.documents[job.job_id]["checkpoint"]["positions"]["second"] == [2, 6]
+    fetched = sum(len(client.calls) for client in pool.clients)
+
+    resumed = runner.resume(job.job_id, "followers", pool=pool, cloud_utility=cloud_utility)
+    runner.executor.shutdown(wait=True)
+
+    summary = runner.status(job.job_id)
+    assert summary["status"] == "done"
+    assert summary["job_description"]["rows"] == "18"
+    assert len(summary["write_paths"]) == 6
+    # Only the failed page of the second user is fetched again
+    assert [call for client in pool.clients for call in client.calls][fetched:] == [("second", 2)]
+    assert runner.resume(job.job_id, "followings") is None
+    assert runner.resume(resumed.job_id).status == "done"
+
+
+def test_running_jobs_of_other_runners_count_the_time_before_their_resume(pool):
+    collection = FakeCollection()
+    job = TwitterScrapeJob("followers", user="james201", screen_names=["first"], pool=pool,
+                           cloud_utility=FakeCloudUtility(), jobs=collection)
+    # Resumed 5 seconds ago, after running for 100 seconds before
+    job.status, job.elapsed_before, job.started_at = "running", 100, time.time() - 5
+    job.persist()
+
+    assert 105 <= TwitterJobRunner(jobs=collection).status(job.job_id)["time_elapsed_seconds"] <= 106
+
+
+def test_unavailable_accounts_complete_with_their_reason(pool):
+    pool.clients = [FakeTwitterClient(gone={"deleted"}), FakeTwitterClient(gone={"deleted"})]
+    collection = FakeCollection()
+    job = TwitterScrapeJob("followers", user="james201", screen_names=["first", "deleted"], pool=pool,
+                           cloud_utility=FakeCloudUtility(), jobs=collection)
+    job.run()
+
+    summary = job.summary()
+    assert summary["status"] == "done"
+    assert summary["job_description"]["rows"] == "9"
+    assert summary["job_description"]["users_skipped"] == "1"
+    checkpoint = collection.documents[job.job_id]["checkpoint"]
+    assert checkpoint["positions"]["deleted"] == [0, 0]
+    assert checkpoint["skipped"]["deleted"].startswith("404 Not Found")
+    assert TwitterScrapeJob.from_document(collection.documents[job.job_id]).skipped == checkpoint["skipped"]
+
+
+def test_a_stale_job_is_claimed_by_one_runner_only(pool):
+    collection = FakeCollection()
+    job = TwitterScrapeJob("followers", user="james201", screen_names=["first"], pool=pool,
+                           cloud_utility=FakeCloudUtility(), jobs=collection)
+    job.status = "running"
+    job.persist()
+    collection.documents[job.job_id]["updated_at"] = datetime.utcnow() - timedelta(hours=1)
+
+    # Another process claims the job between our read and our write
+    find_one = collection.find_one
+
+    def claimed_elsewhere(query):
+        document = dict(find_one(query))
+        collection.documents[query["_id"]]["updated_at"] = datetime.utcnow()
+        collection.find_one = find_one
+        return document
+
+    collection.find_one = claimed_elsewhere
+    runner = TwitterJobRunner(max_jobs=1, jobs=collection)
+    resumed = runner.resume(job.job_id, pool=pool, cloud_utility=FakeCloudUtility())
+    runner.executor.shutdown(wait=True)
+
+    assert resumed.status == "running"
+    assert runner.status(job.job_id)["job_description"]["rows"] == "0"
@@ -0,0 +1,123 @@
+import time
+import pytest
+import tweepy
+
+from app.scrapers.social.twitter import TwitterScraperClient
+from app.tests.conftest import FakeTwitterClient, RateLimitResponse
+
+
+@pytest.fixture
+def pool(twitter_pool):
+    return twitter_pool([FakeTwitterClient(budget=2, pages=5), FakeTwitterClient(budget=0, pages=5),
+                         FakeTwitterClient(budget=10, pages=5)])
+
+
+def test_exhausted_keys_are_remembered_across_requests(pool):
+    first = list(TwitterScraperClient(pool=pool).iter_follower_following("followers", screen_name="first"))
+    assert len(first) == 15 and len(set(first)) == 15
+    assert [len(client.calls) for client in pool.clients] == [3, 1, 3]
+
+    # A later request goes straight to the key with calls left
+    list(TwitterScraperClient(pool=pool).iter_follower_following("followers", screen_name="second"))
+    assert [len(client.calls) for client in pool.clients] == [3, 1, 8]
+    assert [quota["leases"] for quota in pool.status()["followers"]] == [0, 0, 0]
+
+
+def test_concurrent_leases_spread_over_keys(pool):
+    leased = [pool.checkout("followings")[0] for _ in range(3)]
+    assert sorted(leased) == [0, 1, 2]
+
+
+def test_users_are_extracted_in_parallel_across_keys(pool):
+    class SlowClient(FakeTwitterClient):
+        def get_follower_ids(self, cursor, **kwargs):
+            time.sleep(0.05)
+            ids, cursors = super().get_follower_ids(cursor, **kwargs)
+            return [(kwargs["screen_name"], follower) for follower in ids], cursors
+
+    pool.clients = [SlowClient(budget=100, pages=4) for _ in range(3)]
+    users = [f"user{index}" for index in range(6)]
+
+    started_at = time.monotonic()
+    pairs = [(user, follower) for user, ids in TwitterScraperClient(pool=pool).iter_follows(
+        screen_names=users, relationship_type="followers") for follower in ids]
+    elapsed = time.monotonic() - started_at
+
+    assert len(pairs) == 6 * 4 * 3
+    assert all(user == follower[0] for user, follower in pairs)
+    assert [len(client.calls) for client in pool.clients] == [8, 8, 8]
+    # 24 pages of 50ms over 3 keys, sequentially this takes 1.2s
+    assert elapsed < 0.8
+
+
+def test_exhausted_chains_are_parked_without_holding_threads(pool):
+    class ResettingClient(FakeTwitterClient):
+        ''' Rate limited on its first call, with a window resetting half a second later '''
+
+        def get_follower_ids(self, cursor, **kwargs):
+            if not self.calls:
+                self.calls.append((kwargs["screen_name"], cursor))
+                raise tweepy.TooManyRequests(RateLimitResponse(0, reset_in=0.5))
+            return super().get_follower_ids(cursor, **kwargs)
+
+    pool.clients = [ResettingClient(budget=100, pages=2) for _ in range(3)]
+
+    follows = TwitterScraperClient(pool=pool).iter_follows(
+        screen_names=["first", "second"], relationship_type="followers")
+    pairs = [(user, follower) for user, ids in follows for follower in ids]
+
+    assert sorted(set(user for user, _ in pairs)) == ["first", "second"]
+    assert len(pairs) == 2 * 2 * 3
+    assert len(pool.scheduler) == 0
+
+
+def test_chains_of_a_stalled_consumer_hand_back_pool_threads(pool):
+    pool.clients = [FakeTwitterClient(budget=100, pages=40) for _ in range(3)]
+    follows = TwitterScraperClient(pool=pool).iter_follows(
+        screen_names=["first", "second", "third"], relationship_type="followers")
+    first_page = next(follows)
+
+    # Every chain parks once the queue is full, the executor is free for other jobs meanwhile
+    assert pool.executor.submit(lambda: "other job").result(timeout=2) == "other job"
+    deadline = time.time() + 2
+    while any(quota["leases"] for quota in pool.status()["followers"]) and time.time() < deadline:
+        time.sleep(0.01)
+    assert [quota["leases"] for quota in pool.status()["followers"]] == [0, 0, 0]
+
+    pages = [first_page] + list(follows)
+    assert len(pages) == 3 * 40
+    assert sum(len(ids) for _, ids in pages) == 3 * 40 * 3
+
+
+def test_parked_chains_keep_their_worker_slot(pool):
+    # Users whose chain has started, parked ones included, and whose last page has not been served yet
+    in_flight, most_in_flight = set(), [0]
+
+    class ResettingClient(FakeTwitterClient):
+        ''' Rate limited on its first call, with a window resetting half a second later '''
+
+        def get_follower_ids(self, cursor, **kwargs):
+            if not self.calls:
+                self.calls.append((kwargs["screen_name"], cursor))
+                raise tweepy.TooManyRequests(RateLimitResponse(0, reset_in=0.5))
+            ids, cursors = super().get_follower_ids(cursor, **kwargs)
+            if cursors[1] == 0:
+                in_flight.discard(kwargs["screen_name"])
+            return ids, cursors
+
+    class CountingScraper(TwitterScraperClient):
+        def iter_follower_following_pages(self, relationship_type, **kwargs):
+            in_flight.add(kwargs["screen_name"])
+            most_in_flight[0] = max(most_in_flight[0], len(in_flight))
+            return super().iter_follower_following_pages(relationship_type, **kwargs)
+
+    pool.clients = [ResettingClient(budget=100, pages=2) for _ in range(3)]
+    users = [f"user{index}" for index in range(8)]
+
+    follows = CountingScraper(pool=pool).iter_follows(screen_names=users, relationship_type="followers")
+    pairs = [(user, follower) for user, ids in follows for follower in ids]
+
+    assert len(pairs) == 8 * 2 * 3
+    assert len(pool.scheduler) == 0
+    # Every key is exhausted once, only the 3 chains that hit it are parked and resumed
+    assert most_in_flight[0] == 3
@@ -12,3 +12,23 @@ def credentials_exception():
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+class KeysExhaustedException(RateLimitException):
+    ''' Every key in a pool is rate limited. Carries when the first key frees up, and where the interrupted work
+    stopped so it can be resumed from there.
+    '''
+
+    def __init__(self, available_at: float, cursor=None, id_count: int = 0):
+        self.available_at = available_at
+        self.cursor = cursor
+        self.id_count = id_count
+
+    def __str__(self):
+        return f"API call frequency limit hit on every key, next key available at {self.available_at:.0f}."
+
+
+class UnsupportedRangeException(ValueError):
+    ''' A provider holds no data for the requested range, e.g. older than the history it serves. Says nothing about the
+    provider's health, the provider router falls through to the next provider without counting it as an error.
+    '''
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+from typing import Iterator, List, Tuple
+
+
+''' Alignment, many OHLCV series to one (time x ticker) matrix '''
+
+
+def align_closes(frame: pd.DataFrame, tickers: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Pivot the close prices of a canonical OHLCV frame of many symbols onto the union of their dates.
+    Closes are carried forward over dates a symbol did not trade (holidays of another market, gaps),
+    dates before a symbol's first bar stay NaN.
+
+    Outputs
+    =============
+    dates -> [np.ndarray]   : (T,) sorted epoch seconds
+    closes -> [np.ndarray]  : (T, N) float64, one column per ticker in tickers order
+    """
+    dates = np.unique(frame.date.to_numpy())
+    closes = np.full((len(dates), len(tickers)), np.nan)
+
+    columns = pd.Categorical(frame.symbol, categories=tickers).codes
+    known = columns >= 0
+    closes[np.searchsorted(dates, frame.date.to_numpy()[known]), columns[known]] = frame.close.to_numpy()[known]
+
+    # Forward fill down each column, index of the last valid row at every row
+    rows = np.where(~np.isnan(closes), np.arange(len(dates))[:, None], 0)
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return dates, closes[rows, np.arange(len(tickers))]
+
+
+def returns_matrix(closes: np.ndarray, kind: str = "log") -> np.ndarray:
+    """ (T - 1, N) bar to bar returns, log or simple, NaN where either close is missing
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if kind == "log":
+            return np.diff(np.log(closes), axis=0)
+        return closes[1:] / closes[:-1] - 1
+
+
+''' Blocked pairwise moments. Only (T x block) slices and (block x block) products are held at once,
+so memory stays O(T x N + N x N) whatever the number of tickers. Missing returns are dropped pairwise. '''
+
+
+def _column_blocks(n: int, block: int) -> List[slice]:
+    return [slice(start, min(start + block, n)) for start in range(0, n, block)]
+
+
+def pairwise_matrices(returns: np.ndarray, min_periods: int = 2, block: int = 128) -> Tuple[np.ndarray, np.ndarray]:
+    """ Correlation and covariance of every pair of columns over the rows where both are present,
+    NaN for pairs sharing fewer than min_periods rows.
+
+    Outputs
+    =============
+    correlation, covariance -> [np.ndarray] : (N, N) float64, symmetric
+    """
+    n = returns.shape[1]
+    present = ~np.isnan(returns)
+    mask = present.astype(np.float64)
+    filled = np.where(present, returns, 0.0)
+    squared = filled * filled
+
+    correlation = np.full((n, n), np.nan)
+    covariance = np.full((n, n), np.nan)
+
+    blocks = _column_blocks(n, block)
+    for i, rows in enumerate(blocks):
+        for columns in blocks[i:]:
+            # Sums over the rows where both columns of a pair are present, as matrix products
+            count = mask[:, rows].T @ mask[:, columns]
+            sum_x = filled[:, rows].T @ mask[:, columns]
+            sum_y = mask[:, rows].T @ filled[:, columns]
+            sum_xy = filled[:, rows].T @ filled[:, columns]
+            sum_xx = squared[:, rows].T @ mask[:, columns]
+            sum_yy = mask[:, rows].T @ squared[:, columns]
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                centred_xy = sum_xy - sum_x * sum_y / count
+                centred_xx = sum_xx - sum_x * sum_x / count
+                centred_yy = sum_yy - sum_y * sum_y / count
+                cov = centred_xy / (count - 1)
+                corr = np.clip(centred_xy / np.sqrt(centred_xx * centred_yy), -1, 1)
+
+            too_few = count < min_periods
+            cov[too_few], corr[too_few] = np.nan, np.nan
+
+            covariance[rows, columns], covariance[columns, rows] = cov, cov.T
+            correlation[rows, columns], correlation[columns, rows] = corr, corr.T
+
+    return correlation, covariance
+
+
+def rolling_pairwise_matrices(
+        returns: np.ndarray,
+        window: int,
+        step: int = 1,
+        min_periods: int = None,
+        block: int = 128) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """ pairwise_matrices over trailing windows of returns, every step rows. Yields one window at a time
+    so callers can pack or write each one before the next is computed.
+
+    Outputs
+    =============
+    (end, correlation, covariance)  : end is the index of the window's last row
+    """
+    min_periods = window if min_periods is None else min_periods
+    for end in range(window - 1, returns.shape[0], step):
+        correlation, covariance = pairwise_matrices(
+            returns[end - window + 1:end + 1], min_periods=min_periods, block=block)
+        yield end, correlation, covariance
+
+
+def pack_upper(matrix: np.ndarray) -> np.ndarray:
+    """ Upper triangle of a symmetric matrix, diagonal included, row by row (numpy.triu_indices order).
+    Half the size of the full matrix.
+
+    Example Usage
+    =============
+    >>> pack_upper(np.array([[1.0, 0.5], [0.5, 1.0]]))
+    array([1. , 0.5, 1. ])
+    """
+    return matrix[np.triu_indices(matrix.shape[0])]
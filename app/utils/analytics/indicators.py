@@ -0,0 +1,246 @@
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Tuple
+
+from app.utils.analytics.resample import DAY_SECONDS
+
+Columns = Dict[str, np.ndarray]
+
+
+''' Kernels, every output is aligned with the input and NaN where the window is not yet full '''
+
+
+def _ewm(values: np.ndarray, alpha: float, initial: float) -> np.ndarray:
+    """ y[t] = (1 - alpha) * y[t - 1] + alpha * x[t] with y[-1] = initial, without a python loop per element.
+
+    Within a block the recursion has the closed form y[j] = d^(j+1) * carry + alpha * d^j * cumsum(x[k] * d^-k),
+    d = 1 - alpha. Blocks are sized so d^-k stays far from overflowing, which leaves a handful of blocks even for
+    millions of bars.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    decay = 1 - alpha
+    if decay <= 0:
+        return values.copy()
+
+    block = int(max(1, min(len(values), 500 / -np.log(decay)))) if len(values) else 1
+    powers = decay ** np.arange(block + 1)
+    inverse_powers = decay ** -np.arange(block)
+
+    smoothed = np.empty_like(values)
+    carry = initial
+    for block_start in range(0, len(values), block):
+        chunk = values[block_start:block_start + block]
+        size = len(chunk)
+        smoothed[block_start:block_start + size] = powers[1:size + 1] * carry + \
+            alpha * powers[:size] * np.cumsum(chunk * inverse_powers[:size])
+        carry = smoothed[block_start + size - 1]
+    return smoothed
+
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if window <= len(values):
+        sums = np.cumsum(np.concatenate([[0.0], values]))
+        out[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return out
+
+
+def rolling_std(values: np.ndarray, window: int, block: int = 1024) -> np.ndarray:
+    """ Population standard deviation over a sliding window, sqrt(sum(x^2) / n - (sum(x) / n)^2) from running sums.
+
+    The sums run over blocks of outputs, each centred on its own mean, so the cancellation between the two terms stays
+    small however long or far from zero the series is. Windows of one repeated value are exactly 0.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    block = max(block, window)
+    for first in range(window - 1, len(values), block):
+        last = min(first + block, len(values))
+        segment = values[first - window + 1:last]
+        centred = segment - segment.mean()
+        sums = np.cumsum(np.concatenate([[0.0], centred]))
+        squares = np.cumsum(np.concatenate([[0.0], centred * centred]))
+        changes = np.cumsum(np.concatenate([[0, 0], segment[1:] != segment[:-1]]))
+
+        mean = (sums[window:] - sums[:-window]) / window
+        variance = (squares[window:] - squares[:-window]) / window - mean * mean
+        constant = changes[window:] == changes[1:len(changes) - window + 1]
+        out[first:last] = np.where(constant, 0.0, np.sqrt(np.clip(variance, 0, None)))
+    return out
+
+
+def ema(values: np.ndarray, span: int, min_periods: int = None) -> np.ndarray:
+    """ Exponential moving average seeded with the first value, alpha = 2 / (span + 1). The first min_periods - 1
+    values, span - 1 by default, are NaN like pandas' ewm(span, adjust=False, min_periods=span)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    smoothed = _ewm(values, 2 / (span + 1), initial=values[0])
+    smoothed[:(span if min_periods is None else min_periods) - 1] = np.nan
+    return smoothed
+
+
+def rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    """ Relative strength index with Wilder's smoothing, seeded by the mean gain / loss of the first period
+    """
+    close = np.asarray(close, dtype=np.float64)
+    out = np.full(len(close), np.nan)
+    if len(close) <= period:
+        return out
+
+    change = np.diff(close)
+    gains, losses = np.clip(change, 0, None), np.clip(-change, 0, None)
+
+    alpha = 1 / period
+    average_gain = np.concatenate([[gains[:period].mean()], _ewm(gains[period:], alpha, gains[:period].mean())])
+    average_loss = np.concatenate([[losses[:period].mean()], _ewm(losses[period:], alpha, losses[:period].mean())])
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out[period:] = np.where(average_loss == 0, 100.0,
+                                100 - 100 / (1 + average_gain / average_loss))
+    return out
+
+
+def vwap_anchor(anchor: str) -> str:
+    """ Canonical VWAP anchor, D or none whatever the case
+
+    Example Usage
+    =============
+    >>> vwap_anchor("d"), vwap_anchor("None")
+    ('D', 'none')
+    """
+    anchors = {"D": "D", "NONE": "none"}
+    if str(anchor).strip().upper() not in anchors:
+        raise ValueError(f"Unknown vwap anchor {anchor}, supported anchors are D and none")
+    return anchors[str(anchor).strip().upper()]
+
+
+def vwap(frame: pd.DataFrame, anchor: str = "D") -> np.ndarray:
+    """ Volume weighted average of the typical price (high + low + close) / 3, restarting every UTC day when anchor is D,
+    or running over the whole range when anchor is none
+    """
+    anchor = vwap_anchor(anchor)
+    typical = (frame.high.to_numpy() + frame.low.to_numpy() + frame.close.to_numpy()) / 3
+    volume = frame.volume.to_numpy(dtype=np.float64)
+    price_volume, cumulative_volume = np.cumsum(typical * volume), np.cumsum(volume)
+
+    if anchor == "D" and len(frame):
+        # Subtract the running totals at the start of each day, a grouped cumsum without the groupby
+        day = frame.date.to_numpy() // DAY_SECONDS
+        day_start = np.concatenate([[0], np.flatnonzero(np.diff(day)) + 1])
+        offsets = np.repeat(day_start, np.diff(np.concatenate([day_start, [len(day)]])))
+        price_volume = price_volume - np.concatenate([[0.0], price_volume])[offsets]
+        cumulative_volume = cumulative_volume - np.concatenate([[0.0], cumulative_volume])[offsets]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(cumulative_volume > 0, price_volume / cumulative_volume, np.nan)
+
+
+''' Indicators, named columns computed from a canonical OHLCV frame '''
+
+
+def _sma(frame, window=20): return {f"sma_{window}": sma(frame.close.to_numpy(), window)}
+
+
+def _ema(frame, span=20): return {f"ema_{span}": ema(frame.close.to_numpy(), span)}
+
+
+def _rsi(frame, period=14): return {f"rsi_{period}": rsi(frame.close.to_numpy(), period)}
+
+
+def _vwap(frame, anchor="D"): return {f"vwap_{vwap_anchor(anchor)}".lower(): vwap(frame, anchor)}
+
+
+def _macd(frame, fast=12, slow=26, signal=9):
+    close = frame.close.to_numpy()
+    # Smoothed from the first bar, then masked until the slow average, and the signal on top of it, are warmed up
+    line = ema(close, fast, min_periods=1) - ema(close, slow, min_periods=1)
+    signal_line = ema(line, signal, min_periods=1)
+    line[:slow - 1] = np.nan
+    signal_line[:slow + signal - 2] = np.nan
+    suffix = f"{fast}_{slow}_{signal}"
+    return {f"macd_{suffix}": line, f"macd_signal_{suffix}": signal_line, f"macd_hist_{suffix}": line - signal_line}
+
+
+def _bollinger(frame, window=20, num_std=2):
+    close = frame.close.to_numpy()
+    middle, spread = sma(close, window), num_std * rolling_std(close, window)
+    suffix = f"{window}_{num_std:g}"
+    return {f"bollinger_middle_{suffix}": middle, f"bollinger_upper_{suffix}": middle + spread,
+            f"bollinger_lower_{suffix}": middle - spread}
+
+
+INDICATORS: Dict[str, Callable[..., Columns]] = {
+    "sma": _sma,
+    "ema": _ema,
+    "rsi": _rsi,
+    "macd": _macd,
+    "vwap": _vwap,
+    "bollinger": _bollinger,
+}
+
+# Parameters that must be whole numbers of bars
+_INTEGER_PARAMS = {"window", "span", "period", "fast", "slow", "signal"}
+
+
+def normalise_indicator_params(name: str, params: dict) -> Tuple[Tuple[str, object], ...]:
+    """ Validate an indicator's parameters into a hashable, canonical form, e.g. for memoisation
+
+    Example Usage
+    =============
+    >>> normalise_indicator_params("sma", {"window": 50.0})
+    (('window', 50),)
+    """
+    if name not in INDICATORS:
+        raise ValueError(
+            f"Unknown indicator {name}, supported indicators are {', '.join(INDICATORS)}")
+
+    normalised = {}
+    for param, value in params.items():
+        if param in _INTEGER_PARAMS:
+            if float(value) != int(value) or int(value) < 1:
+                raise ValueError(f"{name} {param} must be a positive whole number")
+            value = int(value)
+        if param == "anchor":
+            value = vwap_anchor(value)
+        normalised[param] = value
+    return tuple(sorted(normalised.items()))
+
+
+def compute_indicator(frame: pd.DataFrame, name: str, params: dict) -> Columns:
+    """ Compute one indicator over a canonical OHLCV frame of one symbol, sorted by date
+
+    Example Usage
+    =============
+    >>> compute_indicator(frame, "macd", {"fast": 12, "slow": 26, "signal": 9})
+    {"macd_12_26_9": array([...]), "macd_signal_12_26_9": array([...]), "macd_hist_12_26_9": array([...])}
+    """
+    try:
+        return INDICATORS[name](frame, **dict(normalise_indicator_params(name, params)))
+    except TypeError as e:
+        raise ValueError(f"Invalid parameters for {name}, {e}")
+
+
+class IndicatorMemo:
+    ''' Bounded least recently used memo of indicator columns. Keys include the cache version of the series,
+    so entries of an updated series are simply never hit again and age out.
+    '''
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, key: Hashable):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        return None
+
+    def put(self, key: Hashable, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
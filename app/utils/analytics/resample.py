@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from typing import Iterable, Iterator, Tuple
+
+from app.utils.cleaning.ohlcv_clean import OHLCV_COLUMNS, OHLCV_ARROW_SCHEMA, empty_ohlcv_frame, parse_resolution, normalize_resolution
+
+DAY_SECONDS = 24 * 60 * 60
+WEEK_SECONDS = 7 * DAY_SECONDS
+MONDAY_OFFSET = 4 * DAY_SECONDS  # 1970-01-01 was a thursday, weekly buckets start on mondays
+
+_UNIT_SECONDS = {"MIN": 60, "H": 60 * 60, "D": DAY_SECONDS}
+
+# Finest series every resolution of a unit is derived from
+_BASE_RESOLUTIONS = {"MIN": "1MIN", "H": "1MIN", "D": "D", "W": "D", "M": "D"}
+
+
+def base_resolution(resolution: str) -> str:
+    """ The cached base series a resolution is resampled from, 1MIN bars for intraday resolutions and daily bars otherwise
+
+    Example Usage
+    =============
+    >>> base_resolution("15MIN"), base_resolution("5W")
+    ('1MIN', 'D')
+    """
+    _, unit = parse_resolution(resolution)
+    return _BASE_RESOLUTIONS[unit]
+
+
+''' Bucket alignment '''
+
+
+def bucket_ordinals(epochs: np.ndarray, resolution: str) -> np.ndarray:
+    """ Number every bucket of a resolution, bars with the same ordinal fall in the same bucket.
+    Minute, hour and day buckets are aligned to the epoch (UTC), weeks start on monday and months on the 1st.
+    """
+    multiple, unit = parse_resolution(resolution)
+    epochs = np.asarray(epochs, dtype=np.int64)
+
+    if unit == "M":
+        months = epochs.astype("datetime64[s]").astype(
+            "datetime64[M]").astype(np.int64)
+        return months // multiple
+    if unit == "W":
+        return (epochs - MONDAY_OFFSET) // (multiple * WEEK_SECONDS)
+    return epochs // (multiple * _UNIT_SECONDS[unit])
+
+
+def bucket_starts(ordinals: np.ndarray, resolution: str) -> np.ndarray:
+    """ Epoch of the first second of each bucket, the inverse of bucket_ordinals
+    """
+    multiple, unit = parse_resolution(resolution)
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+
+    if unit == "M":
+        return (ordinals * multiple).astype("datetime64[M]").astype("datetime64[s]").astype(np.int64)
+    if unit == "W":
+        return ordinals * multiple * WEEK_SECONDS + MONDAY_OFFSET
+    return ordinals * multiple * _UNIT_SECONDS[unit]
+
+
+def bucket_bounds(start: int, end: int, resolution: str) -> Tuple[int, int]:
+    """ Widen [start, end) to whole buckets, so the first and last bars of a resampled range are complete
+
+    Example Usage
+    =============
+    >>> bucket_bounds(1641772800, 1641859200, "M")    # 2022-01-10 to 2022-01-11
+    (1640995200, 1643673600)                          # 2022-01-01 to 2022-02-01
+    """
+    first, last = bucket_ordinals([start, end - 1], resolution)
+    aligned_start, aligned_end = bucket_starts([first, last + 1], resolution)
+    return int(aligned_start), int(aligned_end)
+
+
+''' Resampling '''
+
+
+def resample_ohlcv(frame: pd.DataFrame, resolution: str) -> pd.DataFrame:
+    """ Aggregate a canonical OHLCV frame of one symbol into coarser bars: first open, max high, min low, last close
+    and summed volume per bucket, dated at the bucket start. Runs as a handful of numpy reductions over contiguous
+    buckets, so the frame must be sorted by date, which the cache guarantees.
+
+    Parameters
+    =============
+    frame -> [pd.DataFrame]     : Canonical OHLCV frame of a finer resolution
+    resolution -> [str]         : Target resolution, e.g. 15MIN, 1H, 5D, W, M
+
+    Example Usage
+    =============
+    >>> weekly = resample_ohlcv(trading_client.cache.read(daily_key), "W")
+    """
+    if frame.shape[0] == 0:
+        return empty_ohlcv_frame()
+
+    resolution = normalize_resolution(resolution)
+    ordinals = bucket_ordinals(frame.date.to_numpy(), resolution)
+
+    # Rows are sorted, so each bucket is a contiguous run starting wherever the ordinal changes
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(ordinals)) + 1])
+    ends = np.concatenate([starts[1:], [len(ordinals)]])
+
+    resampled = pd.DataFrame({
+        "date": bucket_starts(ordinals[starts], resolution),
+        "open": frame.open.to_numpy()[starts],
+        "high": np.maximum.reduceat(frame.high.to_numpy(), starts),
+        "low": np.minimum.reduceat(frame.low.to_numpy(), starts),
+        "close": frame.close.to_numpy()[ends - 1],
+        "volume": np.add.reduceat(frame.volume.to_numpy(), starts),
+        "symbol": frame.symbol.to_numpy()[starts],
+    })
+    return resampled[OHLCV_COLUMNS]
+
+
+def resample_batches(batches: Iterable[pa.RecordBatch], resolution: str) -> Iterator[pa.RecordBatch]:
+    """ Resample a date ordered stream of record batches, one batch in memory at a time.
+    A bucket can straddle two batches, so the last bar of every batch is held back and folded into the next one.
+    """
+    pending = None
+    for batch in batches:
+        bars = resample_ohlcv(batch.to_pandas(), resolution)
+        if pending is not None:
+            bars = resample_ohlcv(
+                pd.concat([pending, bars], ignore_index=True), resolution)
+
+        pending = bars.iloc[-1:]
+        if bars.shape[0] > 1:
+            yield pa.RecordBatch.from_pandas(bars.iloc[:-1], schema=OHLCV_ARROW_SCHEMA, preserve_index=False)
+
+    if pending is not None and pending.shape[0] > 0:
+        yield pa.RecordBatch.from_pandas(pending, schema=OHLCV_ARROW_SCHEMA, preserve_index=False)
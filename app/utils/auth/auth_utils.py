@@ -41,6 +41,13 @@ def verify_token(jwt_token: str = Depends(oauth2_scheme)):
         raise credentials_exception()
 
 
+def token_user(token: str) -> str:
+    """ Username of an already validated token, see hasaccess
+    """
+    return jwt.decode(
+        token, key=os.environ['MASTER_SECRET_KEY'], algorithms=["HS256"])['user']
+
+
 def verify_credentials(username: str, password: str):
     try:
         user_document = user_collection.find_one(
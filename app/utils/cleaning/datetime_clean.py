@@ -1,5 +1,7 @@
+import numpy as np
 import pandas as pd
 import time
+import calendar
 from datetime import datetime, timedelta
 
 
@@ -15,6 +17,50 @@ def date_to_unixtime(date, datetime_format) -> int:
     return int(unixtime)
 
 
+def date_to_utc_unixtime(date, datetime_format) -> int:
+    """ Return UNIX Time Stamp given a date and datetime format, reading the date as UTC rather than local time
+    Parameters
+    =============
+    date -> [str]               : date string
+    datetime_format -> [str]    : date string date format
+    """
+    d = datetime.strptime(date, datetime_format)
+    return calendar.timegm(d.timetuple())
+
+
+def utc_unixtime_to_date(unixtime, datetime_format) -> str:
+    """ Inverse of date_to_utc_unixtime, formats a UNIX Time Stamp as a UTC date string
+    """
+    return datetime.utcfromtimestamp(unixtime).strftime(datetime_format)
+
+
+def epoch_to_datestrings(epochs: np.ndarray, datetime_format: str = '%Y-%m-%d %H:%M:%S') -> np.ndarray:
+    """ Vectorised replacement for .apply(lambda ts: datetime.utcfromtimestamp(ts).strftime(...))
+
+    Example Usage
+    =============
+    >>> epoch_to_datestrings(np.array([1640995200]))
+    array(['2022-01-01 00:00:00'], dtype='<U19')
+    """
+    datetimes = np.asarray(epochs, dtype=np.int64).astype("datetime64[s]")
+    if datetimes.size == 0:
+        return np.array([], dtype="U19")
+    if datetime_format == '%Y-%m-%d %H:%M:%S':
+        # numpy formats as 2022-01-01T00:00:00, swapping the separator avoids a strftime per row
+        return np.char.replace(np.datetime_as_string(datetimes, unit="s"), "T", " ")
+    return pd.DatetimeIndex(datetimes).strftime(datetime_format).to_numpy()
+
+
+def isostrings_to_epoch(datestrings) -> np.ndarray:
+    """ Vectorised ISO 8601 (2022-01-01T00:00:00.0000000Z, 2022-01-01 00:00:00, ...) to UTC epoch seconds
+    """
+    # Truncating to 19 characters drops fractional seconds and the zone suffix
+    datestrings = np.asarray(datestrings, dtype="U19")
+    if datestrings.size == 0:
+        return np.array([], dtype=np.int64)
+    return np.char.replace(datestrings, " ", "T").astype("datetime64[s]").astype(np.int64)
+
+
 def textualtime_to_timestring(x):
     ''' Cleaning function that replaces textual time prompts e.g. 4 hours ago, 2 days ago, into actual time estiamte
     i.e. Current Time - Elapsed Time (cleaned textual time prompt)
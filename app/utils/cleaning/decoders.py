@@ -0,0 +1,123 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pa_compute
+from typing import Union, List
+
+from app.utils.cleaning.ohlcv_clean import OHLCV_COLUMNS, OHLCV_FLOAT_COLUMNS, empty_ohlcv_frame
+from app.utils.cleaning.datetime_clean import isostrings_to_epoch
+
+Payload = Union[str, bytes]
+
+
+''' Generic JSON '''
+
+
+def decode_json(payload: Payload):
+    """ Parse a provider json payload. Replaces the eval / ast.literal_eval parsing, which is slow and executes
+    whatever the provider sends back.
+    """
+    return json.loads(payload)
+
+
+def decode_json_records(payload: Payload) -> pd.DataFrame:
+    """ Decode a json list of objects, e.g. symbol or commodity listings, into a dataframe
+    """
+    return pd.DataFrame.from_records(decode_json(payload))
+
+
+''' Trading providers, decoded straight into the canonical OHLCV layout '''
+
+
+def _ohlcv_frame(date: np.ndarray, columns: dict, symbol: str) -> pd.DataFrame:
+    frame = pd.DataFrame({
+        "date": np.asarray(date, dtype=np.int64),
+        **{column: np.asarray(columns[column], dtype=np.float64) for column in OHLCV_FLOAT_COLUMNS},
+    })
+    frame["symbol"] = symbol
+    return frame[OHLCV_COLUMNS].sort_values("date", kind="stable").reset_index(drop=True)
+
+
+def decode_finnhub_candles(payload: Payload, symbol: str) -> pd.DataFrame:
+    """ Finnhub /stock/candle payloads are already columnar, {"c": [...], "h": [...], ..., "s": "ok"},
+    each list becomes one numpy column.
+
+    Only {"s": "no_data"} is an empty range. Error bodies, e.g. {"error": "API limit reached..."}, raise a ValueError,
+    so the range is not cached as empty and the provider router can fail over.
+    """
+    candles = decode_json(payload)
+    if not isinstance(candles, dict) or "error" in candles or candles.get("s") not in ("ok", "no_data"):
+        error = candles.get("error") if isinstance(candles, dict) else None
+        raise ValueError(f"Finnhub candles for {symbol} failed, {error or str(candles)[:200]}")
+    if candles["s"] == "no_data" or not candles.get("t"):
+        return empty_ohlcv_frame()
+
+    return _ohlcv_frame(candles["t"], {
+        "open": candles["o"],
+        "high": candles["h"],
+        "low": candles["l"],
+        "close": candles["c"],
+        "volume": candles["v"],
+    }, symbol)
+
+
+def decode_alphavantage_csv(payload: Payload, symbol: str, timezone: str = "America/New_York") -> pd.DataFrame:
+    """ AlphaVantage intraday csv (time,open,high,low,close,volume) parsed by arrow's multithreaded csv reader,
+    timestamps are parsed to epoch seconds in the same pass.
+
+    Intraday times are US/Eastern wall clock, they are localized to timezone and converted to UTC epochs so they
+    line up with the Finnhub bars of the same series. Pass timezone=None for daily bars, which are dated by trading
+    day at UTC midnight like Finnhub's.
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    if not payload.strip():
+        return empty_ohlcv_frame()
+
+    table = pa_csv.read_csv(
+        io.BytesIO(payload),
+        convert_options=pa_csv.ConvertOptions(column_types={
+            "time": pa.timestamp("s"),
+            "timestamp": pa.timestamp("s"),
+            **{column: pa.float64() for column in OHLCV_FLOAT_COLUMNS},
+        }))
+    time_column = "time" if "time" in table.column_names else "timestamp"
+    times = table.column(time_column)
+    if timezone is not None:
+        # Extended hours never reach the 1-3am DST transitions, the fallbacks only keep a bad row from raising
+        times = pa_compute.assume_timezone(times, timezone=timezone, ambiguous="earliest", nonexistent="earliest")
+
+    return _ohlcv_frame(
+        times.cast(pa.int64()).to_numpy(),
+        {column: table.column(column).to_numpy()
+         for column in OHLCV_FLOAT_COLUMNS},
+        symbol)
+
+
+def decode_coinapi_ohlcv(payload: Payload, symbol: str) -> pd.DataFrame:
+    """ CoinAPI /ohlcv/{symbol}/history payloads are a list of row objects. The date is the period start,
+    like every other provider, so crypto bars line up with the cache and the resampler.
+
+    Error bodies, e.g. {"error": "Invalid API key"}, raise a ValueError instead of decoding as an empty range.
+    """
+    bars = decode_json(payload)
+    if not isinstance(bars, list):
+        error = bars.get("error") if isinstance(bars, dict) else None
+        raise ValueError(f"CoinAPI ohlcv for {symbol} failed, {error or str(bars)[:200]}")
+    if not bars:
+        return empty_ohlcv_frame()
+
+    def column(key): return [bar[key] for bar in bars]
+
+    return _ohlcv_frame(
+        isostrings_to_epoch(column("time_period_start")),
+        {
+            "open": column("price_open"),
+            "high": column("price_high"),
+            "low": column("price_low"),
+            "close": column("price_close"),
+            "volume": column("volume_traded"),
+        }, symbol)
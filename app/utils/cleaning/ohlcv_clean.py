@@ -0,0 +1,130 @@
+import re
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from typing import Union, List, Tuple
+
+from app.utils.cleaning.datetime_clean import epoch_to_datestrings
+
+OHLCV_COLUMNS = ["date", "open", "high", "low", "close", "volume", "symbol"]
+OHLCV_FLOAT_COLUMNS = ["open", "high", "low", "close", "volume"]
+OHLCV_ARROW_SCHEMA = pa.schema(
+    [("date", pa.int64())] + [(column, pa.float64()) for column in OHLCV_FLOAT_COLUMNS] + [("symbol", pa.string())])
+
+_RESOLUTION_UNIT_SECONDS = {
+    "MIN": 60,
+    "H": 60 * 60,
+    "D": 24 * 60 * 60,
+    "W": 7 * 24 * 60 * 60,
+    "M": 31 * 24 * 60 * 60,  # Upper bound of a calendar month
+}
+
+
+def parse_resolution(resolution: str) -> Tuple[int, str]:
+    """ Split a trading resolution into its multiple and unit. Units are case insensitive, except for a lone m:
+    a lowercase m is minutes like in 15m, an uppercase M is months.
+
+    Example Usage
+    =============
+    >>> parse_resolution("15MIN"), parse_resolution("15m")
+    ((15, 'MIN'), (15, 'MIN'))
+    >>> parse_resolution("M")
+    (1, 'M')
+    """
+    resolution = resolution.strip(" ")
+    match = re.fullmatch(r"(\d*)(MIN|H|D|W|M)", re.sub(r"(?<![A-Za-z])m$", "MIN", resolution).upper())
+    if match is None or match.group(1) and int(match.group(1)) == 0:
+        raise ValueError(f"Unknown resolution {resolution}")
+    multiple, unit = match.groups()
+    return int(multiple or 1), unit
+
+
+def normalize_resolution(resolution: str) -> str:
+    """ Canonical spelling of a resolution, as used in cache keys. Single day / week / month bars drop the 1,
+    minute and hour bars keep it.
+
+    Example Usage
+    =============
+    >>> normalize_resolution("1D"), normalize_resolution("15m"), normalize_resolution("15M"), normalize_resolution("min")
+    ('D', '15MIN', '15M', '1MIN')
+    """
+    multiple, unit = parse_resolution(resolution)
+    if multiple == 1 and unit in ("D", "W", "M"):
+        return unit
+    return f"{multiple}{unit}"
+
+
+def resolution_seconds(resolution: str) -> int:
+    """ Return the (upper bound) length of a single bar in seconds for a trading resolution
+
+    Example Usage
+    =============
+    >>> resolution_seconds("15MIN")
+    900
+    >>> resolution_seconds("D")
+    86400
+    """
+    multiple, unit = parse_resolution(resolution)
+    return multiple * _RESOLUTION_UNIT_SECONDS[unit]
+
+
+def empty_ohlcv_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "date": np.array([], dtype=np.int64),
+        **{column: np.array([], dtype=np.float64) for column in OHLCV_FLOAT_COLUMNS},
+        "symbol": np.array([], dtype=object),
+    })[OHLCV_COLUMNS]
+
+
+def to_ohlcv_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """ Normalise a provider frame into the canonical OHLCV layout shared by the cache and the trading endpoints.
+    date is int64 UTC epoch seconds, prices and volume are float64, rows sorted by date.
+
+    Parameters
+    =============
+    df -> [pd.DataFrame]    : provider frame with date, open, high, low, close, volume and symbol columns.
+                              date may be epoch seconds or a %Y-%m-%d %H:%M:%S string.
+    """
+    if df is None or df.shape[0] == 0:
+        return empty_ohlcv_frame()
+
+    frame = df[OHLCV_COLUMNS].copy()
+    if not pd.api.types.is_numeric_dtype(frame.date):
+        frame.date = (pd.to_datetime(frame.date) -
+                      pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    frame.date = frame.date.astype(np.int64)
+    frame[OHLCV_FLOAT_COLUMNS] = frame[OHLCV_FLOAT_COLUMNS].astype(np.float64)
+
+    return frame.sort_values("date", kind="stable").reset_index(drop=True)
+
+
+def frame_to_records(df: pd.DataFrame) -> List[dict]:
+    """ Columnar frame to a list of row dicts of python scalars, without the to_json / eval round trip
+    """
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in zip(*(df[column].tolist() for column in columns))]
+
+
+def format_ohlcv_frame(
+        df: pd.DataFrame,
+        data_format: str = "json") -> Union[pd.DataFrame, List[dict]]:
+    """ Format a canonical OHLCV frame the way the trading clients have always returned it
+
+    Parameters
+    =============
+    data_format -> [str]    : "json" returns a list of records with epoch dates,
+                              "csv" returns a dataframe with %Y-%m-%d %H:%M:%S dates,
+                              "frame" returns the canonical frame untouched
+    """
+    if data_format == "json":
+        return frame_to_records(df)
+
+    elif data_format == "csv":
+        formatted = df.copy()
+        formatted.date = epoch_to_datestrings(formatted.date.to_numpy())
+        return formatted
+
+    elif data_format == "frame":
+        return df
+
+    raise ValueError(f"Unsupported data format {data_format}")
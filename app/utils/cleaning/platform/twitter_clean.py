@@ -1,9 +1,37 @@
 import pandas as pd
 
+# Characters that break the tab separated csv format, and their replacements
+TEXT_REPLACEMENTS = [('\n', ' // '), ('\t', ''), ('\r', '')]
+
+
+def clean_text(x: str) -> str:
+    for old, new in TEXT_REPLACEMENTS:
+        x = x.replace(old, new)
+    return x
+
 
 def clean_twitter_follows(dataframe: pd.DataFrame) -> pd.DataFrame:
-    # Prevent tokenization errors when formatted into csv format
-    for column in dataframe.columns[dataframe.dtypes == object]:
-        dataframe[column] = dataframe[column].apply(lambda x: str(
-            x).replace('\n', ' // ').replace('\t', '').replace('\r', ''))
+    """ Prevent tokenization errors when formatted into csv format. Only text is cleaned, id columns are left as is:
+    string columns vectorized, categorical ones on their categories, and the string cells of object columns
+    """
+    for column in dataframe.columns:
+        values = dataframe[column]
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = values.cat.categories
+            if pd.api.types.is_string_dtype(categories):
+                cleaned = pd.Index([clean_text(category) for category in categories])
+                if cleaned.is_unique:
+                    dataframe[column] = values.cat.rename_categories(cleaned)
+                else:
+                    dataframe[column] = values.astype(object).map(clean_text)
+
+        elif pd.api.types.is_string_dtype(values.dtype) and values.dtype != object:
+            for old, new in TEXT_REPLACEMENTS:
+                values = values.str.replace(old, new, regex=False)
+            dataframe[column] = values
+
+        elif values.dtype == object:
+            dataframe[column] = values.map(lambda x: clean_text(x) if isinstance(x, str) else x)
+
     return dataframe
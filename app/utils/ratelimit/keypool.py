@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
+from filelock import FileLock
+from typing import List, Tuple
+
+from app.utils.alerts.logger import logging
+from app.utils.alerts.exceptions.api_exception import RateLimitException
+
+RateLimit = Tuple[int, int]  # (calls, period in seconds), e.g. (5, 60) for 5 calls / minute
+
+
+class KeyPoolScheduler:
+    ''' Hands out API keys from a pool, keeping one token bucket per key and rate limit.
+
+    Bucket state lives in a JSON file guarded by a file lock, so every worker process on the host draws from the same
+    budget, and daily usage survives restarts. acquire() returns the key with the most budget left and only waits
+    when no key has budget, for exactly as long as it takes the first key to recover.
+
+    Keys are stored by fingerprint, the raw keys never touch the disk.
+
+    Example Usage
+    =============
+    >>> key_pool = KeyPoolScheduler("alphavantage", keys=api_keys, limits=[(5, 60), (500, 24 * 60 * 60)])
+    >>> api_key = await key_pool.acquire()
+    >>> key_pool.mark_exhausted(api_key)    # The provider still rejected it, drain its buckets
+    '''
+
+    def __init__(
+            self,
+            name: str,
+            keys: List[str],
+            limits: List[RateLimit],
+            state_dir: str = None,
+            max_wait_seconds: float = 120):
+        self.name = name
+        self.keys = {self._fingerprint(key): key for key in keys}
+        # Longest period first, so ties on the scarcest budget are broken by the shorter windows
+        self.limits = sorted(limits, key=lambda limit: -limit[1])
+        self.max_wait_seconds = max_wait_seconds
+
+        state_dir = state_dir or os.getenv(
+            "KEY_POOL_STATE_DIR", os.path.join(tempfile.gettempdir(), "visser", "keypools"))
+        os.makedirs(state_dir, exist_ok=True)
+        self.state_path = os.path.join(state_dir, f"{name}.json")
+        self.lock = FileLock(os.path.join(state_dir, f"{name}.lock"))
+
+    @staticmethod
+    def _fingerprint(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    ''' State '''
+
+    def _load_state(self, now: float) -> dict:
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {}
+
+        for fingerprint in self.keys:
+            buckets = state.get(fingerprint, {}).get("buckets", [])
+            if len(buckets) != len(self.limits):  # New key, or the limits changed
+                buckets = [{"tokens": calls, "updated_at": now}
+                           for calls, _ in self.limits]
+            for bucket, (calls, period) in zip(buckets, self.limits):
+                bucket["tokens"] = min(
+                    calls, bucket["tokens"] + (now - bucket["updated_at"]) * calls / period)
+                bucket["updated_at"] = now
+            state[fingerprint] = {"buckets": buckets}
+
+        return state
+
+    def _save_state(self, state: dict):
+        temp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def _seconds_until_available(self, buckets: List[dict]) -> float:
+        return max(max(0, (1 - bucket["tokens"]) * period / calls)
+                   for bucket, (calls, period) in zip(buckets, self.limits))
+
+    ''' Scheduling '''
+
+    def try_acquire(self) -> Tuple[str, float]:
+        """ Take one call from the key with the most budget left.
+
+        Outputs
+        =============
+        (key, wait) -> Tuple[str, float]    : key is None when no key has budget, wait is then the number of seconds
+                                              until the first key recovers
+        """
+        with self.lock:
+            now = time.time()
+            state = self._load_state(now)
+
+            available = [fingerprint for fingerprint in self.keys
+                         if self._seconds_until_available(state[fingerprint]["buckets"]) == 0]
+
+            if not available:
+                self._save_state(state)
+                return None, min(self._seconds_until_available(state[fingerprint]["buckets"])
+                                 for fingerprint in self.keys)
+
+            fingerprint = max(available, key=lambda fingerprint: tuple(
+                bucket["tokens"] / calls for bucket, (calls, _) in zip(state[fingerprint]["buckets"], self.limits)))
+            for bucket in state[fingerprint]["buckets"]:
+                bucket["tokens"] -= 1
+            self._save_state(state)
+
+        return self.keys[fingerprint], 0
+
+    async def acquire(self) -> str:
+        """ Return a key with budget, waiting only while every key in the pool is exhausted
+        """
+        # The file lock and state file are blocking, keep them off the event loop
+        loop = asyncio.get_running_loop()
+        waited = 0
+        while True:
+            key, wait = await loop.run_in_executor(None, self.try_acquire)
+            if key is not None:
+                return key
+            if waited + wait > self.max_wait_seconds:
+                raise RateLimitException
+            logging.info(
+                f"{self.name} key pool: all keys exhausted, waiting {wait:.1f}s for the next key to recover.")
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def mark_exhausted(self, key: str, period: int = None):
+        """ Drain a key's bucket when the provider rejected it despite our accounting,
+        e.g. calls made with the same key from outside this host.
+
+        Parameters
+        =============
+        key -> [str]        : The rejected key
+        period -> [int]     : Period of the rate limit that was hit, drains every bucket of the key when None
+        """
+        fingerprint = self._fingerprint(key)
+        with self.lock:
+            state = self._load_state(time.time())
+            for bucket, (_, limit_period) in zip(state[fingerprint]["buckets"], self.limits):
+                if period is None or period == limit_period:
+                    bucket["tokens"] = 0
+            self._save_state(state)
+
+    def remaining(self) -> dict:
+        """ Remaining calls per key fingerprint and rate limit period, for monitoring
+        """
+        with self.lock:
+            state = self._load_state(time.time())
+            self._save_state(state)
+        return {fingerprint: {period: int(bucket["tokens"]) for bucket, (_, period) in zip(state[fingerprint]["buckets"], self.limits)}
+                for fingerprint in self.keys}
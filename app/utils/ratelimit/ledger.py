@@ -0,0 +1,124 @@
+import time
+import heapq
+import itertools
+import threading
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from app.utils.alerts.logger import logging
+
+
+class RateLimitLedger:
+    ''' Local record of every key's rate limit windows, per endpoint, filled from the x-rate-limit-* headers of each
+    response. Answers which keys have calls left and when the next exhausted key frees up, without spending calls on
+    rate limit status endpoints.
+
+    Keys without a recorded window, or whose window has reset, are assumed to have the default number of calls.
+
+    Example Usage
+    =============
+    >>> ledger = RateLimitLedger(default_calls=15, window_seconds=15 * 60)
+    >>> ledger.record(key=3, endpoint="followers", headers=response.headers)
+    >>> ledger.next_available("followers", keys=range(11))
+    (3, 1635351540.0)
+    '''
+
+    def __init__(self, default_calls: int, window_seconds: float):
+        self.default_calls = default_calls
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        # (key, endpoint) -> {"limit", "remaining", "reset": epoch seconds}
+        self._windows: Dict[Tuple[Hashable, str], dict] = {}
+
+    def record(self, key: Hashable, endpoint: str, headers=None, exhausted: bool = False):
+        """ Update a key's window from response headers. A rate limited response without usable headers marks the key
+        exhausted for a full window.
+        """
+        headers = headers or {}
+        now = time.time()
+        try:
+            remaining = int(headers["x-rate-limit-remaining"])
+            reset = float(headers["x-rate-limit-reset"])
+        except (KeyError, TypeError, ValueError):
+            if not exhausted:
+                return
+            remaining, reset = 0, now + self.window_seconds
+
+        try:
+            limit = int(headers["x-rate-limit-limit"])
+        except (KeyError, TypeError, ValueError):
+            limit = self.default_calls
+
+        with self._lock:
+            self._windows[(key, endpoint)] = {
+                "limit": limit, "remaining": 0 if exhausted else remaining, "reset": reset}
+
+    def _remaining(self, key: Hashable, endpoint: str, now: float) -> int:
+        window = self._windows.get((key, endpoint))
+        if window is None or window["reset"] <= now:
+            return window["limit"] if window is not None else self.default_calls
+        return window["remaining"]
+
+    def remaining(self, key: Hashable, endpoint: str) -> int:
+        with self._lock:
+            return self._remaining(key, endpoint, time.time())
+
+    def reset_at(self, key: Hashable, endpoint: str) -> Optional[float]:
+        with self._lock:
+            window = self._windows.get((key, endpoint))
+            return window["reset"] if window is not None else None
+
+    def next_available(self, endpoint: str, keys: Iterable[Hashable]) -> Tuple[Hashable, float]:
+        """ The key that has, or first gets, calls left on endpoint, and the epoch time it does
+        """
+        now = time.time()
+        with self._lock:
+            def available_at(key):
+                return now if self._remaining(key, endpoint, now) > 0 else self._windows[(key, endpoint)]["reset"]
+            key = min(keys, key=available_at)
+            return key, available_at(key)
+
+
+class DeferredScheduler:
+    ''' Runs callbacks at a later time from a single timer thread, so work waiting on a rate limit window is parked in
+    a queue instead of holding a worker thread asleep. Callbacks should be quick, e.g. resubmit the parked work
+    to an executor.
+
+    Example Usage
+    =============
+    >>> scheduler = DeferredScheduler("twitter")
+    >>> scheduler.call_at(reset_at, executor.submit, resume_extraction, user, cursor)
+    '''
+
+    def __init__(self, name: str = "deferred"):
+        self.name = name
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        with self._condition:
+            return len(self._queue)
+
+    def call_at(self, when: float, callback: Callable, *args):
+        """ Run callback(*args) at epoch time when, or straight away on the timer thread if when has passed
+        """
+        with self._condition:
+            heapq.heappush(self._queue, (when, next(self._sequence), callback, args))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.name}-scheduler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > time.time():
+                    self._condition.wait(
+                        timeout=self._queue[0][0] - time.time() if self._queue else None)
+                _, _, callback, args = heapq.heappop(self._queue)
+            try:
+                callback(*args)
+            except Exception as e:
+                logging.error(f"{self.name} scheduler: parked callback failed, {e}")
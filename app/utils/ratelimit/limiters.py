@@ -0,0 +1,54 @@
+import time
+import asyncio
+
+
+class AsyncTokenBucket:
+    ''' Token bucket limiter for coroutines sharing a provider quota within one process.
+
+    Holds up to burst tokens and refills at rate tokens per period seconds. acquire() waits for a token instead of
+    letting the provider reject the call, so concurrent callers are spread evenly over the quota.
+
+    Example Usage
+    =============
+    >>> finnhub_limiter = AsyncTokenBucket(rate=60, period=60)   # 60 calls / minute
+    >>> async with finnhub_limiter:
+            await session.get(url)
+    '''
+
+    def __init__(self, rate: float, period: float = 1.0, burst: float = None):
+        self.rate = rate
+        self.period = period
+        self.capacity = burst if burst is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = None
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.rate / self.period
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens +
+                           (now - self._updated_at) * self.tokens_per_second)
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1):
+        # Created lazily so the limiter can be constructed outside of a running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.tokens_per_second)
+                self._refill()
+            self._tokens -= tokens
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *args):
+        return False
@@ -0,0 +1,18 @@
+import pyarrow as pa
+import pandas as pd
+from typing import Dict
+
+
+def to_columnar(frame: pd.DataFrame, schema: pa.Schema) -> Dict[str, list]:
+    """ Frame to a {column: [values]} payload, checked against schema once per column rather than once per row.
+    Arrow converts each numpy column in one pass and raises if a column does not fit its declared type,
+    e.g. strings in a float column.
+
+    Example Usage
+    =============
+    >>> to_columnar(frame, OHLCV_ARROW_SCHEMA)
+    {"date": [1640995200, ...], "open": [177.83, ...], ..., "symbol": ["AAPL", ...]}
+    """
+    table = pa.Table.from_pandas(
+        frame[schema.names], schema=schema, preserve_index=False)
+    return table.to_pydict()
@@ -0,0 +1,115 @@
+import json
+import asyncio
+import pyarrow as pa
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional
+
+from app.utils.alerts.logger import logging
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": NDJSON_MEDIA_TYPE,
+    "arrow": ARROW_STREAM_MEDIA_TYPE,
+}
+
+
+def negotiate_stream_format(accept: Optional[str], requested: Optional[str] = None) -> Optional[str]:
+    """ Pick a streaming format from an explicit request parameter, falling back to the Accept header.
+    Returns None when the client did not ask for a stream.
+
+    Example Usage
+    =============
+    >>> negotiate_stream_format("application/vnd.apache.arrow.stream, */*")
+    'arrow'
+    """
+    if requested:
+        return requested
+    for stream_format, media_type in STREAM_MEDIA_TYPES.items():
+        if accept and media_type in accept:
+            return stream_format
+    return None
+
+
+def iter_ndjson(batches: Iterable[pa.RecordBatch]) -> Iterator[bytes]:
+    """ Encode record batches as newline delimited json, one chunk per batch
+    """
+    for batch in batches:
+        columns = batch.schema.names
+        rows = zip(*(batch.column(i).to_pylist()
+                     for i in range(batch.num_columns)))
+        yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows).encode("utf-8")
+
+
+class _ChunkSink:
+    ''' Minimal writable file object, lets the arrow stream writer hand over its output one batch at a time '''
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def iter_arrow_ipc(batches: Iterable[pa.RecordBatch], empty_schema: pa.Schema) -> Iterator[bytes]:
+    """ Encode record batches in the arrow IPC streaming format, readable with pyarrow.ipc.open_stream.
+    The stream takes the schema of the first batch, empty_schema is only used when there are no batches,
+    so an empty range is still a valid stream.
+    """
+    batches = iter(batches)
+    first_batch = next(batches, None)
+
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(
+        sink, first_batch.schema if first_batch is not None else empty_schema)
+    yield sink.drain()
+
+    if first_batch is not None:
+        writer.write_batch(first_batch)
+        yield sink.drain()
+
+    for batch in batches:
+        writer.write_batch(batch)
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+def log_stream_errors(chunks: Iterable[bytes], label: str) -> Iterator[bytes]:
+    """ Pass chunks through, logging errors raised once the response has started. The status line is already sent by
+    then, so the error can only abort the stream, and would otherwise leave no trace of which request failed.
+    """
+    try:
+        yield from chunks
+    except Exception as e:
+        logging.error(f"Streaming {label} failed after the response started, {e}")
+        raise
+
+
+async def iter_server_sent_events(
+        next_events: Callable[[], Awaitable[List[dict]]],
+        heartbeat_seconds: float = 15) -> AsyncIterator[bytes]:
+    """ Encode an endless stream of events as server sent events, the event name taken from each event's type.
+    A comment line is sent when nothing happened for heartbeat_seconds, so proxies keep the connection open.
+    """
+    while True:
+        try:
+            events = await asyncio.wait_for(next_events(), heartbeat_seconds)
+        except asyncio.TimeoutError:
+            yield b": keep-alive\n\n"
+            continue
+        yield "".join(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in events).encode("utf-8")
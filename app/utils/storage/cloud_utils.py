@@ -1,6 +1,8 @@
 import os
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime
 
 import gcsfs
@@ -91,6 +93,35 @@ class CloudUtility:
 
         return "gs://" + os.environ['GOOGLE_BUCKET_NAME'] + "/" + storage_url
 
+    def write_parquet_to_cloud_storage(
+            self,
+            dataframe: pd.DataFrame,
+            storage_url: str):
+        ''' Write a dataframe to google cloud storage as one zstd compressed parquet file
+
+        Outputs
+        =============
+        storage_url -> [str]                : Path the data is written to, for example - "gs://bucket-name/trading/backfill/.../2021-01-01_2021-12-31.parquet"
+        '''
+        url = "gs://" + self.bucket_name + "/" + storage_url
+        with self.fs.open(url, "wb") as f:
+            pq.write_table(pa.Table.from_pandas(dataframe, preserve_index=False), f, compression="zstd")
+        return url
+
+    def write_chunk_to_cloud_storage(
+            self,
+            dataframe: pd.DataFrame,
+            storage_url: str):
+        ''' Write a dataframe to google cloud storage as one tab separated csv file at exactly storage_url,
+        for callers uploading their own numbered chunks as they are produced
+
+        Outputs
+        =============
+        storage_url -> [str]                : Path the data is written to, for example - "gs://bucket-name/twitter/followers/2022-01-02/3/<job_id>/chunk_00000.csv"
+        '''
+        self.__write_files_to_gcs(dataframe, storage_url)
+        return "gs://" + self.bucket_name + "/" + storage_url
+
     def __write_files_to_gcs(self, df, write_path, sep="\t"):
         url = "gs://" + self.bucket_name + "/" + write_path
 
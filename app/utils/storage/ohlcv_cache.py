@@ -0,0 +1,263 @@
+import os
+import re
+import glob
+import json
+import time
+import tempfile
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from filelock import FileLock
+from typing import Iterator, List, NamedTuple, Tuple
+
+from app.utils.alerts.logger import logging
+from app.utils.cleaning.ohlcv_clean import OHLCV_COLUMNS, empty_ohlcv_frame, to_ohlcv_frame
+
+Interval = Tuple[int, int]  # Half open [start, end) in UTC epoch seconds
+
+
+class OHLCVCacheKey(NamedTuple):
+    ticker: str
+    resolution: str
+    instrument: str
+
+
+def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+    """ Union of half open intervals, returned sorted and non overlapping
+
+    Example Usage
+    =============
+    >>> merge_intervals([(5, 10), (0, 3), (3, 4), (8, 12)])
+    [(0, 4), (5, 12)]
+    """
+    merged = []
+    for start, end in sorted(interval for interval in intervals if interval[0] < interval[1]):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(interval: Interval, covered: List[Interval]) -> List[Interval]:
+    """ Parts of interval that are not covered, i.e. the gaps we still need to fetch
+
+    Example Usage
+    =============
+    >>> subtract_intervals((0, 10), [(2, 4), (6, 8)])
+    [(0, 2), (4, 6), (8, 10)]
+    """
+    gaps = []
+    cursor, end = interval
+    for covered_start, covered_end in merge_intervals(covered):
+        if covered_end <= cursor:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class OHLCVCache:
+    ''' On disk columnar cache of OHLCV bars, one Parquet file per (ticker, resolution, instrument).
+
+    A JSON sidecar records the time ranges the file holds, so callers only fetch the gaps from the provider.
+    Writes are serialised across processes with a file lock and replace the file atomically. Merges that only add new
+    dates, e.g. the live bars persisted every minute, are appended as small part files instead, and folded into the
+    main file once max_parts of them have piled up.
+    '''
+
+    def __init__(self, cache_dir: str = None, max_parts: int = 32):
+        self.cache_dir = cache_dir or os.getenv(
+            "OHLCV_CACHE_DIR", os.path.join(tempfile.gettempdir(), "visser", "ohlcv"))
+        self.max_parts = max_parts
+
+    ''' Paths '''
+
+    def _base_path(self, key: OHLCVCacheKey) -> str:
+        def safe(s): return re.sub(r"[^A-Za-z0-9_.-]", "_", str(s))
+        return os.path.join(self.cache_dir, safe(key.instrument.lower()), safe(key.ticker.upper()), safe(key.resolution.upper()))
+
+    def _data_path(self, key): return self._base_path(key) + ".parquet"
+    def _meta_path(self, key): return self._base_path(key) + ".json"
+    def _lock_path(self, key): return self._base_path(key) + ".lock"
+    def _parts_dir(self, key): return self._base_path(key) + ".parts"
+
+    def _part_paths(self, key: OHLCVCacheKey) -> List[str]:
+        return sorted(glob.glob(os.path.join(self._parts_dir(key), "*.parquet")))
+
+    ''' Metadata '''
+
+    def _read_meta(self, key: OHLCVCacheKey) -> dict:
+        try:
+            with open(self._meta_path(key)) as f:
+                meta = json.load(f)
+            meta["coverage"] = [tuple(interval)
+                                for interval in meta["coverage"]]
+            return meta
+        except (FileNotFoundError, ValueError, KeyError):
+            return {"coverage": [], "version": 0, "updated_at": None}
+
+    def coverage(self, key: OHLCVCacheKey) -> List[Interval]:
+        return self._read_meta(key)["coverage"]
+
+    def version(self, key: OHLCVCacheKey) -> int:
+        """ Monotonic counter bumped on every write, lets callers memoise results derived from a series
+        """
+        return self._read_meta(key)["version"]
+
+    def missing_ranges(self, key: OHLCVCacheKey, start: int, end: int) -> List[Interval]:
+        """ Return the sub ranges of [start, end) that are not held in the cache
+        """
+        return subtract_intervals((start, end), self.coverage(key))
+
+    ''' Read / Write '''
+
+    def read(self, key: OHLCVCacheKey, start: int = None, end: int = None) -> pd.DataFrame:
+        """ Return the cached bars with start <= date < end as a canonical OHLCV frame
+        """
+        filters = []
+        if start is not None:
+            filters.append(("date", ">=", start))
+        if end is not None:
+            filters.append(("date", "<", end))
+        frames = [self._read_file(path, filters) for path in [self._data_path(key)] + self._part_paths(key)]
+        frames = [frame for frame in frames if frame is not None and frame.shape[0] > 0]
+        if not frames:
+            return empty_ohlcv_frame()
+        # A part read while it was being compacted is also in the main file, keep one copy
+        frame = pd.concat(frames) if len(frames) > 1 else frames[0]
+        return frame[OHLCV_COLUMNS].drop_duplicates(subset="date", keep="last")\
+            .sort_values("date", kind="stable").reset_index(drop=True)
+
+    @staticmethod
+    def _read_file(path: str, filters: list = None) -> pd.DataFrame:
+        try:
+            return pd.read_parquet(path, engine="pyarrow", filters=filters or None)
+        except FileNotFoundError:
+            return None
+
+    def iter_batches(self, key: OHLCVCacheKey, start: int, end: int, batch_size: int = 65_536) -> Iterator[pa.RecordBatch]:
+        """ Stream the cached bars with start <= date < end as arrow record batches, in date order.
+        Only one batch of the main file is decoded at a time, so memory stays flat however large the range is. The
+        part files are few and small, their bars are slotted into the batches they fall in.
+        """
+        parts = self._read_parts(key, start, end)
+        schema = None
+        try:
+            dataset = ds.dataset(self._data_path(key), format="parquet")
+        except FileNotFoundError:
+            dataset = None
+
+        if dataset is not None:
+            date = ds.field("date")
+            for batch in dataset.to_batches(
+                    columns=OHLCV_COLUMNS, filter=(date >= start) & (date < end), batch_size=batch_size):
+                if batch.num_rows == 0:
+                    continue
+                schema = batch.schema
+                batch_end = batch.column("date")[-1].as_py()
+                slotted = parts[(parts.date <= batch_end) & ~parts.date.isin(batch.column("date").to_numpy())]
+                parts = parts[parts.date > batch_end]
+                if slotted.shape[0] == 0:
+                    yield batch
+                    continue
+                table = pa.concat_tables([
+                    pa.Table.from_batches([batch]),
+                    pa.Table.from_pandas(slotted, preserve_index=False).cast(schema)]).sort_by("date")
+                yield from table.to_batches()
+
+        if parts.shape[0] > 0:
+            table = pa.Table.from_pandas(parts, preserve_index=False)
+            yield from (table.cast(schema) if schema is not None else table).to_batches(max_chunksize=batch_size)
+
+    def _read_parts(self, key: OHLCVCacheKey, start: int, end: int) -> pd.DataFrame:
+        """ Bars held in part files, not yet compacted into the main file, with start <= date < end
+        """
+        frames = [self._read_file(path, [("date", ">=", start), ("date", "<", end)]) for path in self._part_paths(key)]
+        frames = [frame for frame in frames if frame is not None and frame.shape[0] > 0]
+        if not frames:
+            return empty_ohlcv_frame()
+        return pd.concat(frames)[OHLCV_COLUMNS].drop_duplicates(subset="date", keep="last")\
+            .sort_values("date", kind="stable").reset_index(drop=True)
+
+    def merge(self, key: OHLCVCacheKey, frame: pd.DataFrame, covered: Interval, replace: bool = True) -> int:
+        """ Merge freshly fetched bars into the cache and mark covered as held.
+
+        Parameters
+        =============
+        frame -> [pd.DataFrame]     : Bars fetched from the provider, any layout accepted by to_ohlcv_frame
+        covered -> [Interval]       : Range the fetch is authoritative for. Pass an empty interval to store bars without
+                                      claiming coverage, e.g. for a still forming bar.
+        replace -> [bool]           : Whether bars replace cached bars of the same date. False only fills in dates the
+                                      cache does not hold yet, so live bars never overwrite settled provider bars.
+                                      These new dates are appended as a part file rather than rewriting the series.
+
+        Outputs
+        =============
+        version -> [int]            : The series version after the write
+        """
+        os.makedirs(os.path.dirname(self._base_path(key)), exist_ok=True)
+        frame = to_ohlcv_frame(frame)
+
+        with FileLock(self._lock_path(key)):
+            meta = self._read_meta(key)
+
+            if not replace and frame.shape[0] > 0:
+                # Only the dates in the frame's span are read, not the whole series
+                held = self.read(key, int(frame.date.min()), int(frame.date.max()) + 1).date
+                frame = frame[~frame.date.isin(held)]
+                if frame.shape[0] > 0:
+                    self._append_part(key, frame, meta["version"] + 1)
+
+            if replace and frame.shape[0] > 0 or len(self._part_paths(key)) >= self.max_parts:
+                self._compact(key, frame if replace else None)
+
+
+            meta["coverage"] = merge_intervals(
+                meta["coverage"] + [tuple(covered)])
+            meta["version"] += 1
+            meta["updated_at"] = int(time.time())
+            self._atomic_write(self._meta_path(key),
+                               lambda path: self._write_json(path, meta))
+
+        logging.info(
+            f"OHLCV cache: merged {frame.shape[0]} bars into {key.instrument}/{key.ticker}/{key.resolution}, version {meta['version']}.")
+        return meta["version"]
+
+    def _append_part(self, key: OHLCVCacheKey, frame: pd.DataFrame, version: int):
+        os.makedirs(self._parts_dir(key), exist_ok=True)
+        frame = frame.sort_values("date", kind="stable").reset_index(drop=True)
+        self._atomic_write(os.path.join(self._parts_dir(key), f"{version:012d}.parquet"),
+                           lambda path: frame.to_parquet(path, engine="pyarrow", index=False))
+
+    def _compact(self, key: OHLCVCacheKey, frame: pd.DataFrame = None):
+        """ Rewrite the main file with the part files and frame folded in, frame taking precedence on equal dates.
+        Called with the lock held.
+        """
+        part_paths = self._part_paths(key)
+        existing = self.read(key)
+        merged = pd.concat([existing, frame]) if frame is not None and existing.shape[0] > 0 else \
+            (frame if frame is not None else existing)
+        merged = merged.drop_duplicates(subset="date", keep="last")\
+            .sort_values("date", kind="stable").reset_index(drop=True)
+        self._atomic_write(self._data_path(key),
+                           lambda path: merged.to_parquet(path, engine="pyarrow", index=False))
+        for path in part_paths:
+            os.remove(path)
+
+    @staticmethod
+    def _write_json(path: str, payload: dict):
+        with open(path, "w") as f:
+            json.dump(payload, f)
+
+    @staticmethod
+    def _atomic_write(path: str, write_fn):
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        write_fn(temp_path)
+        os.replace(temp_path, path)
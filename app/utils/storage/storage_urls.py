@@ -6,6 +6,17 @@ def trading_metadata_storage_url(
     return f"""{'/api/trading/historical'.strip('/api/')}/{job_params['instrument']}/{job_params['ticker']}/{job_params['resolution']}/{job_params['from_date']}/{job_params['to_date']}/"""
 
 
+def trading_batch_storage_url(
+        num_requests):
+    return f"""{'/api/trading/historical/batch'.strip('/api/')}/{datetime.today().strftime("%Y-%m-%d")}/{num_requests}/"""
+
+
+def trading_backfill_storage_url(
+        job_id, unit):
+    """ Hive style partitions, so the backfill can be read back as one parquet dataset filtered on any of the keys """
+    return f"""{'/api/trading/backfill'.strip('/api/')}/{job_id}/instrument={unit['instrument']}/resolution={unit['resolution']}/year={unit['from_date'][:4]}/ticker={unit['ticker']}/{unit['from_date']}_{unit['to_date']}.parquet"""
+
+
 def twitter_followers_storage_url(
     num_users): return f"""{'/api/twitter/followers'.strip('/api/')}/{datetime.today().strftime("%Y-%m-%d")}/{num_users}/"""
 
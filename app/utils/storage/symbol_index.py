@@ -0,0 +1,139 @@
+import re
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+
+SYMBOL_INDEX_COLUMNS = ["symbol", "description", "type", "source"]
+
+# Sorts after every character, so [query, query + _PREFIX_END) spans every key starting with query
+_PREFIX_END = "\U0010ffff"
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _words(text: str) -> List[str]:
+    return [word for word in re.split(r"[^0-9A-Z]+", text) if word]
+
+
+class SymbolIndex:
+    ''' Read only search index over a symbol universe, built once per refresh and swapped in whole.
+
+    Prefix lookups are two binary searches over sorted numpy arrays of symbols and description words.
+    Fuzzy lookups count shared trigrams with a single bincount over the query's posting lists.
+
+    Example Usage
+    =============
+    >>> index = SymbolIndex(pd.DataFrame({"symbol": ["AAPL"], "description": ["APPLE INC"], "type": ["Stock"], "source": ["finnhub"]}))
+    >>> index.search("appl")
+    [{"symbol": "AAPL", "description": "APPLE INC", "type": "Stock", "source": "finnhub", "match": "prefix"}]
+    '''
+
+    def __init__(self, symbols: pd.DataFrame = None):
+        if symbols is None:
+            symbols = pd.DataFrame(columns=SYMBOL_INDEX_COLUMNS)
+
+        records = symbols[SYMBOL_INDEX_COLUMNS].fillna("").astype(str)\
+            .drop_duplicates(subset=["symbol", "source"]).reset_index(drop=True)
+        self.records = records
+        self._columns = {column: records[column].to_numpy(dtype=object)
+                         for column in SYMBOL_INDEX_COLUMNS}
+
+        symbol_keys = records.symbol.str.upper().to_numpy(dtype=str)
+        self._symbol_lengths = np.char.str_len(symbol_keys)
+        order = np.argsort(symbol_keys, kind="stable")
+        self._symbol_keys, self._symbol_rows = symbol_keys[order], order
+
+        descriptions = records.description.str.upper().tolist()
+        word_rows = [(word, row) for row, description in enumerate(descriptions)
+                     for word in _words(description)]
+        word_keys = np.array([word for word, _ in word_rows], dtype=str)
+        rows = np.array([row for _, row in word_rows], dtype=np.int64)
+        order = np.argsort(word_keys, kind="stable")
+        self._word_keys, self._word_rows = word_keys[order], rows[order]
+
+        postings: Dict[str, List[int]] = {}
+        trigram_counts = np.zeros(len(records), dtype=np.int64)
+        for row, (symbol, description) in enumerate(zip(symbol_keys, descriptions)):
+            trigrams = _trigrams(symbol) | _trigrams(description)
+            trigram_counts[row] = len(trigrams)
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(row)
+        self._postings = {trigram: np.array(rows, dtype=np.int64)
+                          for trigram, rows in postings.items()}
+        self._trigram_counts = trigram_counts
+        self._trigram_weight = int(trigram_counts.max(initial=0)) + 1
+        self._common_posting_size = max(100, len(records) // 20)
+
+    def __len__(self) -> int:
+        return self.records.shape[0]
+
+    @staticmethod
+    def _prefix_range(keys: np.ndarray, query: str) -> slice:
+        lo = np.searchsorted(keys, query, side="left")
+        hi = np.searchsorted(keys, query + _PREFIX_END, side="left")
+        return slice(lo, hi)
+
+    def prefix(self, query: str, limit: int = 10) -> np.ndarray:
+        """ Rows whose symbol starts with query, shortest symbols first, then rows with a description word
+        starting with query
+        """
+        query = query.strip().upper()
+        if not query:
+            return np.array([], dtype=np.int64)
+
+        symbol_rows = self._symbol_rows[self._prefix_range(self._symbol_keys, query)]
+        lengths = self._symbol_lengths[symbol_rows]
+        if len(symbol_rows) > limit:
+            shortest = np.argpartition(lengths, limit - 1)[:limit]
+            symbol_rows, lengths = symbol_rows[shortest], lengths[shortest]
+        symbol_rows = symbol_rows[np.argsort(lengths, kind="stable")]
+
+        # A row can match on several words, over fetch a little before dropping repeats
+        word_rows = self._word_rows[self._prefix_range(self._word_keys, query)][:2 * limit]
+        rows = dict.fromkeys(symbol_rows.tolist() + word_rows.tolist())
+        return np.fromiter(rows, dtype=np.int64)[:limit]
+
+    def fuzzy(self, query: str, limit: int = 10) -> np.ndarray:
+        """ Rows sharing the most trigrams with query, ties broken towards shorter entries. Tolerates typos
+        and out of order words, e.g. "aple" or "tesla motors".
+        """
+        query = query.strip().upper()
+        postings = [self._postings[trigram]
+                    for trigram in _trigrams(query) if trigram in self._postings]
+        # Trigrams shared by a large part of the universe (INC, CORP, ...) say little, skip them when others are left
+        selective = [rows for rows in postings if len(rows) <= self._common_posting_size]
+        postings = selective or postings
+        if not postings:
+            return np.array([], dtype=np.int64)
+
+        shared = np.bincount(np.concatenate(postings), minlength=len(self))
+        candidates = np.flatnonzero(shared)
+        # Most shared trigrams first, then the fewest trigrams overall i.e. the shortest entry
+        score = self._trigram_counts[candidates] - shared[candidates] * self._trigram_weight
+
+        if len(candidates) > limit:
+            top = np.argpartition(score, limit - 1)[:limit]
+            candidates, score = candidates[top], score[top]
+        return candidates[np.argsort(score, kind="stable")]
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        """ Prefix matches first, topped up with fuzzy matches up to limit
+
+        Outputs
+        =============
+        results -> List[dict]   : symbol, description, type and source of each match, and whether it was a prefix or fuzzy match
+        """
+        prefix_rows = self.prefix(query, limit).tolist()
+        fuzzy_rows = []
+        if len(prefix_rows) < limit:
+            seen = set(prefix_rows)
+            fuzzy_rows = [row for row in self.fuzzy(query, limit).tolist()
+                          if row not in seen][:limit - len(prefix_rows)]
+
+        return [
+            {**{column: self._columns[column][row] for column in SYMBOL_INDEX_COLUMNS}, "match": match}
+            for rows, match in ((prefix_rows, "prefix"), (fuzzy_rows, "fuzzy"))
+            for row in rows]